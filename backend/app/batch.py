@@ -0,0 +1,165 @@
+"""Bulk replay of chat turns, streamed back as NDJSON."""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.metrics import TRANSPORT_ERRORS
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_TURNS = int(os.getenv("CONVERSIFY_BATCH_MAX_TURNS", 10000))
+# Sessions replayed at the same time; each occupies one threadpool thread
+BATCH_CONCURRENCY = int(os.getenv("CONVERSIFY_BATCH_CONCURRENCY", 4))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Batch session ids are echoed in every result line, so they are kept to plain characters
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_.:-]+$"
+
+
+class BatchTurn(BaseModel):
+    session: str = Field(..., min_length=1, max_length=128, pattern=SESSION_ID_PATTERN)
+    message: str
+
+
+class BatchConversation(BaseModel):
+    session: str = Field(..., min_length=1, max_length=128, pattern=SESSION_ID_PATTERN)
+    messages: List[str]
+
+
+class BatchRequest(BaseModel):
+    """Loose turns and whole conversations; both may be given at once.
+
+    Turns that name the same session are applied in the order they appear,
+    loose turns before the conversation with that session id, if any.
+    """
+    turns: List[BatchTurn] = []
+    conversations: List[BatchConversation] = []
+    # Sessions are released after the batch unless asked to keep them
+    keep_sessions: bool = False
+
+    def plan(self) -> Dict[str, List[Tuple[int, str]]]:
+        """Group the turns by session as (request position, message) pairs."""
+        sessions: Dict[str, List[Tuple[int, str]]] = {}
+        position = 0
+        for turn in self.turns:
+            sessions.setdefault(turn.session, []).append((position, turn.message))
+            position += 1
+        for conversation in self.conversations:
+            for message in conversation.messages:
+                sessions.setdefault(conversation.session, []).append((position, message))
+                position += 1
+        return sessions
+
+    def turn_count(self) -> int:
+        return len(self.turns) + sum(len(c.messages) for c in self.conversations)
+
+
+def _line(entry: dict) -> str:
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+class BatchRunner:
+    """Replays a BatchRequest against a ChatEngine.
+
+    Each session's turns run in order on one threadpool thread, so the
+    engine sees exactly the state transitions it would see live; up to
+    ``concurrency`` sessions run side by side. Results are streamed in
+    completion order, one JSON object per line, and every line carries
+    its position in the request so callers can reorder them. Batch turns
+    are not written to the conversation log.
+    """
+
+    def __init__(self, engine, concurrency: int = BATCH_CONCURRENCY, prefix: str = "batch_"):
+        self.engine = engine
+        self.concurrency = max(1, concurrency)
+        # Batch sessions never share state with WebSocket or HTTP sessions
+        self.prefix = prefix
+
+    def _replay(self, session: str, turns: List[Tuple[int, str]], emit, cancelled: threading.Event,
+                keep_session: bool) -> None:
+        session_id = f"{self.prefix}{session}"
+        try:
+            for number, (position, message) in enumerate(turns):
+                if cancelled.is_set():
+                    return
+                try:
+                    # Replays are not conversations anyone will come back to, so they stay out of the log
+                    response = self.engine.get_response(message, session_id, logged=False)
+                    state = self.engine.sessions.get(session_id)
+                    emit({
+                        "type": "result",
+                        "index": position,
+                        "session": session,
+                        "turn": number,
+                        "response": response,
+                        "state": state.state.value if state is not None else None,
+                        "topic": state.topic if state is not None else None,
+                    })
+                except Exception as e:
+                    logger.error(f"Error replaying batch turn {position}: {str(e)}")
+                    TRANSPORT_ERRORS.labels("batch").inc()
+                    emit({"type": "error", "index": position, "session": session, "turn": number,
+                          "content": "Could not generate a response for this turn."})
+        finally:
+            if not keep_session:
+                try:
+                    self.engine.release_session(session_id, logged=False)
+                except Exception as e:
+                    logger.error(f"Error releasing batch session {session_id}: {str(e)}")
+
+    async def stream(self, request: BatchRequest) -> AsyncIterator[str]:
+        """Yield NDJSON lines: one per turn, then a ``done`` summary."""
+        started = time.perf_counter()
+        sessions = request.plan()
+        loop = asyncio.get_running_loop()
+        # Result lines, and one None per session once its replay has finished
+        results: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+        cancelled = threading.Event()
+        limit = asyncio.Semaphore(self.concurrency)
+        counts = {"result": 0, "error": 0}
+
+        def emit(entry: Optional[dict]) -> None:
+            loop.call_soon_threadsafe(results.put_nowait, entry)
+
+        async def run(session: str, turns: List[Tuple[int, str]]) -> None:
+            try:
+                async with limit:
+                    await run_in_threadpool(self._replay, session, turns, emit, cancelled, request.keep_sessions)
+            except Exception as e:
+                logger.error(f"Batch replay of session {session!r} failed: {e!r}")
+                TRANSPORT_ERRORS.labels("batch").inc()
+            finally:
+                # Queued after the session's results, since emit goes through the same loop
+                emit(None)
+
+        tasks = [asyncio.ensure_future(run(session, turns)) for session, turns in sessions.items()]
+        running = len(tasks)
+        try:
+            while running:
+                entry = await results.get()
+                if entry is None:
+                    running -= 1
+                    continue
+                counts[entry["type"]] += 1
+                yield _line(entry)
+            yield _line({
+                "type": "done",
+                "sessions": len(sessions),
+                "turns": counts["result"],
+                "errors": counts["error"],
+                # Turns of a session whose replay failed outright get no line of their own
+                "skipped": request.turn_count() - counts["result"] - counts["error"],
+                "seconds": round(time.perf_counter() - started, 3),
+            })
+        finally:
+            # The client went away or the stream was closed: stop between turns
+            cancelled.set()
+            for task in tasks:
+                task.cancel()
@@ -1,10 +1,25 @@
 """Production-ready chatbot responses with enhanced context management."""
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Container, Dict, FrozenSet, List, Optional, Tuple
 import logging
 import json
-from datetime import datetime
+import os
+import threading
+import time
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from backend.app.classifier import CentroidClassifier, build_classifiers
+from backend.app.conversation_log import ConversationLog
+from backend.app.history import HistoryBuffer
+from backend.app.matcher import KeywordMatcher, MessageMatch
+from backend.app.metrics import ERRORS, MESSAGES, REGISTRY, STAGE_SECONDS, trace_stages
+from backend.app.profiling import SlowTurnLog
+from backend.app.response_cache import ResponseCache
+from backend.app.retrieval import STOPWORDS, KnowledgeSnapshot, KnowledgeStore, SearchHit
+from backend.app.session_backends import session_store_from_env
+from backend.app.session_store import SessionStore
+from backend.app.state_machine import StateMachine, load_flow
+from backend.app.topic_graph import TopicGraph, TopicNode, load_topic_graph
 
 logger = logging.getLogger(__name__)
 
@@ -15,250 +30,462 @@ class ConversationState(Enum):
     CLARIFICATION = "clarification"
     TRANSITION = "transition"
 
-@dataclass
-class Topic:
-    name: str
-    subtopics: List[str]
-    related_topics: List[str]
-    key_concepts: List[str]
+# Topics within this many hops of the previous one get a "connected" transition
+TRANSITION_HOPS = 2
 
 class KnowledgeGraph:
-    def __init__(self):
-        self.topics = {
-            "python": Topic(
-                name="Python",
-                subtopics=["web_frameworks", "data_science", "testing", "deployment"],
-                related_topics=["backend_development", "api_design", "databases"],
-                key_concepts=["OOP", "async programming", "package management"]
-            ),
-            "web_frameworks": Topic(
-                name="Web Frameworks",
-                subtopics=["django", "flask", "fastapi"],
-                related_topics=["api_design", "databases", "authentication"],
-                key_concepts=["MVC", "routing", "middleware", "ORM"]
-            ),
-            "data_science": Topic(
-                name="Data Science",
-                subtopics=["machine_learning", "data_analysis", "visualization"],
-                related_topics=["statistics", "big_data", "ai"],
-                key_concepts=["numpy", "pandas", "scikit-learn", "matplotlib"]
-            )
-        }
+    """Topic relations, backed by the compiled graph in ``data/topic_graph.json``."""
+
+    def __init__(self, graph: Optional[TopicGraph] = None):
+        self.graph = graph if graph is not None else TopicGraph(load_topic_graph())
+        self.topics: Dict[str, TopicNode] = self.graph.topics
 
     def get_related_topics(self, topic: str) -> List[str]:
         """Get related topics for smooth transitions."""
-        if topic in self.topics:
-            return self.topics[topic].related_topics
-        return []
+        return list(self.graph.related(topic))
 
     def get_subtopics(self, topic: str) -> List[str]:
         """Get subtopics for deeper discussion."""
-        if topic in self.topics:
-            return self.topics[topic].subtopics
-        return []
+        return list(self.graph.subtopics(topic))
+
+    def get_key_concepts(self, topic: str) -> List[str]:
+        node = self.topics.get(topic)
+        return list(node.key_concepts) if node is not None else []
+
+    def is_nearby(self, topic: str, other: str, max_hops: int = TRANSITION_HOPS) -> bool:
+        """Whether two topics are at most ``max_hops`` apart in the graph."""
+        hops = self.graph.distance(topic, other)
+        return hops is not None and hops <= max_hops
+
+    def get_suggestions(self, topic: str, allowed: Optional[Container[str]] = None) -> List[str]:
+        """Nearby topics worth suggesting, other than the topic's own subtopics, from ``allowed`` if given."""
+        return list(self.graph.suggestions(topic, allowed))
+
+def check_knowledge_base(knowledge_base: dict) -> List[str]:
+    """Everything the framework and data science answers need, as a list of problems."""
+    python = knowledge_base.get("python") if isinstance(knowledge_base, dict) else None
+    if not isinstance(python, dict):
+        return ["'python' must be an object"]
+    errors = []
+    frameworks = python.get("frameworks")
+    if not isinstance(frameworks, dict) or not frameworks:
+        errors.append("'python.frameworks' must be a non-empty object")
+    else:
+        for name, info in frameworks.items():
+            if not isinstance(info, dict) or not isinstance(info.get("description"), str):
+                errors.append(f"framework {name!r} needs a description")
+                continue
+            for field_name in ("use_cases", "features"):
+                if not isinstance(info.get(field_name), list):
+                    errors.append(f"framework {name!r} {field_name} must be a list")
+    data_science = python.get("data_science")
+    if not isinstance(data_science, dict):
+        errors.append("'python.data_science' must be an object")
+    else:
+        for field_name in ("libraries", "use_cases", "frameworks"):
+            if not isinstance(data_science.get(field_name), list):
+                errors.append(f"'python.data_science.{field_name}' must be a list")
+    return errors
+
+# Rough per-object costs of a session and of each history record, in bytes
+# (see benchmarks/history_memory.py)
+SESSION_OVERHEAD_BYTES = 600
+MESSAGE_OVERHEAD_BYTES = 90
+MAX_HISTORY = 20
+
+_DETECT_TOPIC_SECONDS = STAGE_SECONDS.labels("detect_topic")
+_RETRIEVAL_SECONDS = STAGE_SECONDS.labels("retrieval")
+_DISPATCH_SECONDS = STAGE_SECONDS.labels("dispatch")
 
-class ChatEngine:
-    def __init__(self):
-        self.knowledge_base = {
-            "python": {
-                "frameworks": {
-                    "django": {
-                        "description": "Full-featured web framework with built-in admin, ORM, and authentication",
-                        "use_cases": ["Large applications", "Content management systems", "Enterprise solutions"],
-                        "features": ["Admin interface", "ORM", "Authentication", "Forms", "Security"]
-                    },
-                    "flask": {
-                        "description": "Lightweight and flexible micro-framework",
-                        "use_cases": ["Small to medium applications", "APIs", "Microservices"],
-                        "features": ["Routing", "Template engine", "Development server", "Extensions"]
-                    },
-                    "fastapi": {
-                        "description": "Modern, fast framework for building APIs with Python 3.6+",
-                        "use_cases": ["High-performance APIs", "Real-time applications", "Microservices"],
-                        "features": ["Async support", "Auto API docs", "Type hints", "Data validation"]
-                    }
-                },
-                "web_development": {
-                    "backend": ["Django", "Flask", "FastAPI", "Pyramid"],
-                    "database": ["SQLAlchemy", "Django ORM", "Tortoise ORM"],
-                    "testing": ["pytest", "unittest", "Robot Framework"],
-                    "deployment": ["Docker", "Gunicorn", "uWSGI"]
-                },
-                "data_science": {
-                    "libraries": ["NumPy", "Pandas", "Matplotlib", "Scikit-learn"],
-                    "use_cases": ["Data analysis", "Machine learning", "Visualization"],
-                    "frameworks": ["TensorFlow", "PyTorch", "Keras"]
-                }
+@dataclass
+class ChatSession:
+    """Conversation state the engine keeps for a single session."""
+    state: ConversationState = ConversationState.GREETING
+    topic: Optional[str] = None
+    history: HistoryBuffer = field(default_factory=lambda: HistoryBuffer(MAX_HISTORY))
+    # Serialises turns so concurrent requests for one session never interleave
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def to_record(self) -> dict:
+        """JSON-compatible copy of the session for a shared session backend."""
+        with self.lock:
+            return {
+                "state": self.state.value,
+                "topic": self.topic,
+                "history": [[record.timestamp, record.content, record.is_bot] for record in self.history],
             }
-        }
-        self.conversation_history = {}
+
+    @classmethod
+    def from_turns(cls, turns: List[dict]) -> "ChatSession":
+        """Rebuild a session from turns replayed from the conversation log."""
+        last = turns[-1]
+        session = cls(state=ConversationState(last["state"]), topic=last.get("topic"))
+        for turn in turns:
+            session.history.append(turn["message"], False, turn["time"])
+            session.history.append(turn["response"], True, turn["time"])
+        return session
+
+    @classmethod
+    def from_record(cls, session_id: str, record: dict) -> "ChatSession":
+        session = cls(state=ConversationState(record["state"]), topic=record.get("topic"))
+        for timestamp, content, is_bot in record.get("history", ()):
+            session.history.append(content, is_bot, timestamp)
+        return session
+
+    def approximate_size(self) -> int:
+        """Rough byte count used to enforce the session store memory cap."""
+        return (
+            SESSION_OVERHEAD_BYTES
+            + MESSAGE_OVERHEAD_BYTES * len(self.history)
+            + self.history.content_length()
+        )
+
+@dataclass
+class Turn:
+    """What a response handler needs to know about the turn being answered."""
+    match: MessageMatch
+    topic: Optional[str]
+    previous_topic: Optional[str]
+    knowledge: Optional[SearchHit] = None
+
+# The NumPy classifier is opt-in; below these cosine scores the keyword rules decide
+CLASSIFIER_ENABLED = os.getenv("CONVERSIFY_CLASSIFIER", "0") == "1"
+CLASSIFIER_THRESHOLDS = {"topic": 0.1, "intent": 0.15}
+
+# Minimum BM25 score for a retrieved entry to answer a free-text question
+KNOWLEDGE_MIN_SCORE = float(os.getenv("CONVERSIFY_KNOWLEDGE_MIN_SCORE", 4.0))
+
+TOPIC_INTRODUCTIONS = {
+    "python": "Python is a versatile language used in web development, data science, and more. What aspect interests you most?",
+    "web_frameworks": "Python offers several powerful web frameworks like Django, Flask, and FastAPI. Would you like to compare them or learn about a specific one?",
+    "data_science": "Python is excellent for data science with libraries like NumPy, Pandas, and Scikit-learn. What kind of data analysis are you interested in?",
+}
+
+FRAMEWORK_EXAMPLES = {
+    "django": (
+        "Django is a high-level framework that follows the MVT pattern. "
+        "Here's a quick example of a Django view:\n\n"
+        "```python\n"
+        "from django.shortcuts import render\n"
+        "def home(request):\n"
+        "    return render(request, 'home.html', {'message': 'Welcome'})\n"
+        "```\n\n"
+        "Would you like to know more about models, views, or templates?"
+    ),
+}
+
+class ChatEngine:
+    def __init__(
+        self,
+        sessions: Optional[SessionStore] = None,
+        flow: Optional[dict] = None,
+        knowledge: Optional[KnowledgeStore] = None,
+        classifiers: Optional[Dict[str, CentroidClassifier]] = None,
+        journal: Optional[ConversationLog] = None,
+        slow_turns: Optional[SlowTurnLog] = None,
+    ):
+        # Structured knowledge and free-text entries are loaded from data files
+        self.knowledge = knowledge if knowledge is not None else KnowledgeStore()
+        self.knowledge.prepare = self._prepare_knowledge
+        self.knowledge_min_score = KNOWLEDGE_MIN_SCORE
+        self.matcher = KeywordMatcher()
+        self.classifiers = classifiers if classifiers is not None else (
+            build_classifiers() if CLASSIFIER_ENABLED else None
+        )
         self.knowledge_graph = KnowledgeGraph()
-        self.session_states = {}
-        self.current_topics = {}
+        self._detectable: FrozenSet[str] = frozenset(self.detectable_topics())
+        # Conversational words ("explain", "hello", "compare") steer the flow, not retrieval
+        self._retrieval_skip = STOPWORDS | self.matcher.vocabulary(["greeting", "deep_dive", "compare"])
+        # Names the conversation flow table uses to refer to response builders
+        self.response_handlers = {
+            "topic_transition": lambda turn: self._handle_topic_transition(turn.topic, turn.previous_topic),
+            "greeting": lambda turn: self._greeting_response(),
+            "topic_prompt": lambda turn: self._topic_prompt(),
+            "default": lambda turn: self._default_response(),
+            "topic_introduction": lambda turn: self._generate_topic_introduction(turn.topic),
+            "compare_frameworks": lambda turn: self._compare_frameworks(),
+            "framework_info": lambda turn: self._framework_info(turn.match.first("framework")),
+            "framework_example": lambda turn: self._framework_example(turn.match.first("framework"), turn.topic),
+            "data_science_info": lambda turn: self._data_science_info(),
+            "explore_subtopics": lambda turn: self._explore_subtopics(turn.topic),
+            "knowledge_answer": lambda turn: self._knowledge_answer(turn.knowledge),
+        }
+        self.flow = StateMachine(
+            flow if flow is not None else load_flow(),
+            ConversationState,
+            self.response_handlers,
+            self.known_topics(),
+        )
+        self.responses = self._build_response_cache()
+        self._prepare_knowledge(self.knowledge.snapshot)()
+        self.sessions = sessions if sessions is not None else session_store_from_env(
+            self._new_session,
+            ChatSession.to_record,
+            ChatSession.from_record,
+        )
+        # Turns are journaled so sessions survive restarts and reloads
+        self.journal = journal if journal is not None else ConversationLog.from_env(self.sessions.ttl_seconds)
+        # Off unless CONVERSIFY_SLOW_TURN_MS is set; then slow turns keep a per-stage breakdown
+        self.slow_turns = slow_turns if slow_turns is not None else SlowTurnLog.from_env()
+
+    def get_response(self, message: str, session_id: str, logged: bool = True,
+                     abandoned: Optional[threading.Event] = None) -> str:
+        """Generate a response based on the message and conversation history.
+
+        Turns are written to the conversation log unless ``logged`` is false.
+        If ``abandoned`` is set by the time the response is ready, the caller
+        has given up on the turn (for example it timed out), and the session
+        is left as it was.
+        """
+        slow_turns = self.slow_turns
+        if not slow_turns.enabled:
+            return self._get_response(message, session_id, logged, abandoned)
+        started = time.perf_counter()
+        with trace_stages() as stages:
+            response = self._get_response(message, session_id, logged, abandoned)
+        elapsed = time.perf_counter() - started
+        if elapsed >= slow_turns.threshold:
+            session = self.sessions.get(session_id)
+            slow_turns.record(
+                session_id, elapsed, stages,
+                state=session.state.value if session is not None else None,
+                topic=session.topic if session is not None else None,
+                message=message,
+            )
+        return response
 
-    def get_response(self, message: str, session_id: str) -> str:
-        """Generate a response based on the message and conversation history."""
+    def _get_response(self, message: str, session_id: str, logged: bool = True,
+                      abandoned: Optional[threading.Event] = None) -> str:
+        session = None
         try:
-            # Initialize or get session data
-            if session_id not in self.conversation_history:
-                self.conversation_history[session_id] = []
-                self.session_states[session_id] = ConversationState.GREETING
-                self.current_topics[session_id] = None
-
-            # Add message to history
-            self.conversation_history[session_id].append({
-                "timestamp": datetime.now().isoformat(),
-                "content": message,
-                "is_bot": False
-            })
-
-            # Analyze context and generate response
-            response, new_state = self._analyze_and_respond(message, session_id)
-            
-            # Update conversation state
-            self.session_states[session_id] = new_state
-
-            # Add response to history
-            self.conversation_history[session_id].append({
-                "timestamp": datetime.now().isoformat(),
-                "content": response,
-                "is_bot": True
-            })
-
-            # Keep history manageable
-            if len(self.conversation_history[session_id]) > 20:
-                self.conversation_history[session_id] = self.conversation_history[session_id][-20:]
+            session = self.sessions.get_or_create(session_id)
+            with session.lock:
+                received = time.time()
+                previous_topic = session.topic
+
+                # Analyze context and generate response
+                response, new_state = self._analyze_and_respond(message, session)
+
+                if abandoned is not None and abandoned.is_set():
+                    # Nobody will see this answer, so the session must not move on either
+                    session.topic = previous_topic
+                    logger.debug(f"Discarded the abandoned turn of session {session_id}")
+                    return response
+
+                # Update conversation state
+                session.state = new_state
+
+                # Add message to history
+                session.history.append(message, timestamp=received)
+
+                # Add response to history; the ring buffer drops the oldest entries
+                session.history.append(response, is_bot=True)
+                size = session.approximate_size()
+                if self.journal is not None and logged:
+                    self.journal.append(session_id, {
+                        "time": session.history.last().timestamp,
+                        "state": new_state.value,
+                        "topic": session.topic,
+                        "message": message,
+                        "response": response,
+                    })
+            self.sessions.resize(session_id, size)
+            MESSAGES.labels(new_state.value, session.topic or "none").inc()
 
             return response
 
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
+            if session is None:
+                ERRORS.labels("unknown", "none").inc()
+            else:
+                ERRORS.labels(session.state.value, session.topic or "none").inc()
             return "I apologize, but I encountered an issue. Could you rephrase that?"
 
-    def _analyze_and_respond(self, message: str, session_id: str) -> Tuple[str, ConversationState]:
+    def get_history(self, session_id: str) -> List[dict]:
+        """Export a session's recent messages, oldest first."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            if self.journal is None or session_id not in self.journal:
+                return []
+            session = self.sessions.get_or_create(session_id)
+        with session.lock:
+            return session.history.export()
+
+    def release_session(self, session_id: str, logged: bool = True) -> bool:
+        """Forget a session right away instead of waiting for it to expire."""
+        if self.journal is not None and logged:
+            self.journal.end(session_id)
+        return self.sessions.release(session_id)
+
+    def _new_session(self, session_id: str) -> ChatSession:
+        """Start a session, resuming it from the conversation log if it was logged."""
+        if self.journal is not None:
+            turns = self.journal.restore(session_id)
+            if turns:
+                return ChatSession.from_turns(turns)
+        return ChatSession(state=self.flow.initial_state)
+
+    def _analyze_and_respond(self, message: str, session: ChatSession) -> Tuple[str, ConversationState]:
         """Analyze message context and generate appropriate response."""
-        message = message.lower()
-        current_state = self.session_states[session_id]
-        current_topic = self.current_topics[session_id]
-        history = self.conversation_history[session_id]
+        with _DETECT_TOPIC_SECONDS.time():
+            match = self.matcher.match(message)
+            new_topic = match.topic
+            signals: Dict[str, bool] = {}
+            if self.classifiers is not None:
+                new_topic = self._classify(match, signals) or new_topic
+        turn = Turn(match=match, topic=session.topic, previous_topic=session.topic)
 
         # Check for topic changes or continuity
-        new_topic = self._detect_topic(message)
-        if new_topic and new_topic != current_topic:
-            self.current_topics[session_id] = new_topic
-            return self._handle_topic_transition(new_topic, current_topic, session_id)
-
-        # Generate response based on current state and context
-        if current_state == ConversationState.GREETING:
-            if any(word in message for word in ["hi", "hello", "hey", "greetings"]):
-                return self._greeting_response(), ConversationState.TOPIC_DISCUSSION
-            return self._topic_prompt(), ConversationState.TOPIC_DISCUSSION
-
-        elif current_state == ConversationState.TOPIC_DISCUSSION:
-            return self._handle_topic_discussion(message, session_id)
-
-        elif current_state == ConversationState.DEEP_DIVE:
-            return self._handle_deep_dive(message, session_id)
-
-        return self._default_response(), ConversationState.TOPIC_DISCUSSION
+        topic_changed = bool(new_topic) and new_topic != session.topic
+        if topic_changed:
+            session.topic = turn.topic = new_topic
+
+        with _RETRIEVAL_SECONDS.time():
+            terms = [token for token in match.tokens if token not in self._retrieval_skip]
+            # The index of the knowledge the live responses were rendered from
+            hits = self.responses.source.index.search_terms(terms, limit=1) if terms else []
+            if hits and hits[0].score >= self.knowledge_min_score:
+                turn.knowledge = hits[0]
+
+        with _DISPATCH_SECONDS.time():
+            signals["topic_change"] = topic_changed
+            signals["knowledge"] = turn.knowledge is not None
+            intents = [
+                intent for intent in self.flow.intents
+                if signals.get(intent, False) or match.has(intent)
+            ]
+            route = self.flow.resolve(session.state, intents, turn.topic)
+            return route.handler(turn), route.next_state
+
+    def _classify(self, match: MessageMatch, signals: Dict[str, bool]) -> Optional[str]:
+        """Apply confident classifier predictions; the keyword rules cover the rest.
+
+        Returns the predicted topic and marks predicted intents in ``signals``.
+        """
+        topic = None
+        for category, classifier in self.classifiers.items():
+            prediction = classifier.classify(match.tokens)
+            if prediction.confidence < CLASSIFIER_THRESHOLDS.get(category, 1.0):
+                continue
+            if category == "topic":
+                topic = prediction.label
+            else:
+                signals[prediction.label] = True
+        return topic
+
+    def detectable_topics(self) -> List[str]:
+        """Topics the matcher or the topic classifier can recognise in a message."""
+        topics = set(self.matcher.labels("topic"))
+        if self.classifiers and "topic" in self.classifiers:
+            topics.update(self.classifiers["topic"].labels)
+        return sorted(topics)
+
+    def known_topics(self) -> List[str]:
+        """Every topic the matcher can detect or the knowledge graph mentions."""
+        topics = set(self.matcher.labels("topic"))
+        for topic_name, topic in self.knowledge_graph.topics.items():
+            topics.add(topic_name)
+            topics.update(topic.subtopics)
+            topics.update(topic.related_topics)
+        return sorted(topics)
 
     def _detect_topic(self, message: str) -> Optional[str]:
         """Detect the main topic from the message."""
-        topics = {
-            "python": ["python", "py", "pip"],
-            "web_frameworks": ["framework", "django", "flask", "fastapi", "web"],
-            "data_science": ["data", "analysis", "machine learning", "visualization"]
-        }
-        
-        for topic, keywords in topics.items():
-            if any(keyword in message.lower() for keyword in keywords):
-                return topic
-        return None
+        return self.matcher.match(message).topic
+
+    @property
+    def knowledge_base(self) -> dict:
+        """The structured knowledge the live responses were rendered from."""
+        return self.responses.source.knowledge_base
+
+    def _prepare_knowledge(self, snapshot: KnowledgeSnapshot) -> Callable[[], int]:
+        """Check new knowledge and render its responses; call the result to make it live.
+
+        Raises ValueError for a knowledge base the responses cannot be
+        rendered from, leaving the live knowledge untouched.
+        """
+        errors = check_knowledge_base(snapshot.knowledge_base)
+        if errors:
+            raise ValueError("Invalid knowledge base:\n" + "\n".join(f"- {error}" for error in errors))
+        return self.responses.prepare(snapshot)
+
+    def _build_response_cache(self) -> ResponseCache:
+        """Register the responses that only depend on static knowledge."""
+        cache = ResponseCache()
+
+        def topics(knowledge: KnowledgeSnapshot):
+            return [(topic,) for topic in self.known_topics()]
+
+        cache.register(
+            "framework_info", self._render_framework_info,
+            lambda knowledge: [(framework,) for framework in knowledge.knowledge_base["python"]["frameworks"]]
+        )
+        cache.register("data_science_info", self._render_data_science_info, lambda knowledge: [()])
+        cache.register(
+            "topic_introduction", lambda knowledge, topic: self._render_topic_introduction(topic), topics
+        )
+        cache.register("explore_subtopics", self._render_explore_subtopics, topics)
+        # Transitions are keyed by topic pairs, so they are rendered on first use
+        cache.register(
+            "topic_transition", lambda knowledge, new, old: self._render_topic_transition(new, old)
+        )
+        return cache
 
-    def _handle_topic_transition(self, new_topic: str, old_topic: Optional[str], session_id: str) -> Tuple[str, ConversationState]:
+    def _handle_topic_transition(self, new_topic: str, old_topic: Optional[str]) -> str:
         """Handle smooth transition between topics."""
+        return self.responses.get("topic_transition", new_topic, old_topic)
+
+    def _render_topic_transition(self, new_topic: str, old_topic: Optional[str]) -> str:
         if not old_topic:
-            return self._generate_topic_introduction(new_topic), ConversationState.TOPIC_DISCUSSION
+            return self._generate_topic_introduction(new_topic)
 
-        related_topics = self.knowledge_graph.get_related_topics(old_topic)
-        if new_topic in related_topics:
+        if self.knowledge_graph.is_nearby(old_topic, new_topic):
             return (
                 f"While we're discussing {old_topic}, it's interesting to explore its connection with {new_topic}. "
-                f"{self._generate_topic_introduction(new_topic)}",
-                ConversationState.TOPIC_DISCUSSION
+                f"{self._generate_topic_introduction(new_topic)}"
             )
         
         return (
             f"Let's switch gears and talk about {new_topic}. "
-            f"{self._generate_topic_introduction(new_topic)}",
-            ConversationState.TOPIC_DISCUSSION
+            f"{self._generate_topic_introduction(new_topic)}"
         )
 
     def _generate_topic_introduction(self, topic: str) -> str:
         """Generate an introduction for a topic."""
-        if topic == "python":
-            return "Python is a versatile language used in web development, data science, and more. What aspect interests you most?"
-        elif topic == "web_frameworks":
-            return "Python offers several powerful web frameworks like Django, Flask, and FastAPI. Would you like to compare them or learn about a specific one?"
-        elif topic == "data_science":
-            return "Python is excellent for data science with libraries like NumPy, Pandas, and Scikit-learn. What kind of data analysis are you interested in?"
-        return self._default_response()
-
-    def _handle_topic_discussion(self, message: str, session_id: str) -> Tuple[str, ConversationState]:
-        """Handle ongoing topic discussion with context awareness."""
-        current_topic = self.current_topics[session_id]
-        
-        if not current_topic:
-            return self._default_response(), ConversationState.TOPIC_DISCUSSION
-
-        # Check for deep-dive indicators
-        if any(word in message.lower() for word in ["how", "explain", "details", "example"]):
-            return self._handle_deep_dive(message, session_id)
-
-        # Generate contextual response based on topic
-        if current_topic == "web_frameworks":
-            if "compare" in message or "difference" in message:
-                return self._compare_frameworks(), ConversationState.DEEP_DIVE
-            elif any(fw in message for fw in ["django", "flask", "fastapi"]):
-                framework = next(fw for fw in ["django", "flask", "fastapi"] if fw in message)
-                return self._framework_info(framework), ConversationState.DEEP_DIVE
-
-        elif current_topic == "data_science":
-            return self._data_science_info(), ConversationState.DEEP_DIVE
-
-        return self._generate_topic_introduction(current_topic), ConversationState.TOPIC_DISCUSSION
-
-    def _handle_deep_dive(self, message: str, session_id: str) -> Tuple[str, ConversationState]:
-        """Handle detailed technical discussions."""
-        current_topic = self.current_topics[session_id]
-        
-        if not current_topic:
-            return self._default_response(), ConversationState.TOPIC_DISCUSSION
-
-        subtopics = self.knowledge_graph.get_subtopics(current_topic)
-        
-        # Generate detailed response with examples and explanations
-        if current_topic == "web_frameworks":
-            if "django" in message.lower():
-                return (
-                    "Django is a high-level framework that follows the MVT pattern. "
-                    "Here's a quick example of a Django view:\n\n"
-                    "```python\n"
-                    "from django.shortcuts import render\n"
-                    "def home(request):\n"
-                    "    return render(request, 'home.html', {'message': 'Welcome'})\n"
-                    "```\n\n"
-                    "Would you like to know more about models, views, or templates?",
-                    ConversationState.DEEP_DIVE
-                )
-
+        return self.responses.get("topic_introduction", topic)
+
+    def _render_topic_introduction(self, topic: str) -> str:
+        introduction = TOPIC_INTRODUCTIONS.get(topic)
+        return introduction if introduction is not None else self._default_response()
+
+    def _framework_example(self, framework: Optional[str], topic: str) -> str:
+        """Show a code example for a framework, or the topic overview if none exists."""
+        example = FRAMEWORK_EXAMPLES.get(framework)
+        return example if example is not None else self._explore_subtopics(topic)
+
+    def _explore_subtopics(self, topic: str) -> str:
+        """Offer the subtopics of ``topic`` for a detailed discussion."""
+        return self.responses.get("explore_subtopics", topic)
+
+    def _render_explore_subtopics(self, knowledge: KnowledgeSnapshot, topic: str) -> str:
+        # Leaf topics have no subtopics, so their key concepts are offered instead
+        subtopics = self.knowledge_graph.get_subtopics(topic) or self.knowledge_graph.get_key_concepts(topic)
+        # Only topics a user can steer to, or ask a knowledge entry about, are worth suggesting
+        suggestions = self.knowledge_graph.get_suggestions(topic, self._detectable | knowledge.index.topics)
+        also = f" You might also like: {', '.join(suggestions)}." if suggestions else ""
         return (
-            f"Let's explore {current_topic} in detail. "
+            f"Let's explore {topic} in detail. "
             f"We can discuss: {', '.join(subtopics)}. "
-            "What interests you most?",
-            ConversationState.DEEP_DIVE
+            f"What interests you most?{also}"
         )
 
+    def _knowledge_answer(self, hit: SearchHit) -> str:
+        """Answer a free-text question with the best matching knowledge entry."""
+        entry = hit.entry
+        follow_up = f" Would you like to explore more about {entry.topic}?" if entry.topic else ""
+        return f"{entry.title}: {entry.text}{follow_up}"
+
     def _greeting_response(self) -> str:
         """Return a contextual greeting message."""
         return (
@@ -301,7 +528,10 @@ class ChatEngine:
 Would you like to explore any specific framework in detail?"""
 
     def _framework_info(self, framework: str) -> str:
-        info = self.knowledge_base["python"]["frameworks"][framework]
+        return self.responses.get("framework_info", framework)
+
+    def _render_framework_info(self, knowledge: KnowledgeSnapshot, framework: str) -> str:
+        info = knowledge.knowledge_base["python"]["frameworks"][framework]
         return f"""{framework.title()}: {info['description']}
 
 Best use cases:
@@ -313,7 +543,10 @@ Key features:
 Would you like to see some code examples or learn about specific features?"""
 
     def _data_science_info(self) -> str:
-        data_info = self.knowledge_base["python"]["data_science"]
+        return self.responses.get("data_science_info")
+
+    def _render_data_science_info(self, knowledge: KnowledgeSnapshot) -> str:
+        data_info = knowledge.knowledge_base["python"]["data_science"]
         return f"""Python's data science ecosystem includes powerful libraries:
 
 Core Libraries:
@@ -338,10 +571,43 @@ What aspect would you like to explore?"""
 
 # Initialize global chat engine
 chat_engine = ChatEngine()
-
-def get_contextual_response(message: str, history: List[dict],
-                          current_topic: Optional[str] = None) -> str:
+REGISTRY.gauge(
+    "conversify_live_sessions", "Sessions currently held by the chat engine.",
+    function=lambda: len(chat_engine.sessions),
+)
+REGISTRY.gauge(
+    "conversify_session_store_bytes", "Approximate memory held by chat engine sessions.",
+    function=lambda: chat_engine.sessions.stats()["approx_bytes"],
+)
+REGISTRY.collector(
+    "conversify_session_store_events_total", "Sessions created, released and evicted, by event.", "event",
+    lambda: {event: count for event, count in chat_engine.sessions.stats().items()
+             if event not in ("sessions", "approx_bytes")},
+    kind="counter",
+)
+REGISTRY.collector(
+    "conversify_response_cache_entries", "Pre-rendered and lazily rendered responses held.", "kind",
+    lambda: {"static": chat_engine.responses.stats()["entries"], "lazy": chat_engine.responses.stats()["lazy_entries"]},
+)
+REGISTRY.collector(
+    "conversify_response_cache_events_total", "Response cache hits, misses and rebuilds, by event.", "event",
+    lambda: {event: chat_engine.responses.stats()[event] for event in ("hits", "misses", "rebuilds")},
+    kind="counter",
+)
+
+def get_contextual_response(message: str, history: Optional[List[dict]] = None,
+                          current_topic: Optional[str] = None,
+                          session_id: Optional[str] = None,
+                          abandoned: Optional[threading.Event] = None) -> str:
     """Generate a contextually appropriate response."""
-    # Use session ID based on history to maintain context
-    session_id = str(hash(str(history[:2]))) if history else "default"
-    return chat_engine.get_response(message, session_id)
+    # Callers pass their connection or HTTP session id so context survives
+    # history trimming; anonymous calls share the "default" session.
+    return chat_engine.get_response(message, session_id or "default", abandoned=abandoned)
+
+def get_history(session_id: str) -> List[dict]:
+    """Export the conversation history the engine holds for a session."""
+    return chat_engine.get_history(session_id)
+
+def end_session(session_id: str) -> bool:
+    """Release the engine state held for a session."""
+    return chat_engine.release_session(session_id)
@@ -0,0 +1,120 @@
+"""Optional NumPy centroid classifier for topics and conversational intents.
+
+Messages are hashed into TF-IDF weighted bag-of-words vectors and compared
+with one precomputed centroid per label, so a single matrix product scores
+every label at once. NumPy is optional: without it ``build_classifiers``
+returns ``None`` and the keyword rules are used on their own.
+"""
+from typing import Dict, FrozenSet, List, Mapping, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import math
+import zlib
+
+from backend.app.matcher import tokenize
+from backend.app.retrieval import STOPWORDS
+
+try:
+    import numpy as np
+except ImportError:  # the classifier is an optional accelerator
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXAMPLES_PATH = Path(__file__).parent / "data" / "intent_examples.json"
+DEFAULT_DIMENSIONS = 1 << 14
+
+
+@dataclass(frozen=True)
+class Prediction:
+    label: Optional[str]
+    confidence: float
+
+
+def hashed_features(tokens: Sequence[str], dimensions: int) -> Dict[int, float]:
+    """Term counts for unigrams and bigrams, hashed into ``dimensions`` buckets."""
+    features: Dict[int, float] = {}
+    grams = list(tokens) + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode()) % dimensions
+        features[bucket] = features.get(bucket, 0.0) + 1.0
+    return features
+
+
+class CentroidClassifier:
+    """Nearest-centroid classifier over hashed TF-IDF vectors.
+
+    Confidence is the cosine similarity between the message and the best
+    centroid; callers compare it with a threshold and fall back to rules
+    when the classifier is unsure.
+    """
+
+    def __init__(
+        self,
+        examples: Mapping[str, Sequence[str]],
+        dimensions: int = DEFAULT_DIMENSIONS,
+        stopwords: FrozenSet[str] = frozenset(),
+    ):
+        if np is None:
+            raise RuntimeError("NumPy is required for CentroidClassifier")
+        self.labels: Tuple[str, ...] = tuple(examples)
+        self.dimensions = dimensions
+        self.stopwords = stopwords
+
+        documents = [(label, tokenize(text)) for label in self.labels for text in examples[label]]
+        frequencies = np.zeros(dimensions, dtype=np.float32)
+        for _, tokens in documents:
+            tokens = [token for token in tokens if token not in stopwords]
+            for bucket in hashed_features(tokens, dimensions):
+                frequencies[bucket] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + frequencies)).astype(np.float32) + 1
+
+        centroids = np.zeros((len(self.labels), dimensions), dtype=np.float32)
+        positions = {label: row for row, label in enumerate(self.labels)}
+        for label, tokens in documents:
+            centroids[positions[label]] += self._vectorize(tokens)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+
+    def _vectorize(self, tokens: Sequence[str]):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if self.stopwords:
+            tokens = [token for token in tokens if token not in self.stopwords]
+        for bucket, count in hashed_features(tokens, self.dimensions).items():
+            vector[bucket] = (1 + math.log(count)) * self.idf[bucket]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, tokens: Sequence[str]):
+        """Cosine similarity of one tokenized message with every centroid."""
+        return self.centroids @ self._vectorize(tokens)
+
+    def classify(self, tokens: Sequence[str]) -> Prediction:
+        scores = self.scores(tokens)
+        best = int(np.argmax(scores))
+        return Prediction(self.labels[best], float(scores[best]))
+
+    def classify_batch(self, messages: Sequence[str]) -> List[Prediction]:
+        """Classify many raw messages with one matrix product."""
+        if not messages:
+            return []
+        matrix = np.stack([self._vectorize(tokenize(message)) for message in messages])
+        scores = matrix @ self.centroids.T
+        best = scores.argmax(axis=1)
+        return [Prediction(self.labels[label], float(scores[row, label])) for row, label in enumerate(best)]
+
+
+def build_classifiers(path: Path = DEFAULT_EXAMPLES_PATH) -> Optional[Dict[str, CentroidClassifier]]:
+    """One classifier per example category, or ``None`` when NumPy is missing."""
+    if np is None:
+        logger.warning("NumPy is not installed; using keyword rules only")
+        return None
+    with open(path, encoding="utf-8") as handle:
+        examples = json.load(handle)
+    # Function words carry the conversational intents, so only topics drop them
+    return {
+        category: CentroidClassifier(labels, stopwords=STOPWORDS if category == "topic" else frozenset())
+        for category, labels in examples.items()
+    }
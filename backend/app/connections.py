@@ -0,0 +1,413 @@
+"""WebSocket connection bookkeeping: admission caps, rate limits, resumption and idle reaping."""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import functools
+import logging
+import os
+import time
+import uuid
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from backend.app.metrics import REGISTRY, STAGE_SECONDS
+from backend.app.protocol import DEFAULT_CODEC, Codec, Frame
+from backend.app.resume import REPLAYED_MESSAGES, RESUMES, ResumableSession, ResumeRegistry
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("CONVERSIFY_WS_MAX_CONNECTIONS", 1000))
+# Per-IP limits are shared by everyone behind the same NAT or untrusted proxy,
+# so they only stop a single address from crowding out the rest
+MAX_CONNECTIONS_PER_IP = int(os.getenv("CONVERSIFY_WS_MAX_CONNECTIONS_PER_IP", 100))
+# Sustained messages per second and burst size, per connection and per client IP
+MESSAGE_RATE = float(os.getenv("CONVERSIFY_WS_MESSAGE_RATE", 2.0))
+MESSAGE_BURST = float(os.getenv("CONVERSIFY_WS_MESSAGE_BURST", 10))
+IP_MESSAGE_RATE = float(os.getenv("CONVERSIFY_WS_IP_MESSAGE_RATE", 20.0))
+IP_MESSAGE_BURST = float(os.getenv("CONVERSIFY_WS_IP_MESSAGE_BURST", 100))
+MAX_MESSAGE_BYTES = int(os.getenv("CONVERSIFY_WS_MAX_MESSAGE_BYTES", 16 * 1024))
+# Quiet connections are pinged every HEARTBEAT_INTERVAL seconds and closed if
+# they stay silent for two intervals; connections that send no chat message
+# for IDLE_TIMEOUT seconds are closed even if they answer the pings
+HEARTBEAT_INTERVAL = float(os.getenv("CONVERSIFY_WS_HEARTBEAT_INTERVAL", 30.0))
+IDLE_TIMEOUT = float(os.getenv("CONVERSIFY_WS_IDLE_TIMEOUT", 900.0))
+
+# Close codes from RFC 6455
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TOO_BIG = 1009
+
+RATE_LIMITED = "rate_limited"
+TOO_LARGE = "too_large"
+HEARTBEAT = "heartbeat"
+RESUMED_ELSEWHERE = "resumed"
+SLOW_READER = "slow_reader"
+
+PING_MESSAGE = {"type": "ping"}
+
+REJECTED_CONNECTIONS = REGISTRY.counter(
+    "conversify_ws_rejected_connections_total", "WebSocket handshakes refused, by reason.", ["reason"]
+)
+DROPPED_MESSAGES = REGISTRY.counter(
+    "conversify_ws_dropped_messages_total", "WebSocket messages refused, by reason.", ["reason"]
+)
+CLOSED_CONNECTIONS = REGISTRY.counter(
+    "conversify_ws_closed_connections_total", "WebSocket connections closed by the server, by reason.", ["reason"]
+)
+HEARTBEATS = REGISTRY.counter("conversify_ws_heartbeats_total", "Heartbeat pings sent to quiet connections.")
+_SEND_SECONDS = STAGE_SECONDS.labels("send_json")
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average and bursts of ``capacity``."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refilled(self, now: float) -> bool:
+        """Whether the bucket is full again by ``now``, so a new one would behave the same."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def take(self, now: Optional[float] = None, count: int = 1) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < count:
+            return False
+        self.tokens -= count
+        return True
+
+
+class Connection:
+    """One accepted WebSocket, its wire format and its limits."""
+    __slots__ = (
+        "id", "websocket", "codec", "ip", "bucket", "last_seen", "last_message", "session_id", "resume", "send_lock",
+    )
+
+    def __init__(self, connection_id: str, websocket: WebSocket, codec: Codec, ip: str, bucket: TokenBucket):
+        self.id = connection_id
+        self.websocket = websocket
+        self.codec = codec
+        self.ip = ip
+        self.bucket = bucket
+        self.last_seen = self.last_message = time.monotonic()
+        # The chat session answered on this socket; a resume swaps in an older one
+        self.session_id = connection_id
+        self.resume: Optional[ResumableSession] = None
+        # Replies, stream chunks and pings come from different tasks; one frame goes out at a time
+        self.send_lock = asyncio.Lock()
+
+
+async def _write(connection: Connection, message: Any) -> None:
+    # Callers hold the send lock; only encoding and the socket write are timed
+    with _SEND_SECONDS.time():
+        await connection.codec.send(connection.websocket, message)
+
+
+class ConnectionManager:
+    """Tracks the WebSockets of this worker and enforces its limits.
+
+    Handshakes beyond the worker-wide or per-IP cap are refused before
+    they are accepted. Every inbound message draws from a token bucket of
+    its connection and one shared by all connections from the same IP.
+    An IP's bucket outlives its last connection until it has refilled,
+    so reconnecting does not reset the limit. A background task pings
+    quiet connections and closes the ones that stop answering or stop
+    chatting.
+
+    The IP is the ASGI client address. Behind a reverse proxy, the server
+    must resolve forwarded headers from trusted proxies only (uvicorn's
+    ``forwarded_allow_ips``), or every client shares the proxy's limits.
+
+    Clients that send a ``resume`` message get a resume token. Their
+    messages are numbered and kept in an outbox until acknowledged, and
+    when the socket goes away the session is detached rather than
+    released, so a new socket presenting the token picks up the same
+    conversation and gets the messages it missed.
+    """
+
+    def __init__(
+        self,
+        release_session: Optional[Callable[[str], object]] = None,
+        max_connections: int = MAX_CONNECTIONS,
+        max_connections_per_ip: int = MAX_CONNECTIONS_PER_IP,
+        message_rate: float = MESSAGE_RATE,
+        message_burst: float = MESSAGE_BURST,
+        ip_message_rate: float = IP_MESSAGE_RATE,
+        ip_message_burst: float = IP_MESSAGE_BURST,
+        max_message_bytes: int = MAX_MESSAGE_BYTES,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        idle_timeout: float = IDLE_TIMEOUT,
+        resumable: Optional[ResumeRegistry] = None,
+    ):
+        self.active_connections: Dict[str, Connection] = {}
+        self.resumable = resumable if resumable is not None else ResumeRegistry()
+        self.release_session = release_session
+        self.max_connections = max_connections
+        self.max_connections_per_ip = max_connections_per_ip
+        self.message_rate = message_rate
+        self.message_burst = message_burst
+        self.ip_message_rate = ip_message_rate
+        self.ip_message_burst = ip_message_burst
+        self.max_message_bytes = max_message_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        # Connection counts live while the IP has open connections; buckets until they refill
+        self._ip_connections: Dict[str, int] = {}
+        self._ip_buckets: Dict[str, TokenBucket] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket, codec: Codec = DEFAULT_CODEC) -> Optional[str]:
+        """Accept the handshake and return the connection id, or refuse it and return None."""
+        ip = websocket.client.host if websocket.client else "unknown"
+        reason = None
+        if len(self.active_connections) >= self.max_connections:
+            reason = "connection_cap"
+        elif self._ip_connections.get(ip, 0) >= self.max_connections_per_ip:
+            reason = "ip_cap"
+        if reason is not None:
+            REJECTED_CONNECTIONS.labels(reason).inc()
+            logger.warning(f"Refusing WebSocket connection from {ip}: {reason}")
+            # Closing before accepting answers the handshake with HTTP 403
+            await websocket.close()
+            return None
+        await websocket.accept(subprotocol=codec.subprotocol)
+        connection_id = f"conn_{uuid.uuid4().hex}"
+        self.active_connections[connection_id] = Connection(
+            connection_id, websocket, codec, ip, TokenBucket(self.message_rate, self.message_burst)
+        )
+        self._ip_connections[ip] = self._ip_connections.get(ip, 0) + 1
+        if ip not in self._ip_buckets:
+            self._ip_buckets[ip] = TokenBucket(self.ip_message_rate, self.ip_message_burst)
+        self._ensure_reaper()
+        logger.info(f"New WebSocket connection accepted: {connection_id}")
+        return connection_id
+
+    def _remove(self, connection_id: str) -> Optional[Connection]:
+        connection = self.active_connections.pop(connection_id, None)
+        if connection is not None:
+            remaining = self._ip_connections.get(connection.ip, 1) - 1
+            if remaining > 0:
+                self._ip_connections[connection.ip] = remaining
+            else:
+                self._ip_connections.pop(connection.ip, None)
+            logger.info(f"WebSocket connection removed: {connection_id}")
+        return connection
+
+    def disconnect(self, connection_id: str, release: bool = True):
+        connection = self._remove(connection_id)
+        # The server may already have closed it, so release only once
+        if connection is None or not release:
+            return
+        if connection.resume is not None:
+            # Kept for RESUME_TTL seconds in case the client comes back
+            self.resumable.detach(connection.resume)
+            self._ensure_reaper()
+        elif self.release_session is not None:
+            self.release_session(connection.session_id)
+
+    def session_id(self, connection_id: str) -> str:
+        """The chat session a connection's messages belong to."""
+        connection = self.active_connections.get(connection_id)
+        return connection.session_id if connection is not None else connection_id
+
+    def sender(self, connection_id: str) -> Callable[[Any], Awaitable[None]]:
+        """A send function for the connection's messages; resumable ones go through its outbox."""
+        return functools.partial(self._send, self.active_connections[connection_id])
+
+    async def _send(self, connection: Connection, message: Any) -> None:
+        resume = connection.resume
+        if resume is None:
+            async with connection.send_lock:
+                await _write(connection, message)
+            return
+        # The session may have moved to a newer socket, or be waiting for one
+        target = self.active_connections.get(resume.connection_id) if resume.connection_id else None
+        if target is None:
+            resume.outbox.push(message)
+            return
+        async with target.send_lock:
+            # Numbered under the lock, so seq order is the order on the wire
+            await _write(target, resume.outbox.push(message))
+
+    async def send_control(self, connection_id: str, message: Any) -> None:
+        """Send an unnumbered message, such as a ping, between other frames."""
+        connection = self.active_connections.get(connection_id)
+        if connection is None:
+            raise WebSocketDisconnect(CLOSE_GOING_AWAY)
+        async with connection.send_lock:
+            await _write(connection, message)
+
+    async def resume(self, connection_id: str, token: Optional[str] = None, ack: Any = 0) -> List[dict]:
+        """Handle a resume message: send the session message followed by any replayed messages.
+
+        A known token moves its session onto this connection, taking it
+        over from an older socket that has not noticed it is gone yet. An
+        unknown or expired token, or none, makes the connection's current
+        session resumable under a new token. The connection's send lock is
+        held from the takeover until the replay is out, so nothing newer
+        reaches the client first. Returns what was sent.
+        """
+        connection = self.active_connections.get(connection_id)
+        if connection is None:
+            raise WebSocketDisconnect(CLOSE_GOING_AWAY)
+        async with connection.send_lock:
+            ack = ack if isinstance(ack, int) and not isinstance(ack, bool) else 0
+            session = self.resumable.get(token)
+            if session is None or session is connection.resume:
+                if session is None:
+                    RESUMES.labels("new" if token is None else "unknown").inc()
+                    if connection.resume is None:
+                        connection.resume = self.resumable.open(connection.session_id, connection_id)
+                    session = connection.resume
+                resumed = session.token == token
+            else:
+                RESUMES.labels("resumed").inc()
+                await self._take_over(connection, session)
+                resumed = True
+            if ack > session.outbox.seq:
+                # Recovered after a restart: keep numbering where the client left off
+                session.outbox.seq = ack
+            session.outbox.ack(ack)
+            replay, missed = session.outbox.since(ack)
+            REPLAYED_MESSAGES.inc(len(replay))
+            reply = {
+                "type": "session",
+                "token": session.token,
+                "resumed": resumed,
+                "seq": session.outbox.seq,
+                "missed": missed,
+            }
+            await _write(connection, [reply] + replay)
+            return [reply] + replay
+
+    async def _take_over(self, connection: Connection, session: ResumableSession) -> None:
+        previous = self.active_connections.get(session.connection_id) if session.connection_id else None
+        if previous is not None:
+            # Removed without detaching: the session lives on, on this socket
+            CLOSED_CONNECTIONS.labels(RESUMED_ELSEWHERE).inc()
+            self._remove(previous.id)
+            try:
+                await previous.websocket.close(code=CLOSE_GOING_AWAY)
+            except Exception:
+                pass
+        if connection.resume is not None:
+            # The connection was resumable under another token; that session ends here
+            self.resumable.discard(connection.resume)
+        if self.release_session is not None and connection.session_id != session.session_id:
+            # Anything said on this socket before resuming belonged to a throwaway session
+            self.release_session(connection.session_id)
+        self.resumable.attach(session, connection.id)
+        connection.session_id = session.session_id
+        connection.resume = session
+
+    def ack(self, connection_id: str, seq: Any) -> None:
+        """Drop the messages the client has acknowledged from the connection's outbox."""
+        connection = self.active_connections.get(connection_id)
+        if connection is not None and connection.resume is not None and isinstance(seq, int):
+            connection.resume.outbox.ack(seq)
+
+    def admit(self, connection_id: str, data: Frame) -> Optional[str]:
+        """Check one inbound message; returns None to process it, else why it was refused.
+
+        Heartbeat replies are acknowledged with HEARTBEAT and cost no tokens.
+        """
+        connection = self.active_connections.get(connection_id)
+        if connection is None:
+            return None
+        now = time.monotonic()
+        connection.last_seen = now
+        if data == connection.codec.pong:
+            return HEARTBEAT
+        if isinstance(data, bytes):
+            too_large = len(data) > self.max_message_bytes
+        else:
+            # Four bytes per character at most, so short messages skip the encode
+            too_large = len(data) * 4 > self.max_message_bytes and len(data.encode("utf-8")) > self.max_message_bytes
+        if too_large:
+            DROPPED_MESSAGES.labels(TOO_LARGE).inc()
+            return TOO_LARGE
+        ip_bucket = self._ip_buckets.get(connection.ip)
+        if not connection.bucket.take(now) or (ip_bucket is not None and not ip_bucket.take(now)):
+            DROPPED_MESSAGES.labels(RATE_LIMITED).inc()
+            return RATE_LIMITED
+        connection.last_message = now
+        return None
+
+    def admit_batch(self, connection_id: str, count: int) -> bool:
+        """Charge the extra messages of a multi-message frame; admit() paid for the first."""
+        connection = self.active_connections.get(connection_id)
+        if connection is None or count <= 1:
+            return True
+        now = time.monotonic()
+        ip_bucket = self._ip_buckets.get(connection.ip)
+        if not connection.bucket.take(now, count - 1) or (ip_bucket is not None and not ip_bucket.take(now, count - 1)):
+            DROPPED_MESSAGES.labels(RATE_LIMITED).inc()
+            return False
+        return True
+
+    async def close(self, connection_id: str, code: int, reason: str) -> None:
+        """Close a connection from the server side and count why."""
+        connection = self.active_connections.get(connection_id)
+        if connection is None:
+            return
+        CLOSED_CONNECTIONS.labels(reason).inc()
+        self.disconnect(connection_id)
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            # The socket is already gone; its receive loop will notice
+            pass
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_loop())
+
+    async def _reap_loop(self) -> None:
+        interval = max(0.01, min(self.heartbeat_interval, self.idle_timeout, self.resumable.ttl) / 2)
+        while self.active_connections or self.resumable.detached or self._ip_buckets:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"WebSocket reaper failed: {e!r}")
+
+    async def reap(self, now: Optional[float] = None) -> int:
+        """Ping quiet connections and close idle or unresponsive ones; returns how many were closed."""
+        now = time.monotonic() if now is None else now
+        closed = 0
+        for connection in list(self.active_connections.values()):
+            if now - connection.last_message > self.idle_timeout:
+                await self.close(connection.id, CLOSE_NORMAL, "idle")
+                closed += 1
+            elif now - connection.last_seen > 2 * self.heartbeat_interval:
+                await self.close(connection.id, CLOSE_GOING_AWAY, "unresponsive")
+                closed += 1
+            elif now - connection.last_seen > self.heartbeat_interval:
+                HEARTBEATS.inc()
+                try:
+                    await self.send_control(connection.id, PING_MESSAGE)
+                except Exception:
+                    await self.close(connection.id, CLOSE_GOING_AWAY, "unresponsive")
+                    closed += 1
+        if closed:
+            logger.info(f"Reaped {closed} WebSocket connections")
+        expired = self.resumable.expire(now)
+        for session in expired:
+            if self.release_session is not None:
+                self.release_session(session.session_id)
+        if expired:
+            logger.info(f"Released {len(expired)} detached WebSocket sessions")
+        for ip, bucket in list(self._ip_buckets.items()):
+            if ip not in self._ip_connections and bucket.refilled(now):
+                del self._ip_buckets[ip]
+        return closed
+
+    async def shutdown(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
@@ -0,0 +1,398 @@
+"""Append-only, segment-rotated log of conversation turns for restart recovery."""
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
+from pathlib import Path
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the directory lock is skipped there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 64 * 2 ** 20
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_COMPACT_INTERVAL = 600.0
+# Enough turns to refill a session's history buffer (two messages per turn)
+DEFAULT_TURNS_PER_SESSION = 10
+# Worker directories a process tries before giving up on logging
+MAX_WORKER_DIRECTORIES = 256
+
+_SEGMENT_RE = re.compile(r"^segment-(\d{6})\.log$")
+_END = "end"
+_LINK_PREFIX = '{"link":'
+# Characters that would split or end a log line
+_UNSAFE_ID_RE = re.compile(r"[\t\n\r]")
+
+
+def _check_session_id(session_id: str) -> None:
+    if not session_id or _UNSAFE_ID_RE.search(session_id):
+        raise ValueError(f"Session id {session_id!r} cannot be logged: it is empty or holds a tab or line break")
+
+
+class ConversationLog:
+    """Durable record of every turn, replayed lazily after a restart.
+
+    Each line is ``<session id>\\t<epoch seconds>\\t<JSON turn>``, so the
+    startup scan can index sessions without decoding any JSON. Session ids
+    with tabs or line breaks are refused with ValueError. The index
+    keeps only the offsets of each session's last few turns; the turns are
+    read back from disk the first time the session is requested.
+
+    Turns are buffered in memory and written by a background thread, one
+    write and one fsync per batch (group commit), so a request never waits
+    for the disk. Segments roll over at ``segment_bytes``; sealed segments
+    are rewritten in the background without the turns of ended or expired
+    sessions, and deleted once they hold nothing live.
+
+    An alias (such as a resume token) can be linked to a session; it then
+    stays valid for as long as the session itself has recent turns.
+
+    Each process writes its own directory: the first one to start takes
+    ``directory``, and further processes (for example extra uvicorn
+    workers) take ``directory/worker-1``, ``worker-2`` and so on. After a
+    restart, a session is only read back by the process that claims the
+    directory it was written to.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttl_seconds: Optional[float] = None,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        turns_per_session: int = DEFAULT_TURNS_PER_SESSION,
+        fsync: bool = True,
+    ):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.turns_per_session = turns_per_session
+        self.fsync = fsync
+        self.enabled = True
+        # session_id -> (last turn time, [(segment, offset)] of its latest turns)
+        self._index: Dict[str, Tuple[float, Deque[Tuple[int, int]]]] = {}
+        # alias -> session_id it was last linked to
+        self._links: Dict[str, str] = {}
+        # The directory this process claimed, set once it is opened
+        self.path: Optional[Path] = None
+        self._buffer: List[Tuple[str, float, str]] = []
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._opened_pid: Optional[int] = None
+        self._segment = 0
+        self._file = None
+        self._lock_file = None
+        self.counters: Dict[str, int] = {"appended": 0, "written": 0, "restored": 0, "compacted": 0}
+
+    @classmethod
+    def from_env(cls, ttl_seconds: Optional[float] = None) -> Optional["ConversationLog"]:
+        """A log in ``CONVERSIFY_CONVERSATION_LOG_DIR``, or None when it is unset."""
+        directory = os.getenv("CONVERSIFY_CONVERSATION_LOG_DIR")
+        if not directory:
+            return None
+        return cls(
+            Path(directory),
+            ttl_seconds=ttl_seconds,
+            segment_bytes=int(os.getenv("CONVERSIFY_CONVERSATION_LOG_SEGMENT_BYTES", DEFAULT_SEGMENT_BYTES)),
+            fsync=os.getenv("CONVERSIFY_CONVERSATION_LOG_FSYNC", "1") != "0",
+        )
+
+    def _claim(self) -> Optional[Path]:
+        """Lock the first worker directory no other process holds."""
+        for number in range(MAX_WORKER_DIRECTORIES):
+            path = self.directory if number == 0 else self.directory / f"worker-{number}"
+            path.mkdir(parents=True, exist_ok=True)
+            lock_file = open(path / "LOCK", "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    continue
+            self._lock_file = lock_file
+            return path
+        return None
+
+    def _open(self) -> bool:
+        """Claim a directory, index existing segments and start the writer.
+
+        Done on first use rather than in the constructor so that processes
+        forked after import each make their own attempt.
+        """
+        if self._opened_pid == os.getpid():
+            return self.enabled
+        with self._lock:
+            if self._opened_pid == os.getpid():
+                return self.enabled
+            self._opened_pid = os.getpid()
+            self._index.clear()
+            self._links.clear()
+            self._buffer.clear()
+            self.path = self._claim()
+            if self.path is None:
+                logger.warning(
+                    f"All {MAX_WORKER_DIRECTORIES} conversation log directories under {self.directory} "
+                    "are in use by other processes; not logging here"
+                )
+                self.enabled = False
+                return False
+            started = time.perf_counter()
+            segments = self._segments()
+            valid_bytes = 0
+            for segment in segments:
+                valid_bytes = self._scan(segment)
+            self._segment = segments[-1] if segments else 1
+            self._file = open(self._path(self._segment), "ab")
+            # Drop a torn final write left by a crash so appends start on a line boundary
+            self._file.truncate(valid_bytes)
+            self._file.seek(valid_bytes)
+            atexit.register(self.close)
+            logger.info(
+                f"Indexed {len(self._index)} logged sessions from {len(segments)} segments in {self.path} "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+            threading.Thread(target=self._write_loop, name="conversation-log-writer", daemon=True).start()
+            if self.compact_interval:
+                threading.Thread(target=self._compact_loop, name="conversation-log-compactor", daemon=True).start()
+            return True
+
+    def _path(self, segment: int) -> Path:
+        return self.path / f"segment-{segment:06d}.log"
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for path in self.path.iterdir():
+            match = _SEGMENT_RE.match(path.name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _scan(self, segment: int) -> int:
+        """Index one segment and return how many of its bytes hold complete lines."""
+        offset = 0
+        with open(self._path(segment), "rb") as handle:
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    session_id, timestamp, payload = line.split(b"\t", 2)
+                    link = json.loads(payload)["link"] if payload.startswith(_LINK_PREFIX.encode()) else None
+                    self._record(session_id.decode(), float(timestamp), segment, offset, payload == b'"end"\n', link)
+                except ValueError:
+                    logger.warning(f"Skipping malformed line at {self._path(segment)}:{offset}")
+                offset += len(line)
+        return offset
+
+    def _record(self, session_id: str, timestamp: float, segment: int, offset: int, ended: bool,
+                link: Optional[str] = None) -> None:
+        if ended:
+            self._index.pop(session_id, None)
+            self._links.pop(session_id, None)
+            return
+        if link is not None:
+            self._links[session_id] = link
+        entry = self._index.get(session_id)
+        if entry is None:
+            entry = (timestamp, deque(maxlen=self.turns_per_session))
+        self._index[session_id] = (timestamp, entry[1])
+        entry[1].append((segment, offset))
+
+    def append(self, session_id: str, turn: dict) -> None:
+        """Queue one turn; it reaches the disk with the next group commit."""
+        _check_session_id(session_id)
+        if not self._open():
+            return
+        line = json.dumps(turn, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._buffer.append((session_id, time.time(), line))
+            self.counters["appended"] += 1
+
+    def link(self, alias: str, session_id: str) -> None:
+        """Log ``alias`` as another name for ``session_id``; see :meth:`linked`."""
+        _check_session_id(session_id)
+        self.append(alias, {"link": session_id})
+
+    def linked(self, alias: str) -> Optional[str]:
+        """The session ``alias`` was linked to, while that session is still restorable."""
+        if not self._open():
+            return None
+        self._flush_pending(alias)
+        with self._lock:
+            session_id = self._links.get(alias)
+            if session_id is None or alias not in self._index or session_id not in self._index:
+                return None
+            if self._expired(alias, time.time()):
+                return None
+            return session_id
+
+    def _last_seen(self, session_id: str) -> float:
+        """When a session last had a turn; for an alias, the later of its own and its session's."""
+        seen = self._index[session_id][0]
+        target = self._index.get(self._links.get(session_id))
+        return seen if target is None else max(seen, target[0])
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return self.ttl_seconds is not None and now - self._last_seen(session_id) > self.ttl_seconds
+
+    def _flush_pending(self, session_id: str) -> None:
+        with self._lock:
+            pending = any(queued[0] == session_id for queued in self._buffer)
+        if pending:
+            self.flush()
+
+    def end(self, session_id: str) -> None:
+        """Mark a session as finished so it is neither restored nor kept by compaction."""
+        _check_session_id(session_id)
+        if not self._open():
+            return
+        with self._lock:
+            self._buffer.append((session_id, time.time(), json.dumps(_END)))
+        self._wakeup.set()
+
+    def __contains__(self, session_id: str) -> bool:
+        if not self._open():
+            return False
+        with self._lock:
+            return session_id in self._index or any(queued[0] == session_id for queued in self._buffer)
+
+    def restore(self, session_id: str) -> List[dict]:
+        """The latest logged turns of a session, oldest first, or [] if it has none."""
+        if not self._open():
+            return []
+        self._flush_pending(session_id)
+        with self._lock:
+            entry = self._index.get(session_id)
+            if entry is None or self._expired(session_id, time.time()):
+                return []
+            offsets = entry[1]
+            turns = []
+            handles = {}
+            try:
+                for segment, offset in offsets:
+                    handle = handles.get(segment)
+                    if handle is None:
+                        handle = handles[segment] = open(self._path(segment), "rb")
+                    handle.seek(offset)
+                    turns.append(json.loads(handle.readline().split(b"\t", 2)[2]))
+            finally:
+                for handle in handles.values():
+                    handle.close()
+            self.counters["restored"] += 1
+            return turns
+
+    def flush(self) -> int:
+        """Write everything buffered with a single write and fsync."""
+        with self._io_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch or self._file is None:
+                return 0
+            lines = [
+                f"{session_id}\t{timestamp:.3f}\t{payload}\n".encode("utf-8")
+                for session_id, timestamp, payload in batch
+            ]
+            offset = self._file.tell()
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            with self._lock:
+                for (session_id, timestamp, payload), line in zip(batch, lines):
+                    link = json.loads(payload)["link"] if payload.startswith(_LINK_PREFIX) else None
+                    self._record(session_id, timestamp, self._segment, offset, payload == '"end"', link)
+                    offset += len(line)
+                self.counters["written"] += len(batch)
+            if offset >= self.segment_bytes:
+                self._rotate()
+            return len(batch)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._path(self._segment), "ab")
+        logger.debug(f"Conversation log rolled over to segment {self._segment}")
+
+    def _write_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Conversation log write failed: {e!r}")
+                time.sleep(1.0)
+
+    def _compact_loop(self) -> None:
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Conversation log compaction failed: {e!r}")
+
+    def compact(self) -> int:
+        """Rewrite sealed segments keeping only turns still needed for restores."""
+        now = time.time()
+        with self._lock:
+            # Segments before the active one were fully indexed before it was opened
+            active = self._segment
+            # Decide everything that expired before dropping any, so aliases see their sessions
+            for session_id in [s for s in self._index if self._expired(s, now)]:
+                del self._index[session_id]
+                self._links.pop(session_id, None)
+            live: Dict[int, Dict[int, str]] = {}
+            for session_id, (_, offsets) in self._index.items():
+                for segment, offset in offsets:
+                    live.setdefault(segment, {})[offset] = session_id
+        compacted = 0
+        for segment in self._segments():
+            if segment >= active:
+                continue
+            compacted += self._compact_segment(segment, live.get(segment, {}))
+        if compacted:
+            self.counters["compacted"] += compacted
+            logger.info(f"Compacted {compacted} conversation log segments")
+        return compacted
+
+    def _compact_segment(self, segment: int, keep: Dict[int, str]) -> int:
+        path = self._path(segment)
+        if not keep:
+            with self._lock:
+                path.unlink()
+            return 1
+        temporary = path.with_suffix(".compact")
+        moved: Dict[int, int] = {}
+        with open(path, "rb") as source, open(temporary, "wb") as target:
+            for offset in sorted(keep):
+                source.seek(offset)
+                moved[offset] = target.tell()
+                target.write(source.readline())
+            target.flush()
+            os.fsync(target.fileno())
+        with self._lock:
+            os.replace(temporary, path)
+            # Point the index at the new positions of the turns it still references
+            for session_id, (seen, offsets) in self._index.items():
+                if any(s == segment for s, _ in offsets):
+                    self._index[session_id] = (seen, deque(
+                        ((s, moved.get(o, o) if s == segment else o) for s, o in offsets),
+                        maxlen=self.turns_per_session,
+                    ))
+        return 1
+
+    def close(self) -> None:
+        """Write out buffered turns; call before the process exits."""
+        if self._opened_pid == os.getpid() and self.enabled:
+            self.flush()
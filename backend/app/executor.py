@@ -0,0 +1,151 @@
+"""Runs chat turns on worker threads, sharded by session id to keep them in order."""
+from typing import Callable, List, Optional, TypeVar
+import asyncio
+import logging
+import os
+import queue
+import threading
+import zlib
+
+from backend.app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EXECUTOR_SHARDS = int(os.getenv("CONVERSIFY_EXECUTOR_SHARDS", 4))
+# Turns waiting per shard before new ones are turned away
+EXECUTOR_QUEUE_SIZE = int(os.getenv("CONVERSIFY_EXECUTOR_QUEUE_SIZE", 64))
+TURN_TIMEOUT = float(os.getenv("CONVERSIFY_TURN_TIMEOUT", 10.0))
+
+OVERLOADED = "overloaded"
+TIMEOUT = "timeout"
+
+BUSY_TURNS = REGISTRY.counter(
+    "conversify_executor_busy_total", "Turns answered with the fallback response, by reason.", ["reason"]
+)
+
+_STOP = object()
+
+
+class ExecutorBusy(Exception):
+    """A turn was not run in time: its shard's queue was full, or it timed out."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Shard:
+    """One worker thread and the bounded queue feeding it."""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            loop, future, fn, args = item
+            # A turn that timed out while queued is skipped, so it never
+            # changes the session after the client was told it failed
+            if future.cancelled():
+                continue
+            result = error = None
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # The caller's event loop has closed; nobody is waiting
+                pass
+
+
+def _resolve(future: "asyncio.Future", result, error: Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class ShardedExecutor:
+    """Runs blocking calls on a fixed set of threads, one queue per thread.
+
+    Every call for a given session id goes to the same shard, and each
+    shard runs its calls one at a time in arrival order, so a session's
+    turns never overlap and keep their order while different sessions run
+    in parallel. A full shard queue or a call that takes longer than
+    ``timeout`` raises ExecutorBusy right away instead of piling up work.
+
+    With ``shards=0`` calls run inline on the event loop, which is
+    cheaper when every turn takes microseconds.
+
+    Threads are started on first use, so processes forked after import
+    each start their own.
+    """
+
+    def __init__(self, shards: int = EXECUTOR_SHARDS, queue_size: int = EXECUTOR_QUEUE_SIZE,
+                 timeout: Optional[float] = TURN_TIMEOUT):
+        self.shards: List[_Shard] = [_Shard(index, queue_size) for index in range(max(0, shards))]
+        self.timeout = timeout
+        self._started_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def shard_for(self, session_id: str) -> _Shard:
+        # crc32 rather than hash(): stable across processes and restarts
+        return self.shards[zlib.crc32(session_id.encode("utf-8")) % len(self.shards)]
+
+    def pending(self) -> int:
+        return sum(shard.queue.qsize() for shard in self.shards)
+
+    def _ensure_started(self) -> None:
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            for shard in self.shards:
+                # Work queued before a fork belongs to the parent
+                shard.queue = queue.Queue(maxsize=shard.queue.maxsize)
+                shard.thread = threading.Thread(target=shard.run, name=f"turn-shard-{shard.index}", daemon=True)
+                shard.thread.start()
+            self._started_pid = os.getpid()
+
+    async def run(self, session_id: str, fn: Callable[..., T], *args) -> T:
+        """Run ``fn(*args)`` on the shard of ``session_id`` and wait for its result."""
+        if not self.shards:
+            return fn(*args)
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.shard_for(session_id).queue.put_nowait((asyncio.get_running_loop(), future, fn, args))
+        except queue.Full:
+            BUSY_TURNS.labels(OVERLOADED).inc()
+            raise ExecutorBusy(OVERLOADED)
+        try:
+            # wait_for cancels the future on timeout, which also drops a still-queued turn
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            BUSY_TURNS.labels(TIMEOUT).inc()
+            logger.warning(f"Turn for session {session_id} timed out after {self.timeout}s")
+            raise ExecutorBusy(TIMEOUT)
+
+    def shutdown(self, wait: float = 5.0) -> None:
+        """Let the shards finish what is queued, then stop their threads."""
+        if self._started_pid != os.getpid():
+            return
+        for shard in self.shards:
+            try:
+                shard.queue.put(_STOP, timeout=wait)
+            except queue.Full:
+                pass
+        for shard in self.shards:
+            shard.thread.join(wait)
+        self._started_pid = None
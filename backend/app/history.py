@@ -0,0 +1,79 @@
+"""Compact fixed-capacity conversation history."""
+from typing import Iterator, List, Optional
+from datetime import datetime
+import time
+
+
+class HistoryRecord:
+    """One message; timestamps are epoch seconds until exported."""
+    __slots__ = ("timestamp", "content", "is_bot")
+
+    def __init__(self, timestamp: float, content: str, is_bot: bool):
+        self.timestamp = timestamp
+        self.content = content
+        self.is_bot = is_bot
+
+    def to_dict(self) -> dict:
+        """Export in the historical dict format with an ISO timestamp."""
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "content": self.content,
+            "is_bot": self.is_bot,
+        }
+
+
+class HistoryBuffer:
+    """Ring buffer holding the most recent ``capacity`` messages of a session.
+
+    Appends never copy the buffer: until it is full, records are appended to
+    the backing list, and after that the oldest record is overwritten in
+    place, so a long conversation allocates no new records at all.
+    """
+    __slots__ = ("capacity", "_records", "_start")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._records: List[HistoryRecord] = []
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[HistoryRecord]:
+        """Iterate from the oldest to the newest message."""
+        records, start = self._records, self._start
+        for offset in range(len(records)):
+            yield records[(start + offset) % len(records)]
+
+    def append(self, content: str, is_bot: bool = False, timestamp: Optional[float] = None) -> None:
+        if timestamp is None:
+            timestamp = time.time()
+        records = self._records
+        if len(records) < self.capacity:
+            records.append(HistoryRecord(timestamp, content, is_bot))
+            return
+        record = records[self._start]
+        record.timestamp = timestamp
+        record.content = content
+        record.is_bot = is_bot
+        self._start = (self._start + 1) % self.capacity
+
+    def last(self) -> Optional[HistoryRecord]:
+        """The most recent message, if any."""
+        if not self._records:
+            return None
+        return self._records[(self._start - 1) % len(self._records)]
+
+    def content_length(self) -> int:
+        """Total characters of message text currently held."""
+        return sum(len(record.content) for record in self._records)
+
+    def clear(self) -> None:
+        self._records = []
+        self._start = 0
+
+    def export(self) -> List[dict]:
+        """Messages as dicts with ISO timestamps, oldest first."""
+        return [record.to_dict() for record in self]
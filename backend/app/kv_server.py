@@ -0,0 +1,110 @@
+"""Minimal key-value server standing in for Redis or memcached.
+
+Run it next to several uvicorn workers to share conversation state:
+
+    python -m backend.app.kv_server --port 7379
+    CONVERSIFY_SESSION_BACKEND=kv://127.0.0.1:7379 uvicorn backend.app.main:app --workers 4
+
+Requests and responses are single JSON lines:
+
+    {"op": "get", "key": "k"}                          -> {"ok": true, "value": "v" | null}
+    {"op": "set", "key": "k", "value": "v", "ttl": 60} -> {"ok": true}
+    {"op": "mset", "items": {"k": "v"}, "ttl": 60}     -> {"ok": true}
+    {"op": "delete", "keys": ["k"]}                    -> {"ok": true, "deleted": 1}
+    {"op": "ping"}                                     -> {"ok": true}
+"""
+from typing import Dict, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 7379
+SWEEP_INTERVAL = 30.0
+
+
+class KeyValueServer:
+    """In-memory store with per-key expiry, served over asyncio streams."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        # key -> (value, expires_at or None)
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _expires(self, ttl) -> Optional[float]:
+        return self._clock() + float(ttl) if ttl else None
+
+    def execute(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "get":
+            item = self._data.get(request["key"])
+            if item is not None and item[1] is not None and item[1] <= self._clock():
+                del self._data[request["key"]]
+                item = None
+            return {"ok": True, "value": item[0] if item else None}
+        if op == "set":
+            self._data[request["key"]] = (request["value"], self._expires(request.get("ttl")))
+            return {"ok": True}
+        if op == "mset":
+            expires = self._expires(request.get("ttl"))
+            for key, value in request["items"].items():
+                self._data[key] = (value, expires)
+            return {"ok": True}
+        if op == "delete":
+            deleted = sum(self._data.pop(key, None) is not None for key in request["keys"])
+            return {"ok": True, "deleted": deleted}
+        if op == "ping":
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+    def sweep(self) -> int:
+        """Drop every expired key."""
+        now = self._clock()
+        expired = [key for key, (_, expires) in self._data.items() if expires is not None and expires <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self.execute(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=2 ** 24)
+        logger.info(f"Key-value server listening on {host}:{port}")
+        async with server:
+            while True:
+                await asyncio.sleep(SWEEP_INTERVAL)
+                self.sweep()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stand-in key-value server for shared sessions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(KeyValueServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
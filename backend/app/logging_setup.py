@@ -0,0 +1,220 @@
+"""Queue-based structured logging that keeps I/O off the event loop."""
+from typing import IO, List, Optional
+from datetime import datetime
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+from backend.app.metrics import REGISTRY
+
+LOG_LEVEL = os.getenv("CONVERSIFY_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("CONVERSIFY_LOG_FORMAT", "json")
+LOG_FILE = os.getenv("CONVERSIFY_LOG_FILE")
+LOG_QUEUE_SIZE = int(os.getenv("CONVERSIFY_LOG_QUEUE_SIZE", 10000))
+LOG_BATCH_SIZE = int(os.getenv("CONVERSIFY_LOG_BATCH_SIZE", 256))
+# Message payloads are logged by length only; set CONVERSIFY_LOG_PAYLOAD_SAMPLE
+# to write that fraction of them, cut to PAYLOAD_CHARS characters
+PAYLOAD_CHARS = int(os.getenv("CONVERSIFY_LOG_PAYLOAD_CHARS", 200))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("CONVERSIFY_LOG_PAYLOAD_SAMPLE", 0.0))
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+DROPPED_RECORDS = REGISTRY.counter(
+    "conversify_log_records_dropped_total", "Log records discarded because the log queue was full."
+)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_STOP = object()
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut ``text`` to ``limit`` characters, noting how much was dropped."""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra`` fields as top-level keys.
+
+    A ``payload`` extra is treated as user content: only its length is
+    written, unless it is picked by ``payload_sample_rate``, in which case
+    it is also written truncated.
+    """
+
+    def __init__(self, payload_chars: int = PAYLOAD_CHARS, payload_sample_rate: float = PAYLOAD_SAMPLE_RATE):
+        super().__init__()
+        self.payload_chars = payload_chars
+        self.payload_sample_rate = payload_sample_rate
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        payload = entry.pop("payload", None)
+        if payload is not None:
+            payload = str(payload)
+            entry["payload_chars"] = len(payload)
+            if random.random() < self.payload_sample_rate:
+                entry["payload"] = truncate(payload, self.payload_chars)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The historical one-line format, with payloads sampled like the JSON ones."""
+
+    def __init__(self, payload_chars: int = PAYLOAD_CHARS, payload_sample_rate: float = PAYLOAD_SAMPLE_RATE):
+        super().__init__(TEXT_FORMAT)
+        self.payload_chars = payload_chars
+        self.payload_sample_rate = payload_sample_rate
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            payload = str(payload)
+            if random.random() < self.payload_sample_rate:
+                text = f"{text}: {truncate(payload, self.payload_chars)}"
+            else:
+                text = f"{text} ({len(payload)} chars)"
+        return text
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a bounded queue and drops them when it is full.
+
+    Records are queued unformatted, so building the message, JSON encoding
+    and writing all happen on the listener thread.
+    """
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener lives in this process, so the record needs no pickling
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            DROPPED_RECORDS.inc()
+
+
+class BatchingQueueListener:
+    """Drains the log queue on a background thread, one write per batch."""
+
+    def __init__(self, log_queue: "queue.Queue", stream: IO[str], formatter: logging.Formatter,
+                 batch_size: int = LOG_BATCH_SIZE):
+        self.queue = log_queue
+        self.stream = stream
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write everything queued so far, then stop the thread."""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines: List[str] = []
+            stopping = False
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception as e:
+                    lines.append(f"Unformattable log record from {record.name}: {e!r}")
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    pass
+            if stopping:
+                return
+
+
+_listener: Optional[BatchingQueueListener] = None
+_handler: Optional[BoundedQueueHandler] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT,
+                      log_file: Optional[str] = LOG_FILE) -> BatchingQueueListener:
+    """Route the root logger through a bounded queue to a batching writer thread.
+
+    Calling it again returns the pipeline that is already running.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return _listener
+    stream = open(log_file, "a", encoding="utf-8") if log_file else sys.stderr
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter()
+    log_queue: "queue.Queue" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    _handler = BoundedQueueHandler(log_queue)
+    root.addHandler(_handler)
+    _listener = BatchingQueueListener(log_queue, stream, formatter)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Write out every queued record and stop the writer thread."""
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork() -> None:
+    """Give a forked worker its own queue and writer thread.
+
+    The parent's writer thread does not exist in the child, and the old
+    queue's internal lock may have been held at the moment of the fork.
+    """
+    global _listener
+    if _listener is None or _handler is None:
+        return
+    log_queue: "queue.Queue" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler.queue = log_queue
+    _listener = BatchingQueueListener(log_queue, _listener.stream, _listener.formatter, _listener.batch_size)
+    _listener.start()
@@ -1,62 +1,83 @@
 """Main FastAPI application module."""
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pathlib import Path
-import json
+import os
 import random
+import re
+import secrets
 import logging
-from typing import Dict, List
-from datetime import datetime
+import threading
+from typing import List, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Configure logging; records are written by a background thread
+from backend.app.logging_setup import configure_logging
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Import chatbot responses
-from backend.app.chatbot_responses import RESPONSES, TOPICS, get_contextual_response
+from backend.app.batch import BATCH_MAX_TURNS, NDJSON_MEDIA_TYPE, BatchRequest, BatchRunner
+from backend.app.chatbot_responses import chat_engine, end_session, get_contextual_response, get_history
+from backend.app.connections import (
+    CLOSE_POLICY_VIOLATION, CLOSE_TOO_BIG, HEARTBEAT, RATE_LIMITED, SLOW_READER, TOO_LARGE, ConnectionManager,
+)
+from backend.app.executor import ExecutorBusy, ShardedExecutor
+from backend.app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, STAGE_SECONDS, TRANSPORT_ERRORS
+from backend.app.profiling import MAX_PROFILE_SECONDS, ProfilerBusy, StackSampler, render_collapsed
+from backend.app.protocol import negotiate, receive_frame
+from backend.app.resume import ResumeRegistry
+from backend.app.static_cache import StaticAssetCache
+from backend.app.streaming import StreamSlot
+
+_DECODE_SECONDS = STAGE_SECONDS.labels("json_decode")
+_GET_RESPONSE_SECONDS = STAGE_SECONDS.labels("get_response")
+
+RATE_LIMITED_REPLY = {
+    "type": "error",
+    "content": "You're sending messages too quickly. Please wait a moment and try again."
+}
+# Heartbeat replies and acknowledgements carry no chat content
+CONTROL_MESSAGES = ("pong", "ack")
+# Sent instead of an answer when the turn could not be run in time
+BUSY_RESPONSE = "I'm handling a lot of conversations right now. Please try again in a moment."
 
 class ChatBot:
-    def __init__(self):
-        self.conversation_history: Dict[str, List[dict]] = {}
-        self.current_topics: Dict[str, str] = {}  # Track current topic per connection
-        self.responses = RESPONSES
-        self.topics = TOPICS
-
-    def add_to_history(self, connection_id: str, message: str, is_bot: bool = False):
-        """Add a message to the conversation history."""
-        if connection_id not in self.conversation_history:
-            self.conversation_history[connection_id] = []
-        
-        self.conversation_history[connection_id].append({
-            "timestamp": datetime.now().isoformat(),
-            "content": message,
-            "is_bot": is_bot
-        })
-        
-        # Keep only last 10 messages
-        if len(self.conversation_history[connection_id]) > 10:
-            self.conversation_history[connection_id] = self.conversation_history[connection_id][-10:]
-
-    def get_response(self, message: str, connection_id: str) -> str:
+    """Transport-facing wrapper around the chat engine.
+
+    Conversation history is kept once, in the engine's session, as a
+    fixed-size ring buffer; ChatBot no longer stores its own copy.
+    """
+
+    def __init__(self, executor: Optional[ShardedExecutor] = None):
+        self.executor = executor if executor is not None else ShardedExecutor()
+
+    def get_history(self, connection_id: str) -> List[dict]:
+        """Return the recent messages of a connection, oldest first."""
+        return get_history(connection_id)
+
+    def release_session(self, session_id: str) -> bool:
+        """Drop the engine state kept for a connection's session."""
+        return end_session(session_id)
+
+    def get_response(self, message: str, connection_id: str, abandoned: Optional[threading.Event] = None) -> str:
         """Generate a response based on the input message and conversation history."""
-        # Add user message to history
-        self.add_to_history(connection_id, message)
-        
-        # Generate response using the new contextual system
-        response = get_contextual_response(
-            message, 
-            self.conversation_history.get(connection_id, []),
-            self.current_topics.get(connection_id)
-        )
-        
-        # Add bot response to history
-        self.add_to_history(connection_id, response, is_bot=True)
-        
-        return response
+        return get_contextual_response(message, session_id=connection_id, abandoned=abandoned)
+
+    async def respond(self, message: str, connection_id: str) -> str:
+        """Run get_response on the session's executor shard, off the event loop.
+
+        A turn that times out may already be running; it is told to throw
+        its result away, so the session does not change after the client
+        got the busy reply.
+        """
+        abandoned = threading.Event()
+        try:
+            return await self.executor.run(connection_id, self.get_response, message, connection_id, abandoned)
+        except ExecutorBusy:
+            abandoned.set()
+            return BUSY_RESPONSE
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -68,113 +89,276 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
-# Initialize chatbot
-chatbot = ChatBot()
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+# HTTP clients identify their conversation with this cookie or header
+SESSION_COOKIE = "conversify_session"
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE_MAX_AGE = 7 * 24 * 3600
+_SESSION_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
 
-    async def connect(self, websocket: WebSocket) -> str:
-        await websocket.accept()
-        connection_id = f"conn_{len(self.active_connections) + 1}_{datetime.now().timestamp()}"
-        self.active_connections[connection_id] = websocket
-        logger.info(f"New WebSocket connection accepted: {connection_id}")
-        return connection_id
+def resolve_http_session(request: Request) -> str:
+    """Return the caller's session token, issuing a new one if missing or malformed."""
+    token = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if token and _SESSION_TOKEN_RE.match(token):
+        return token
+    return secrets.token_urlsafe(18)
 
-    def disconnect(self, connection_id: str):
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
-            logger.info(f"WebSocket connection removed: {connection_id}")
+# Initialize chatbot
+chatbot = ChatBot()
+REGISTRY.gauge(
+    "conversify_executor_queued_turns", "Turns waiting for an executor shard.",
+    function=chatbot.executor.pending,
+)
 
-manager = ConnectionManager()
+# Resume tokens are logged with the conversations, so WebSocket sessions survive restarts too
+manager = ConnectionManager(
+    release_session=chatbot.release_session,
+    resumable=ResumeRegistry(journal=chat_engine.journal),
+)
+REGISTRY.gauge(
+    "conversify_active_connections", "Open WebSocket connections.",
+    function=lambda: len(manager.active_connections),
+)
+REGISTRY.gauge(
+    "conversify_ws_detached_sessions", "WebSocket sessions waiting to be resumed.",
+    function=lambda: len(manager.resumable.detached),
+)
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
-    connection_id = await manager.connect(websocket)
+    codec = negotiate(websocket.scope.get("subprotocols", []))
+    connection_id = await manager.connect(websocket, codec)
+    if connection_id is None:
+        return
+    # Numbers and buffers messages once the client has asked to be resumable
+    send = manager.sender(connection_id)
+    # A reader too slow to take a chunk is cut off; the client reconnects and resumes
+    stream = StreamSlot(send, close=lambda: manager.close(connection_id, CLOSE_POLICY_VIOLATION, SLOW_READER))
     try:
         while True:
-            data = await websocket.receive_text()
-            logger.info(f"Received message from {connection_id}: {data}")
+            data = await receive_frame(websocket)
+            refused = manager.admit(connection_id, data)
+            if refused == HEARTBEAT:
+                continue
+            if refused == TOO_LARGE:
+                await manager.close(connection_id, CLOSE_TOO_BIG, TOO_LARGE)
+                break
+            if refused == RATE_LIMITED:
+                await send(RATE_LIMITED_REPLY)
+                continue
+            logger.info("Received message", extra={"connection_id": connection_id, "payload": data})
             
             try:
-                message = json.loads(data)
-                response = chatbot.get_response(message["content"], connection_id)
-                await websocket.send_json({
-                    "type": "message",
-                    "content": response
-                })
+                with _DECODE_SECONDS.time():
+                    decoded = codec.decode(data)
+                messages = []
+                for message in decoded:
+                    kind = message.get("type")
+                    if kind == "resume":
+                        # Not numbered itself; it tells the client where numbering stands
+                        await manager.resume(connection_id, message.get("token"), message.get("ack", 0))
+                        continue
+                    if "ack" in message:
+                        manager.ack(connection_id, message["ack"])
+                    if kind not in CONTROL_MESSAGES:
+                        messages.append(message)
+                if not messages:
+                    continue
+                if not manager.admit_batch(connection_id, len(messages)):
+                    await send(RATE_LIMITED_REPLY)
+                    continue
+                # A new message supersedes whatever answer is still streaming
+                await stream.cancel()
+                session_id = manager.session_id(connection_id)
+                if len(messages) == 1:
+                    message = messages[0]
+                    with _GET_RESPONSE_SECONDS.time():
+                        response = await chatbot.respond(message["content"], session_id)
+                    if message.get("stream"):
+                        await stream.start(response)
+                        continue
+                    await send({
+                        "type": "message",
+                        "content": response
+                    })
+                else:
+                    # A multi-message frame is answered in order with one frame; nothing is streamed
+                    replies = []
+                    for message in messages:
+                        with _GET_RESPONSE_SECONDS.time():
+                            response = await chatbot.respond(message["content"], session_id)
+                        replies.append({"type": "message", "content": response})
+                    await send(replies)
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
-                await websocket.send_json({
+                TRANSPORT_ERRORS.labels("websocket").inc()
+                await send({
                     "type": "error",
                     "content": "I apologize, but I'm having trouble understanding. Could you rephrase that?"
                 })
     except WebSocketDisconnect:
-        manager.disconnect(connection_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
+    finally:
+        await stream.cancel(notify=False)
+        # Resumable sessions are detached, not released, so the client can come back
         manager.disconnect(connection_id)
 
+@app.on_event("shutdown")
+async def stop_connection_reaper():
+    await manager.shutdown()
+
+@app.on_event("shutdown")
+async def stop_executor():
+    # Connections have drained by now, so the queues are short
+    await run_in_threadpool(chatbot.executor.shutdown)
+
+def require_admin(request: Request) -> None:
+    """Allow admin endpoints only when CONVERSIFY_ADMIN_TOKEN is set and matches."""
+    expected = os.getenv("CONVERSIFY_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    provided = request.headers.get("X-Admin-Token", "")
+    if not secrets.compare_digest(provided.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
 # API routes
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint for monitoring."""
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """Expose counters, gauges and stage timings for a Prometheus scraper."""
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/api/admin/knowledge/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_knowledge():
+    """Rebuild the knowledge index in the background and swap it in when ready."""
+    chat_engine.knowledge.reload_in_background()
+    return {"status": "reloading", "entries": len(chat_engine.knowledge.snapshot.index)}
+
+stack_sampler = StackSampler()
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(
+    seconds: float = Query(5.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+):
+    """Sample every thread's stack for a while and return the collapsed stacks."""
+    try:
+        stacks, samples = await run_in_threadpool(stack_sampler.sample, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {"seconds": seconds, "samples": samples, "stacks": dict(stacks.most_common())}
+    return PlainTextResponse(render_collapsed(stacks), headers={"X-Profile-Samples": str(samples)})
+
+@app.get("/api/admin/slow-turns", dependencies=[Depends(require_admin)])
+async def slow_turns():
+    """The most recent turns slower than CONVERSIFY_SLOW_TURN_MS, oldest first."""
+    log = chat_engine.slow_turns
+    return {
+        "threshold_ms": log.threshold * 1000 if log.enabled else None,
+        "turns": log.recent(),
+    }
+
+@app.put("/api/admin/slow-turns", dependencies=[Depends(require_admin)])
+async def set_slow_turn_threshold(threshold_ms: Optional[float] = Query(None, gt=0)):
+    """Change the slow-turn threshold at runtime; omit it to switch capture off."""
+    chat_engine.slow_turns.threshold = threshold_ms / 1000 if threshold_ms is not None else None
+    return {"threshold_ms": threshold_ms}
+
 @app.get("/api/chat")
-async def chat_http(message: str = Query(..., description="Message to send to the chatbot")):
+async def chat_http(
+    request: Request,
+    response: Response,
+    message: str = Query(..., description="Message to send to the chatbot")
+):
     """HTTP endpoint for chat when WebSocket is not available."""
+    token = resolve_http_session(request)
+    response.headers[SESSION_HEADER] = token
+    response.set_cookie(
+        SESSION_COOKIE, token, max_age=SESSION_COOKIE_MAX_AGE, httponly=True, samesite="lax"
+    )
     try:
-        response = chatbot.get_response(message, "http")
-        return {"type": "message", "content": response}
+        # Prefix keeps HTTP tokens from ever addressing a WebSocket connection's session
+        with _GET_RESPONSE_SECONDS.time():
+            reply = await chatbot.respond(message, f"http_{token}")
+        return {"type": "message", "content": reply}
     except Exception as e:
         logger.error(f"Error processing HTTP chat message: {str(e)}")
+        TRANSPORT_ERRORS.labels("http").inc()
         return JSONResponse(
             status_code=500,
             content={
                 "type": "error",
                 "content": "I apologize, but I'm having trouble understanding. Could you rephrase that?"
-            }
+            },
+            headers={SESSION_HEADER: token}
         )
 
-from fastapi.staticfiles import StaticFiles
+batch_runner = BatchRunner(chat_engine)
+
+@app.post("/api/chat/batch", dependencies=[Depends(require_admin)])
+async def chat_batch(batch: BatchRequest):
+    """Replay many turns or whole conversations in one request, streaming NDJSON results."""
+    turns = batch.turn_count()
+    if turns > BATCH_MAX_TURNS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_TURNS} turns per batch, got {turns}")
+    return StreamingResponse(batch_runner.stream(batch), media_type=NDJSON_MEDIA_TYPE)
 
 # Frontend paths
 frontend_path = Path(__file__).parent.parent.parent / "frontend"
 
-# Mount static files
-app.mount("/js", StaticFiles(directory=str(frontend_path / "js")), name="javascript")
-app.mount("/styles", StaticFiles(directory=str(frontend_path / "styles")), name="styles")
+# Every frontend file is read and compressed once, at import time
+static_assets = StaticAssetCache(frontend_path).load()
+
+
+def _serve_asset(request: Request, relative: str) -> Response:
+    asset = static_assets.get(relative)
+    if asset is None:
+        oversized = static_assets.uncached.get(relative)
+        if oversized is not None:
+            return FileResponse(str(oversized))
+        # Client-side routing: unknown paths get the index page
+        asset = static_assets.get("index.html")
+    return static_assets.response(request, asset)
+
 
 # Serve HTML files directly
 @app.get("/")
-async def serve_index():
+async def serve_index(request: Request):
     """Serve the index page."""
-    return FileResponse(str(frontend_path / "index.html"))
+    return _serve_asset(request, "index.html")
 
 @app.get("/about")
-async def serve_about():
+async def serve_about(request: Request):
     """Serve the about page."""
-    return FileResponse(str(frontend_path / "about.html"))
+    return _serve_asset(request, "about.html")
 
 @app.get("/privacy")
-async def serve_privacy():
+async def serve_privacy(request: Request):
     """Serve the privacy policy page."""
-    return FileResponse(str(frontend_path / "privacy.html"))
+    return _serve_asset(request, "privacy.html")
 
 @app.get("/terms")
-async def serve_terms():
+async def serve_terms(request: Request):
     """Serve the terms of service page."""
-    return FileResponse(str(frontend_path / "terms.html"))
+    return _serve_asset(request, "terms.html")
 
 # Catch-all route for other static files
 @app.get("/{full_path:path}")
-async def serve_static(full_path: str):
+async def serve_static(request: Request, full_path: str):
     """Serve static files or return index.html for client-side routing."""
-    file_path = frontend_path / full_path
-    if file_path.exists() and file_path.is_file():
-        return FileResponse(str(file_path))
-    return FileResponse(str(frontend_path / "index.html"))
+    if full_path.startswith("static/") and static_assets.get(full_path) is None:
+        # The subpages link to /static/..., which vercel.json maps onto frontend/
+        full_path = full_path[len("static/"):]
+    return _serve_asset(request, full_path)
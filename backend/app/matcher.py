@@ -0,0 +1,123 @@
+"""Compiled keyword matcher used to detect topics and intents in a message."""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+import re
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# category -> label -> keywords or phrases. Labels are listed in priority
+# order: when several labels of one category match, the first one wins.
+DEFAULT_KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "topic": {
+        "python": ["python", "py", "pip"],
+        "web_frameworks": ["framework", "frameworks", "django", "flask", "fastapi", "web"],
+        "data_science": ["data", "analysis", "machine learning", "visualization", "visualisation"],
+    },
+    "greeting": {
+        "greeting": ["hi", "hello", "hey", "greetings"],
+    },
+    "deep_dive": {
+        "deep_dive": ["how", "explain", "details", "detail", "example", "examples"],
+    },
+    "compare": {
+        "compare": ["compare", "comparison", "difference", "differences", "vs", "versus"],
+    },
+    "framework": {
+        "django": ["django"],
+        "flask": ["flask"],
+        "fastapi": ["fastapi"],
+    },
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case ``text`` and split it into alphanumeric word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+@dataclass
+class MessageMatch:
+    """Every keyword hit found in one message, grouped by category."""
+    tokens: List[str]
+    hits: Dict[str, List[str]] = field(default_factory=dict)
+
+    def labels(self, category: str) -> List[str]:
+        """Matched labels for ``category`` in priority order."""
+        return self.hits.get(category, [])
+
+    def first(self, category: str) -> Optional[str]:
+        """Highest priority label matched for ``category``, if any."""
+        labels = self.hits.get(category)
+        return labels[0] if labels else None
+
+    def has(self, category: str, label: Optional[str] = None) -> bool:
+        labels = self.hits.get(category)
+        if not labels:
+            return False
+        return label is None or label in labels
+
+    @property
+    def topic(self) -> Optional[str]:
+        return self.first("topic")
+
+
+class KeywordMatcher:
+    """Word-boundary keyword index compiled once and shared by every turn.
+
+    Keywords are indexed by their first token, so matching a message costs
+    one dict lookup per message token plus a short check for multi-word
+    phrases; it does not grow with the number of keywords. Whole tokens are
+    compared, so "py" no longer matches "happy" and "hi" no longer matches
+    "this".
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, Sequence[str]]] = DEFAULT_KEYWORDS):
+        # first token -> [(remaining tokens, category, label)]
+        self._index: Dict[str, List[Tuple[Tuple[str, ...], str, str]]] = {}
+        # (category, label) -> priority within its category
+        self._priority: Dict[Tuple[str, str], int] = {}
+        for category, labels in keywords.items():
+            for priority, (label, phrases) in enumerate(labels.items()):
+                self._priority[(category, label)] = priority
+                for phrase in phrases:
+                    tokens = tokenize(phrase)
+                    if not tokens:
+                        raise ValueError(f"Keyword {phrase!r} for {category}/{label} has no word characters")
+                    self._index.setdefault(tokens[0], []).append((tuple(tokens[1:]), category, label))
+
+    def labels(self, category: str) -> List[str]:
+        """Every label of ``category`` in priority order."""
+        ranked = [(priority, label) for (name, label), priority in self._priority.items() if name == category]
+        return [label for _, label in sorted(ranked)]
+
+    def vocabulary(self, categories: Iterable[str]) -> FrozenSet[str]:
+        """Every token used by the keywords of ``categories``."""
+        wanted = set(categories)
+        return frozenset(
+            token
+            for first, candidates in self._index.items()
+            for tail, category, _ in candidates
+            if category in wanted
+            for token in (first, *tail)
+        )
+
+    def match(self, message: str) -> MessageMatch:
+        """Tokenize ``message`` once and collect all category hits in one pass."""
+        tokens = tokenize(message)
+        found: Dict[str, set] = {}
+        index = self._index
+        for position, token in enumerate(tokens):
+            candidates = index.get(token)
+            if candidates is None:
+                continue
+            for tail, category, label in candidates:
+                if tail and tuple(tokens[position + 1:position + 1 + len(tail)]) != tail:
+                    continue
+                found.setdefault(category, set()).add(label)
+
+        priority = self._priority
+        hits = {
+            category: sorted(labels, key=lambda label: priority[(category, label)])
+            for category, labels in found.items()
+        }
+        return MessageMatch(tokens=tokens, hits=hits)
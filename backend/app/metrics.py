@@ -0,0 +1,308 @@
+"""In-process metrics exposed in the Prometheus text format."""
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+import bisect
+import math
+import threading
+import time
+
+# Upper bounds in seconds; most stages of a turn take well under a millisecond
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Threads currently inside trace_stages(); timers skip the lookup while it is 0
+_tracing = 0
+_trace_lock = threading.Lock()
+_trace_local = threading.local()
+
+
+@contextmanager
+def trace_stages() -> Iterator[List[Tuple[str, float]]]:
+    """Collect the (label, seconds) of every histogram timer this thread finishes inside the block."""
+    global _tracing
+    stages: List[Tuple[str, float]] = []
+    previous = getattr(_trace_local, "stages", None)
+    _trace_local.stages = stages
+    with _trace_lock:
+        _tracing += 1
+    try:
+        yield stages
+    finally:
+        with _trace_lock:
+            _tracing -= 1
+        _trace_local.stages = previous
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Return the child for one combination of label values, creating it once."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                key = tuple(str(value) for value in values)
+                child = self._children.setdefault(key, self._new_child(key))
+        return child
+
+    def _new_child(self, values: Tuple[str, ...]):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def get(self) -> float:
+        return self.value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def _new_child(self, values: Tuple[str, ...]) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, or be read from ``function`` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        if function is not None and labelnames:
+            raise ValueError("Callback gauges cannot have labels")
+
+    def _new_child(self, values: Tuple[str, ...]) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def render(self) -> List[str]:
+        if self.function is None:
+            return super().render()
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {_format_value(self.function())}",
+        ]
+
+
+class Collector(_Metric):
+    """Values read at scrape time from ``function``, keyed by the value of one label.
+
+    For components that already keep their own counters, such as the
+    session store and the response cache.
+    """
+
+    def __init__(self, name: str, documentation: str, label: str,
+                 function: Callable[[], Dict[str, float]], kind: str = "gauge"):
+        super().__init__(name, documentation, (label,))
+        self.function = function
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for value, number in sorted(self.function().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, (str(value),))} {_format_value(number)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "lock", "label")
+
+    def __init__(self, bounds: Tuple[float, ...], label: str = ""):
+        self.bounds = bounds
+        # Names the child in stage traces, e.g. "detect_topic"
+        self.label = label
+        # One slot per bound plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.started
+        self.child.observe(elapsed)
+        if _tracing:
+            stages = getattr(_trace_local, "stages", None)
+            if stages is not None:
+                stages.append((self.child.label, elapsed))
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self, values: Tuple[str, ...]) -> _HistogramChild:
+        return _HistogramChild(self.buckets, ",".join(values) or self.name)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default().time()
+
+    def _render_child(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for a scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def collector(self, name: str, documentation: str, label: str,
+                  function: Callable[[], Dict[str, float]], kind: str = "gauge") -> Collector:
+        return self.register(Collector(name, documentation, label, function, kind))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """The text exposition format (version 0.0.4) of every metric."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+# Starlette appends "; charset=utf-8" to text responses
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "conversify_stage_seconds", "Time spent in each stage of a chat turn.", ["stage"]
+)
+MESSAGES = REGISTRY.counter(
+    "conversify_messages_total", "Chat turns answered, by resulting state and topic.", ["state", "topic"]
+)
+ERRORS = REGISTRY.counter(
+    "conversify_errors_total", "Chat turns that failed, by state and topic at the time.", ["state", "topic"]
+)
+TRANSPORT_ERRORS = REGISTRY.counter(
+    "conversify_transport_errors_total", "Messages that could not be decoded or answered.", ["transport"]
+)
@@ -0,0 +1,133 @@
+"""Opt-in diagnostics: an on-demand stack sampler and a log of slow turns."""
+from typing import Callable, Counter, Deque, Dict, List, Optional, Tuple
+from collections import Counter as CounterType, deque
+from datetime import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+from backend.app.logging_setup import PAYLOAD_CHARS, truncate
+from backend.app.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 60.0
+DEFAULT_SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 128
+
+SLOW_TURNS = REGISTRY.counter("conversify_slow_turns_total", "Turns slower than the slow-turn threshold.")
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is already running."""
+
+
+class StackSampler:
+    """Samples the Python stack of every thread at a fixed interval.
+
+    Nothing runs between profiles: sampling happens only inside
+    ``sample()``, on the calling thread, which leaves itself out. The
+    result is in collapsed-stack form (``thread;outer;...;inner count``),
+    which flamegraph.pl, speedscope and most flame graph viewers read.
+    Only one profile runs at a time.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, max_depth: int = MAX_STACK_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._running = threading.Lock()
+
+    def _collapse(self, frame, thread_name: str) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        names.append(thread_name)
+        return ";".join(reversed(names))
+
+    def sample(self, seconds: float, interval: Optional[float] = None) -> Tuple[Counter[str], int]:
+        """Sample for ``seconds``; returns stack counts and the number of samples taken."""
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            interval = interval if interval is not None else self.interval
+            me = threading.get_ident()
+            stacks: Counter[str] = CounterType()
+            samples = 0
+            deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        stacks[self._collapse(frame, names.get(ident, f"thread-{ident}"))] += 1
+                samples += 1
+                time.sleep(interval)
+            return stacks, samples
+        finally:
+            self._running.release()
+
+
+def render_collapsed(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class SlowTurnLog:
+    """Keeps a per-stage breakdown of every turn slower than ``threshold`` seconds.
+
+    Disabled while ``threshold`` is None, in which case the engine skips
+    stage tracing entirely. Each slow turn is logged, counted, kept in a
+    bounded list for the admin endpoint and passed to every hook.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, keep: int = 100):
+        self.threshold = threshold
+        self.turns: Deque[dict] = deque(maxlen=keep)
+        self.hooks: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SlowTurnLog":
+        """Enabled when ``CONVERSIFY_SLOW_TURN_MS`` is set."""
+        threshold_ms = os.getenv("CONVERSIFY_SLOW_TURN_MS")
+        return cls(
+            threshold=float(threshold_ms) / 1000 if threshold_ms else None,
+            keep=int(os.getenv("CONVERSIFY_SLOW_TURN_KEEP", 100)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def record(self, session_id: str, seconds: float, stages: List[Tuple[str, float]],
+               state: Optional[str], topic: Optional[str], message: str) -> dict:
+        breakdown: Dict[str, float] = {}
+        for stage, elapsed in stages:
+            breakdown[stage] = breakdown.get(stage, 0.0) + elapsed
+        turn = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "session_id": session_id,
+            "ms": round(seconds * 1000, 3),
+            "stages_ms": {stage: round(elapsed * 1000, 3) for stage, elapsed in breakdown.items()},
+            # Time not covered by any timed stage: locking, session lookup, journaling
+            "untimed_ms": round((seconds - sum(breakdown.values())) * 1000, 3),
+            "state": state,
+            "topic": topic,
+            "message": truncate(message, PAYLOAD_CHARS),
+        }
+        with self._lock:
+            self.turns.append(turn)
+        SLOW_TURNS.inc()
+        logger.warning(f"Slow turn: {turn['ms']} ms", extra={"slow_turn": turn})
+        for hook in list(self.hooks):
+            try:
+                hook(turn)
+            except Exception as e:
+                logger.error(f"Slow-turn hook failed: {e!r}")
+        return turn
+
+    def recent(self) -> List[dict]:
+        with self._lock:
+            return list(self.turns)
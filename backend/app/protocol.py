@@ -0,0 +1,103 @@
+"""Wire formats for /ws/chat, chosen per connection through the WebSocket subprotocol."""
+from typing import Any, List, Optional, Sequence, Union
+import json
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # Without msgpack only the JSON protocol is offered
+    msgpack = None
+
+JSON_SUBPROTOCOL = "conversify.v1.json"
+MSGPACK_SUBPROTOCOL = "conversify.v1.msgpack"
+
+# A client frame may carry a list of messages instead of a single one
+MAX_BATCH_MESSAGES = 16
+
+Frame = Union[str, bytes]
+
+
+class ProtocolError(ValueError):
+    """A frame that does not hold a message or a list of messages."""
+
+
+class Codec:
+    """Encodes server messages and decodes client frames for one wire format.
+
+    ``subprotocol`` is echoed in the handshake; the default JSON codec has
+    none, so clients that ask for no subprotocol keep working unchanged.
+    """
+    name = "json"
+    subprotocol: Optional[str] = None
+
+    def __init__(self):
+        # Heartbeat replies are recognised by their exact encoding, undecoded
+        self.pong = self.encode({"type": "pong"})
+
+    def encode(self, message: Any) -> Frame:
+        return json.dumps(message, separators=(",", ":"))
+
+    def loads(self, data: Frame) -> Any:
+        return json.loads(data)
+
+    def decode(self, data: Frame) -> List[dict]:
+        """The messages in one client frame, in order."""
+        payload = self.loads(data)
+        messages = payload if isinstance(payload, list) else [payload]
+        if not messages or len(messages) > MAX_BATCH_MESSAGES:
+            raise ProtocolError(f"A frame must hold 1 to {MAX_BATCH_MESSAGES} messages")
+        if not all(isinstance(message, dict) for message in messages):
+            raise ProtocolError("Every message must be an object")
+        return messages
+
+    async def send(self, websocket: WebSocket, message: Any) -> None:
+        frame = self.encode(message)
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+
+class JsonCodec(Codec):
+    """JSON text frames, requested explicitly with the versioned subprotocol."""
+    subprotocol = JSON_SUBPROTOCOL
+
+
+class MsgpackCodec(Codec):
+    """msgpack binary frames."""
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def loads(self, data: Frame) -> Any:
+        if isinstance(data, str):
+            # Tolerate a client that falls back to text frames
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+DEFAULT_CODEC = Codec()
+CODECS = {JSON_SUBPROTOCOL: JsonCodec()}
+if msgpack is not None:
+    CODECS[MSGPACK_SUBPROTOCOL] = MsgpackCodec()
+
+
+def negotiate(requested: Sequence[str]) -> Codec:
+    """The first subprotocol the client offered that we support, else plain JSON."""
+    for subprotocol in requested:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec
+    return DEFAULT_CODEC
+
+
+async def receive_frame(websocket: WebSocket) -> Frame:
+    """The next text or binary frame; raises WebSocketDisconnect when the client leaves."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes", b"")
@@ -0,0 +1,108 @@
+"""Pre-rendered cache for responses that only depend on static knowledge."""
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Tuple
+from types import MappingProxyType
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+Renderer = Callable[..., str]
+
+
+class _Generation:
+    """The source responses are rendered from and everything rendered from it."""
+    __slots__ = ("source", "entries", "lazy")
+
+    def __init__(self, source: Any, entries: Mapping[Tuple[Hashable, ...], str]):
+        self.source = source
+        self.entries = entries
+        self.lazy: Dict[Tuple[Hashable, ...], str] = {}
+
+
+class ResponseCache:
+    """Renders knowledge-base answers once and serves them from memory.
+
+    Responses are rendered from a ``source``, such as the current
+    knowledge, which every renderer gets as its first argument. Each
+    response kind has a renderer and, optionally, the argument tuples to
+    render eagerly. Eager results live in a read-only mapping; anything
+    else is rendered on first use and memoised. ``prepare`` renders a new
+    source without touching the live one and returns a function that
+    swaps the source and its responses in with a single assignment, so
+    readers never see a half-built cache or answers from mixed sources.
+    """
+
+    def __init__(self, source: Any = None, max_lazy_entries: int = 4096):
+        self.max_lazy_entries = max_lazy_entries
+        self._renderers: Dict[str, Renderer] = {}
+        self._eager_keys: Dict[str, Callable[[Any], Iterable[Tuple]]] = {}
+        self._generation = _Generation(source, MappingProxyType({}))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    @property
+    def source(self) -> Any:
+        return self._generation.source
+
+    def register(self, kind: str, renderer: Renderer,
+                 keys: Callable[[Any], Iterable[Tuple]] = lambda source: ()) -> None:
+        """Add a response kind; ``keys(source)`` lists the arguments to pre-render."""
+        self._renderers[kind] = renderer
+        self._eager_keys[kind] = keys
+
+    def prepare(self, source: Any) -> Callable[[], int]:
+        """Render every eager entry for ``source``; call the result to swap them in.
+
+        Rendering errors propagate from here, before anything is swapped.
+        """
+        entries = {}
+        for kind, keys in self._eager_keys.items():
+            renderer = self._renderers[kind]
+            for args in keys(source):
+                entries[(kind, *args)] = renderer(source, *args)
+        generation = _Generation(source, MappingProxyType(entries))
+
+        def install() -> int:
+            with self._lock:
+                self._generation = generation
+                self.rebuilds += 1
+            logger.debug(f"Response cache rebuilt with {len(entries)} entries")
+            return len(entries)
+
+        return install
+
+    def rebuild(self, source: Any = None) -> int:
+        """Re-render every eager entry, for a new ``source`` if given, and drop memoised ones."""
+        return self.prepare(self.source if source is None else source)()
+
+    def get(self, kind: str, *args: Hashable) -> str:
+        """Return the rendered response for ``kind`` and ``args``."""
+        generation = self._generation
+        key = (kind, *args)
+        text = generation.entries.get(key)
+        if text is None:
+            text = generation.lazy.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+
+        self.misses += 1
+        text = self._renderers[kind](generation.source, *args)
+        with self._lock:
+            # Rendered from this generation's source, so it is memoised there and nowhere else
+            if len(generation.lazy) < self.max_lazy_entries:
+                generation.lazy[key] = text
+        return text
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry counts and hit/miss counters."""
+        generation = self._generation
+        return {
+            "entries": len(generation.entries),
+            "lazy_entries": len(generation.lazy),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+        }
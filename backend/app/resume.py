@@ -0,0 +1,166 @@
+"""Resumable WebSocket sessions: resume tokens and a bounded outbox of unacknowledged frames."""
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+import hashlib
+import os
+import secrets
+import time
+
+from backend.app.conversation_log import ConversationLog
+from backend.app.metrics import REGISTRY
+
+# Detached sessions can be resumed for this many seconds before they are released
+RESUME_TTL = float(os.getenv("CONVERSIFY_WS_RESUME_TTL", 120.0))
+# Unacknowledged messages kept per session; older ones are dropped first
+OUTBOX_SIZE = int(os.getenv("CONVERSIFY_WS_OUTBOX_SIZE", 64))
+# Conversation log entries mapping a resume token to its chat session
+TOKEN_LOG_PREFIX = "resume_"
+
+RESUMES = REGISTRY.counter(
+    "conversify_ws_resumes_total", "WebSocket resume handshakes, by result.", ["result"]
+)
+REPLAYED_MESSAGES = REGISTRY.counter(
+    "conversify_ws_replayed_messages_total", "Messages replayed to resumed WebSocket sessions."
+)
+
+
+class Outbox:
+    """Numbers outbound messages and keeps the last ``size`` until the client acknowledges them."""
+    __slots__ = ("size", "messages", "seq", "open_stream")
+
+    def __init__(self, size: int = OUTBOX_SIZE):
+        self.size = size
+        self.messages: Deque[dict] = deque()
+        self.seq = 0
+        # The stream that has started but not ended, so a detach can close it
+        self.open_stream: Optional[int] = None
+
+    def push(self, message: Any) -> Any:
+        """Stamp ``message`` (or each message of a list) with the next ``seq`` and keep it."""
+        if isinstance(message, list):
+            return [self.push(item) for item in message]
+        self.seq += 1
+        stamped = dict(message, seq=self.seq)
+        kind = message.get("type")
+        if kind == "stream_start":
+            self.open_stream = message.get("id")
+        elif kind == "stream_end" and message.get("id") == self.open_stream:
+            self.open_stream = None
+        self.messages.append(stamped)
+        if len(self.messages) > self.size:
+            self.messages.popleft()
+        return stamped
+
+    def ack(self, seq: int) -> None:
+        """Forget every message up to and including ``seq``."""
+        messages = self.messages
+        while messages and messages[0]["seq"] <= seq:
+            messages.popleft()
+
+    def since(self, seq: int) -> Tuple[List[dict], int]:
+        """Messages after ``seq``, and how many of those were already dropped."""
+        seq = max(0, min(seq, self.seq))
+        first = self.seq - len(self.messages) + 1
+        missed = max(0, first - seq - 1)
+        return [message for message in self.messages if message["seq"] > seq], missed
+
+
+class ResumableSession:
+    """A chat session that outlives its WebSocket for ``RESUME_TTL`` seconds."""
+    __slots__ = ("token", "session_id", "connection_id", "outbox", "detached_at")
+
+    def __init__(self, token: str, session_id: str, connection_id: str, outbox: Outbox):
+        self.token = token
+        self.session_id = session_id
+        self.connection_id: Optional[str] = connection_id
+        self.outbox = outbox
+        self.detached_at: Optional[float] = None
+
+    def detach(self, now: float) -> None:
+        self.connection_id = None
+        self.detached_at = now
+        if self.outbox.open_stream is not None:
+            # The rest of the stream is lost with the socket; the replay ends it
+            self.outbox.push({"type": "stream_end", "id": self.outbox.open_stream, "cancelled": True})
+
+
+def _token_key(token: str) -> str:
+    # Only a digest reaches the disk, so the log does not hold usable tokens
+    return TOKEN_LOG_PREFIX + hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+class ResumeRegistry:
+    """Resume tokens of this worker's sessions, attached or waiting to be resumed.
+
+    Tokens and outboxes live in memory. With a conversation log, each
+    token is also logged next to the session's turns, so after a restart
+    a client presenting its token gets its conversation back, though
+    not the messages that were still unacknowledged. With several
+    workers, a client can only resume on the worker that issued its
+    token; elsewhere it simply gets a new session.
+    """
+
+    def __init__(self, ttl: float = RESUME_TTL, outbox_size: int = OUTBOX_SIZE,
+                 journal: Optional[ConversationLog] = None):
+        self.ttl = ttl
+        self.outbox_size = outbox_size
+        self.journal = journal
+        self.sessions: Dict[str, ResumableSession] = {}
+        # Detached sessions in detach order, which is also expiry order
+        self.detached: "OrderedDict[str, ResumableSession]" = OrderedDict()
+
+    def open(self, session_id: str, connection_id: str) -> ResumableSession:
+        """Make ``session_id`` resumable under a new token."""
+        token = secrets.token_urlsafe(24)
+        session = ResumableSession(token, session_id, connection_id, Outbox(self.outbox_size))
+        self.sessions[token] = session
+        if self.journal is not None:
+            self.journal.link(_token_key(token), session_id)
+        return session
+
+    def get(self, token: Optional[str]) -> Optional[ResumableSession]:
+        if not isinstance(token, str):
+            return None
+        session = self.sessions.get(token)
+        if session is None and self.journal is not None:
+            session = self._recover(token)
+        return session
+
+    def _recover(self, token: str) -> Optional[ResumableSession]:
+        """Rebuild a session issued before a restart from the conversation log."""
+        session_id = self.journal.linked(_token_key(token))
+        if session_id is None:
+            return None
+        session = ResumableSession(token, session_id, None, Outbox(self.outbox_size))
+        session.detached_at = time.monotonic()
+        self.sessions[token] = session
+        self.detached[token] = session
+        return session
+
+    def attach(self, session: ResumableSession, connection_id: str) -> None:
+        self.detached.pop(session.token, None)
+        session.connection_id = connection_id
+        session.detached_at = None
+
+    def detach(self, session: ResumableSession, now: Optional[float] = None) -> None:
+        session.detach(time.monotonic() if now is None else now)
+        self.detached.pop(session.token, None)
+        self.detached[session.token] = session
+
+    def discard(self, session: ResumableSession) -> None:
+        self.sessions.pop(session.token, None)
+        self.detached.pop(session.token, None)
+        if self.journal is not None:
+            self.journal.end(_token_key(session.token))
+
+    def expire(self, now: Optional[float] = None) -> List[ResumableSession]:
+        """Drop and return the sessions that stayed detached longer than the TTL."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self.detached:
+            token, session = next(iter(self.detached.items()))
+            if now - session.detached_at <= self.ttl:
+                break
+            self.discard(session)
+            expired.append(session)
+        return expired
@@ -0,0 +1,231 @@
+"""File-backed knowledge base with a BM25 inverted index."""
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from pathlib import Path
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from backend.app.matcher import tokenize
+
+try:
+    import yaml
+except ImportError:  # YAML knowledge files are optional
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_KNOWLEDGE_BASE_PATH = DATA_DIR / "knowledge_base.json"
+DEFAULT_ENTRIES_DIR = DATA_DIR / "knowledge"
+
+STOPWORDS = frozenset("""
+a about an and are as at be but by can do does for from how i in is it its me my of on or so
+that the their them then there these this to use used using was what when where which who why
+will with you your
+""".split())
+
+
+@dataclass(frozen=True)
+class KnowledgeEntry:
+    """A free-text answer the engine can retrieve."""
+    id: str
+    title: str
+    text: str
+    topic: Optional[str] = None
+    keywords: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    entry: KnowledgeEntry
+    score: float
+
+
+def index_terms(text: str) -> List[str]:
+    """Tokens of ``text`` that carry meaning for retrieval."""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    """Okapi BM25 over knowledge entries.
+
+    BM25 term weights are folded into the posting lists when the index is
+    built, so answering a query only sums precomputed impacts for the
+    documents that contain a query term. Titles and keywords are indexed
+    with extra weight because they are short, curated descriptions of the
+    entry.
+    """
+
+    TITLE_WEIGHT = 2
+    KEYWORD_WEIGHT = 2
+
+    def __init__(self, entries: Sequence[KnowledgeEntry], k1: float = 1.2, b: float = 0.75):
+        self.entries: Tuple[KnowledgeEntry, ...] = tuple(entries)
+        # Topics at least one entry answers
+        self.topics: FrozenSet[str] = frozenset(entry.topic for entry in self.entries if entry.topic)
+        term_counts: List[Dict[str, int]] = []
+        lengths: List[int] = []
+        for entry in self.entries:
+            terms = index_terms(entry.text)
+            terms += index_terms(entry.title) * self.TITLE_WEIGHT
+            terms += index_terms(" ".join(entry.keywords)) * self.KEYWORD_WEIGHT
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            term_counts.append(counts)
+            lengths.append(len(terms))
+
+        document_count = len(self.entries)
+        average_length = (sum(lengths) / document_count) if document_count else 0.0
+        frequencies: Dict[str, int] = {}
+        for counts in term_counts:
+            for term in counts:
+                frequencies[term] = frequencies.get(term, 0) + 1
+
+        # term -> [(document number, BM25 impact)]
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc, counts in enumerate(term_counts):
+            norm = k1 * (1 - b + b * lengths[doc] / average_length) if average_length else k1
+            for term, tf in counts.items():
+                df = frequencies[term]
+                idf = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+                self.postings.setdefault(term, []).append((doc, idf * tf * (k1 + 1) / (tf + norm)))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, query: str, limit: int = 3) -> List[SearchHit]:
+        """Return up to ``limit`` entries ranked by BM25 score."""
+        return self.search_terms(index_terms(query), limit)
+
+    def search_terms(self, terms: Iterable[str], limit: int = 3) -> List[SearchHit]:
+        """Rank entries for already tokenized query terms."""
+        scores: Dict[int, float] = {}
+        postings = self.postings
+        for term in set(terms):
+            for doc, impact in postings.get(term, ()):
+                scores[doc] = scores.get(doc, 0.0) + impact
+        if not scores:
+            return []
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [SearchHit(self.entries[doc], score) for doc, score in best]
+
+
+def _read_records(path: Path) -> List[dict]:
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle if line.strip()]
+    if path.suffix == ".json":
+        with open(path, encoding="utf-8") as handle:
+            data = json.load(handle)
+    elif path.suffix in (".yaml", ".yml"):
+        if yaml is None:
+            logger.warning(f"Skipping {path}: install PyYAML to load YAML knowledge files")
+            return []
+        with open(path, encoding="utf-8") as handle:
+            data = yaml.safe_load(handle)
+    else:
+        return []
+    if isinstance(data, dict):
+        data = data.get("entries", [])
+    return list(data or [])
+
+
+def load_entries(directory: Path) -> List[KnowledgeEntry]:
+    """Load every JSON, JSONL and YAML entry file in ``directory``."""
+    entries = []
+    seen = set()
+    for path in sorted(Path(directory).glob("*")):
+        for record in _read_records(path):
+            entry = KnowledgeEntry(
+                id=str(record["id"]),
+                title=record["title"],
+                text=record["text"],
+                topic=record.get("topic"),
+                keywords=tuple(record.get("keywords", ())),
+            )
+            if entry.id in seen:
+                logger.warning(f"Duplicate knowledge entry {entry.id!r} in {path}; keeping the first")
+                continue
+            seen.add(entry.id)
+            entries.append(entry)
+    return entries
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """Structured knowledge plus the index built from the same files."""
+    knowledge_base: dict
+    index: InvertedIndex
+    loaded_at: float = field(default_factory=time.time)
+
+
+class KnowledgeStore:
+    """Loads knowledge files and hot-swaps them without blocking readers.
+
+    Readers always go through ``snapshot``, which is replaced with a single
+    assignment once a reload has finished building the new index, so a
+    request either sees the old knowledge or the new one, never a mix.
+
+    ``prepare`` builds whatever is derived from a new snapshot before it
+    goes live, and returns a function that installs it. If loading or
+    preparing fails, the previous snapshot and derived state stay in place.
+    """
+
+    def __init__(
+        self,
+        knowledge_base_path: Optional[Path] = None,
+        entries_dir: Optional[Path] = None,
+        prepare: Optional[Callable[[KnowledgeSnapshot], Callable[[], object]]] = None,
+    ):
+        self.knowledge_base_path = Path(
+            knowledge_base_path or os.getenv("CONVERSIFY_KNOWLEDGE_BASE", DEFAULT_KNOWLEDGE_BASE_PATH)
+        )
+        self.entries_dir = Path(entries_dir or os.getenv("CONVERSIFY_KNOWLEDGE_DIR", DEFAULT_ENTRIES_DIR))
+        self.prepare = prepare
+        self._reload_lock = threading.Lock()
+        self.snapshot = self._load()
+
+    def _load(self) -> KnowledgeSnapshot:
+        started = time.perf_counter()
+        with open(self.knowledge_base_path, encoding="utf-8") as handle:
+            knowledge_base = json.load(handle)
+        snapshot = KnowledgeSnapshot(knowledge_base, InvertedIndex(load_entries(self.entries_dir)))
+        logger.info(
+            f"Loaded {len(snapshot.index)} knowledge entries in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        return snapshot
+
+    def search(self, query: str, limit: int = 3) -> List[SearchHit]:
+        return self.snapshot.index.search(query, limit)
+
+    def search_terms(self, terms: Iterable[str], limit: int = 3) -> List[SearchHit]:
+        return self.snapshot.index.search_terms(terms, limit)
+
+    def reload(self) -> KnowledgeSnapshot:
+        """Rebuild from disk and swap the result in; concurrent reloads are serialised."""
+        with self._reload_lock:
+            snapshot = self._load()
+            install = self.prepare(snapshot) if self.prepare is not None else None
+            # Nothing can fail from here on, so the snapshot and its derived state go live together
+            self.snapshot = snapshot
+            if install is not None:
+                install()
+            return snapshot
+
+    def reload_in_background(self) -> threading.Thread:
+        """Start a reload on a daemon thread and return immediately."""
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Knowledge reload failed, keeping the previous version: {str(e)}")
+
+        thread = threading.Thread(target=run, name="knowledge-reload", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,241 @@
+"""Production launcher: pre-forked uvicorn workers sharing one preloaded app.
+
+    python -m backend.app.server --workers 4 --port 8000
+
+The master process imports the application once, binds the listening
+socket and forks the workers, so each worker starts with the app, its
+knowledge index and response cache already in memory (shared copy-on-write)
+instead of importing everything again. SIGTERM or SIGINT makes every
+worker stop accepting connections and finish in-flight work within
+``--graceful-timeout`` seconds; workers that crash are replaced.
+
+run_server.py remains the development entry point with auto-reload.
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from backend.app.logging_setup import configure_logging, shutdown_logging
+
+logger = logging.getLogger(__name__)
+
+APP = "backend.app.main:app"
+# A worker that dies sooner than this after starting counts as a failed start
+MIN_WORKER_LIFETIME = 5.0
+MAX_FAILED_STARTS = 5
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run ConversifyAI with production settings")
+    parser.add_argument("--host", default=os.getenv("CONVERSIFY_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("CONVERSIFY_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CONVERSIFY_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--loop", choices=["auto", "uvloop", "asyncio"], default="auto",
+                        help="event loop; auto picks uvloop when it is installed")
+    parser.add_argument("--http", choices=["auto", "httptools", "h11"], default="auto",
+                        help="HTTP parser; auto picks httptools when it is installed")
+    parser.add_argument("--ws", choices=["auto", "websockets", "wsproto"], default="auto")
+    parser.add_argument("--keep-alive", type=int, default=5, help="seconds to keep idle HTTP connections open")
+    parser.add_argument("--ws-ping-interval", type=float, default=20.0)
+    parser.add_argument("--ws-ping-timeout", type=float, default=20.0)
+    parser.add_argument("--ws-max-size", type=int, default=2 ** 20, help="largest accepted WebSocket message in bytes")
+    parser.add_argument("--no-ws-deflate", action="store_true",
+                        help="do not offer permessage-deflate compression to WebSocket clients")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds to drain connections on shutdown before they are closed")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="comma-separated proxy addresses whose X-Forwarded-For is trusted for the client IP")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--limit-concurrency", type=int, help="per-worker connection cap, answered with 503 beyond it")
+    parser.add_argument("--no-preload", action="store_true", help="import the app in each worker instead")
+    parser.add_argument("--access-log", action="store_true", help="log every HTTP request")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if args.loop == "uvloop" and not _available("uvloop"):
+        parser.error("--loop uvloop requires the uvloop package")
+    if args.http == "httptools" and not _available("httptools"):
+        parser.error("--http httptools requires the httptools package")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def build_config(args: argparse.Namespace, app) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop=args.loop,
+        http=args.http,
+        ws=args.ws,
+        ws_max_size=args.ws_max_size,
+        ws_ping_interval=args.ws_ping_interval,
+        ws_ping_timeout=args.ws_ping_timeout,
+        ws_per_message_deflate=not args.no_ws_deflate,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        # Per-IP limits key on the client address, which only trusted proxies may rewrite
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        access_log=args.access_log,
+        log_level=args.log_level,
+        # Server logs go through the application's queue-based logging
+        log_config=None,
+    )
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that reports how long its worker took to become ready."""
+
+    def __init__(self, config: uvicorn.Config, started_at: float, preloaded: bool):
+        super().__init__(config)
+        self.started_at = started_at
+        self.preloaded = preloaded
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        await super().startup(sockets=sockets)
+        if self.should_exit:
+            return
+        from backend.app.metrics import REGISTRY
+
+        elapsed = time.perf_counter() - self.started_at
+        loop = type(asyncio.get_running_loop())
+        REGISTRY.gauge(
+            "conversify_worker_startup_seconds", "Time from worker start to accepting connections.",
+            function=lambda: elapsed,
+        )
+        logger.info(
+            f"Worker {os.getpid()} ready in {elapsed * 1000:.1f} ms "
+            f"({'preloaded' if self.preloaded else 'cold'} app, "
+            f"loop={loop.__module__}.{loop.__name__}, http={self.config.http_protocol_class.__name__})"
+        )
+
+
+def _run_worker(args: argparse.Namespace, sock: socket.socket, app, started_at: float) -> int:
+    if app is None:
+        from backend.app.main import app
+    server = WorkerServer(build_config(args, app), started_at, preloaded=not args.no_preload)
+    server.run(sockets=[sock])
+    return 0 if server.started else 3
+
+
+class Master:
+    """Forks the workers, replaces crashed ones and coordinates shutdown."""
+
+    def __init__(self, args: argparse.Namespace, sock: socket.socket, app):
+        self.args = args
+        self.sock = sock
+        self.app = app
+        self.workers: Dict[int, float] = {}
+        self.stopping = False
+        self.failed_starts = 0
+
+    def spawn(self) -> None:
+        started_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal Ctrl-C reaches only the master,
+            # which then asks each worker to drain exactly once
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 1
+            try:
+                code = _run_worker(self.args, self.sock, self.app, started_at)
+            except BaseException:
+                logger.exception("Worker failed")
+            finally:
+                # os._exit skips atexit, so flush the log queue by hand
+                shutdown_logging()
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info(f"Received {signal.Signals(signum).name}, draining {len(self.workers)} workers")
+        self.stopping = True
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.args.workers):
+            self.spawn()
+        deadline = None
+        while self.workers:
+            if self.stopping and deadline is None:
+                # uvicorn's own drain timeout plus a margin for lifespan shutdown
+                deadline = time.monotonic() + self.args.graceful_timeout + 5
+            if deadline is not None and time.monotonic() > deadline:
+                for pid in list(self.workers):
+                    logger.warning(f"Worker {pid} did not drain in time; killing it")
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning(f"Worker {pid} exited with status {status}; starting a replacement")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                self.failed_starts += 1
+                if self.failed_starts >= MAX_FAILED_STARTS:
+                    logger.error("Workers keep failing on startup; shutting down")
+                    self.stop(signal.SIGTERM, None)
+                    continue
+            self.spawn()
+        logger.info("All workers stopped")
+        return 1 if self.failed_starts >= MAX_FAILED_STARTS else 0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if not hasattr(os, "fork"):
+        # Windows: no fork, so each worker process imports the app itself
+        uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers, loop=args.loop, http=args.http,
+                    ws_ping_interval=args.ws_ping_interval, ws_ping_timeout=args.ws_ping_timeout,
+                    timeout_keep_alive=args.keep_alive, timeout_graceful_shutdown=args.graceful_timeout)
+        return
+
+    app = None
+    if not args.no_preload:
+        started = time.perf_counter()
+        from backend.app.main import app
+        logger.info(f"Preloaded {APP} in {(time.perf_counter() - started) * 1000:.1f} ms")
+    else:
+        configure_logging()
+
+    sock = build_config(args, app or APP).bind_socket()
+    sock.set_inheritable(True)
+    logger.info(f"Listening on http://{args.host}:{args.port} with {args.workers} workers")
+    if args.workers == 1:
+        sys.exit(_run_worker(args, sock, app, time.perf_counter()))
+    sys.exit(Master(args, sock, app).run())
+
+
+if __name__ == "__main__":
+    main()
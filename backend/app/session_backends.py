@@ -0,0 +1,475 @@
+"""Shared session backends so several worker processes can serve one conversation."""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from backend.app.session_store import DEFAULT_TTL_SECONDS, SessionStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How long writes may wait before being flushed, and how long a locally
+# cached session is trusted before it is compared with the backend again
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_CACHE_TTL = 1.0
+DEFAULT_FLUSH_BATCH = 256
+PURGE_INTERVAL = 300.0
+
+
+class SessionBackend:
+    """Storage for serialised sessions shared between processes."""
+
+    def load(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def save_many(self, records: Dict[str, str]) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, session_ids: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Delete expired sessions, for backends that do not expire keys themselves."""
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(SessionBackend):
+    """Dictionary backend; shares sessions between stores in one process only."""
+
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[str]:
+        return self._data.get(session_id)
+
+    def save_many(self, records: Dict[str, str]) -> None:
+        with self._lock:
+            self._data.update(records)
+
+    def delete_many(self, session_ids: Iterable[str]) -> None:
+        with self._lock:
+            for session_id in session_ids:
+                self._data.pop(session_id, None)
+
+
+class SQLiteBackend(SessionBackend):
+    """Sessions in one SQLite file in WAL mode, shared by every worker on a host.
+
+    Each process opens its own connection, including processes forked
+    after the backend was created.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _expires(self) -> Optional[float]:
+        return time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+    def load(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT data FROM sessions WHERE id = ? AND (expires IS NULL OR expires > ?)",
+                (session_id, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_many(self, records: Dict[str, str]) -> None:
+        expires = self._expires()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                    [(session_id, data, expires) for session_id, data in records.items()],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete_many(self, session_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._connection().executemany(
+                "DELETE FROM sessions WHERE id = ?", [(session_id,) for session_id in session_ids]
+            )
+
+    def purge_expired(self) -> int:
+        """Delete sessions whose TTL has passed."""
+        with self._lock:
+            return self._connection().execute(
+                "DELETE FROM sessions WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+            ).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class KeyValueClient:
+    """Blocking client for ``backend.app.kv_server``.
+
+    Offers the ``get``/``set``/``delete`` subset of the redis-py API, so a
+    Redis client can be used with KeyValueBackend instead.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 7379, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._pid = os.getpid()
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._file = None
+
+    def _call(self, request: dict) -> dict:
+        payload = json.dumps(request).encode() + b"\n"
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None or self._pid != os.getpid():
+                        self._connect()
+                    self._sock.sendall(payload)
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("key-value server closed the connection")
+                    break
+                except OSError:
+                    self._close()
+                    if attempt == 2:
+                        raise
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(f"key-value server error: {response.get('error')}")
+        return response
+
+    def get(self, key: str) -> Optional[str]:
+        return self._call({"op": "get", "key": key})["value"]
+
+    def set(self, key: str, value: str, ex: Optional[float] = None) -> None:
+        self._call({"op": "set", "key": key, "value": value, "ttl": ex})
+
+    def set_many(self, items: Dict[str, str], ex: Optional[float] = None) -> None:
+        self._call({"op": "mset", "items": items, "ttl": ex})
+
+    def delete(self, *keys: str) -> int:
+        return self._call({"op": "delete", "keys": list(keys)})["deleted"]
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class KeyValueBackend(SessionBackend):
+    """Sessions in any key-value store with redis-py style get/set/delete."""
+
+    def __init__(self, client, prefix: str = "conversify:session:", ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, session_id: str) -> Optional[str]:
+        value = self.client.get(self.prefix + session_id)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def save_many(self, records: Dict[str, str]) -> None:
+        ttl = int(self.ttl_seconds) if self.ttl_seconds else None
+        items = {self.prefix + session_id: data for session_id, data in records.items()}
+        if hasattr(self.client, "set_many"):
+            self.client.set_many(items, ex=ttl)
+            return
+        for key, data in items.items():
+            self.client.set(key, data, ex=ttl)
+
+    def delete_many(self, session_ids: Iterable[str]) -> None:
+        keys = [self.prefix + session_id for session_id in session_ids]
+        if keys:
+            self.client.delete(*keys)
+
+    def close(self) -> None:
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+
+
+def backend_from_url(url: str, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS) -> Optional[SessionBackend]:
+    """Build a backend from ``memory://``, ``sqlite:///path.db`` or ``kv://host:port``.
+
+    An empty url or ``memory`` means no shared backend at all.
+    """
+    if not url or url == "memory":
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryBackend()
+    if parts.scheme == "sqlite":
+        # sqlite:///relative.db or sqlite:////absolute/path.db, as in SQLAlchemy
+        return SQLiteBackend(url[len("sqlite:///"):], ttl_seconds)
+    if parts.scheme == "kv":
+        return KeyValueBackend(KeyValueClient(parts.hostname or "127.0.0.1", parts.port or 7379), ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unsupported session backend {url!r}")
+
+
+_DELETED = object()
+
+
+class WriteBehindSessionStore(SessionStore[T]):
+    """Local session cache in front of a shared backend.
+
+    Reads go to the local store first and fall through to the backend on a
+    miss, or once a cached session has not been compared with the backend
+    for ``cache_ttl`` seconds and has no unsaved changes. Changes (reported
+    through ``resize``) and releases are queued and written in batches by a
+    background thread every ``flush_interval`` seconds. Workers therefore
+    only see each other's changes after a flush, so a client moving between
+    workers may briefly see its previous turn's state.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], T],
+        backend: SessionBackend,
+        encode: Callable[[T], dict],
+        decode: Callable[[str, dict], T],
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        flush_batch: int = DEFAULT_FLUSH_BATCH,
+        **kwargs,
+    ):
+        super().__init__(factory, **kwargs)
+        self.backend = backend
+        self._encode = encode
+        self._decode = decode
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.flush_batch = flush_batch
+        # session_id -> version of the copy held locally, and when it was last checked
+        self._versions: Dict[str, int] = {}
+        self._checked: Dict[str, float] = {}
+        # session_id -> (value, version) waiting to be written, or _DELETED
+        self._dirty: Dict[str, object] = {}
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+        self.counters.update({"backend_loads": 0, "restored": 0, "flushed": 0, "flush_errors": 0})
+        atexit.register(self.close)
+
+    def get(self, session_id: str) -> Optional[T]:
+        value = self._cached(session_id)
+        if value is not None:
+            return value
+        return self._read_through(session_id, create=False)
+
+    def get_or_create(self, session_id: str) -> T:
+        value = self._cached(session_id)
+        if value is not None:
+            return value
+        return self._read_through(session_id, create=True)
+
+    def _cached(self, session_id: str) -> Optional[T]:
+        """The local copy, if it is recent enough to use without asking the backend."""
+        with self._lock:
+            value = super().get(session_id)
+            if value is None:
+                return None
+            fresh = self._clock() - self._checked.get(session_id, float("-inf")) < self.cache_ttl
+            return value if fresh or session_id in self._dirty else None
+
+    def _read_through(self, session_id: str, create: bool) -> Optional[T]:
+        record = None
+        loaded = False
+        try:
+            data = self.backend.load(session_id)
+            record = json.loads(data) if data else None
+            loaded = True
+        except Exception as e:
+            logger.warning(f"Session backend load failed for {session_id}: {e!r}")
+        with self._lock:
+            self.counters["backend_loads"] += 1
+            current = super().get(session_id)
+            pending = self._dirty.get(session_id)
+            if loaded and record is None and pending is None and self._versions.get(session_id, 0) > 0:
+                # Saved before but gone now: released or expired by another worker
+                self._pop(session_id)
+                current = None
+            if pending is _DELETED:
+                record = None
+            elif pending is not None:
+                # Unsaved local changes win over whatever the backend holds
+                if current is None:
+                    current = pending[0]
+                    self.put(session_id, current)
+                    self._versions[session_id] = pending[1]
+                record = None
+            if record is not None and (current is None or record["version"] > self._versions.get(session_id, 0)):
+                current = self._decode(session_id, record["data"])
+                self.put(session_id, current)
+                self._versions[session_id] = record["version"]
+                self.counters["restored"] += 1
+            elif current is None and not create:
+                return None
+            if current is not None:
+                self._checked[session_id] = self._clock()
+                return current
+        # A new session is built outside the lock, since the factory may read the conversation log
+        current = super().get_or_create(session_id)
+        with self._lock:
+            self._checked[session_id] = self._clock()
+        return current
+
+    def resize(self, session_id: str, nbytes: int) -> None:
+        """Record the new size of a changed session and queue it for writing."""
+        with self._lock:
+            super().resize(session_id, nbytes)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            version = self._versions.get(session_id, 0) + 1
+            self._versions[session_id] = version
+            self._checked[session_id] = self._clock()
+            self._dirty[session_id] = (entry[0], version)
+            self._ensure_flusher()
+            if len(self._dirty) >= self.flush_batch:
+                self._wakeup.set()
+
+    def release(self, session_id: str) -> bool:
+        with self._lock:
+            released = super().release(session_id)
+            self._dirty[session_id] = _DELETED
+            self._ensure_flusher()
+            return released
+
+    def _pop(self, session_id: str) -> Optional[list]:
+        # Evicted sessions stay in the backend; anything unsaved is still in _dirty
+        self._versions.pop(session_id, None)
+        self._checked.pop(session_id, None)
+        return super()._pop(session_id)
+
+    def _ensure_flusher(self) -> None:
+        # Threads do not survive fork, so each worker process starts its own
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        next_purge = time.monotonic() + PURGE_INTERVAL
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() >= next_purge:
+                    next_purge = time.monotonic() + PURGE_INTERVAL
+                    self.backend.purge_expired()
+            except Exception as e:
+                logger.warning(f"Session flush failed, retrying: {e!r}")
+                time.sleep(min(1.0, self.flush_interval * 10))
+
+    def flush(self) -> int:
+        """Write every queued change to the backend now."""
+        written = 0
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    return written
+                batch: List[Tuple[str, object]] = []
+                for session_id in list(self._dirty)[:self.flush_batch]:
+                    batch.append((session_id, self._dirty.pop(session_id)))
+            records: Dict[str, str] = {}
+            deleted: List[str] = []
+            for session_id, pending in batch:
+                if pending is _DELETED:
+                    deleted.append(session_id)
+                else:
+                    value, version = pending
+                    records[session_id] = json.dumps({"version": version, "data": self._encode(value)})
+            try:
+                if records:
+                    self.backend.save_many(records)
+                if deleted:
+                    self.backend.delete_many(deleted)
+            except Exception:
+                with self._lock:
+                    self.counters["flush_errors"] += 1
+                    # Requeue unless a newer change arrived meanwhile
+                    for session_id, pending in batch:
+                        self._dirty.setdefault(session_id, pending)
+                raise
+            with self._lock:
+                self.counters["flushed"] += len(batch)
+            written += len(batch)
+
+    def close(self) -> None:
+        """Flush outstanding changes; call before the process exits."""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Could not save {len(self._dirty)} sessions on shutdown: {e!r}")
+
+
+def session_store_from_env(
+    factory: Callable[[str], T],
+    encode: Callable[[T], dict],
+    decode: Callable[[str, dict], T],
+    prefix: str = "CONVERSIFY_SESSION",
+) -> SessionStore[T]:
+    """A plain in-process store, or a write-behind store when ``<prefix>_BACKEND`` is set."""
+    store = SessionStore.from_env(factory, prefix)
+    backend = backend_from_url(os.getenv(f"{prefix}_BACKEND", ""), store.ttl_seconds)
+    if backend is None:
+        return store
+    logger.info(f"Sharing sessions through {type(backend).__name__}")
+    return WriteBehindSessionStore(
+        factory,
+        backend,
+        encode,
+        decode,
+        flush_interval=float(os.getenv(f"{prefix}_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+        cache_ttl=float(os.getenv(f"{prefix}_CACHE_TTL", DEFAULT_CACHE_TTL)),
+        max_sessions=store.max_sessions,
+        ttl_seconds=store.ttl_seconds,
+        max_bytes=store.max_bytes,
+    )
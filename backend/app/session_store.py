@@ -0,0 +1,190 @@
+"""Bounded session storage with LRU and idle-TTL eviction."""
+from typing import Callable, Dict, Generic, Iterator, Optional, Tuple, TypeVar
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_TTL_SECONDS = 1800.0
+
+
+class SessionStore(Generic[T]):
+    """Thread-safe mapping of session id to per-session state.
+
+    Entries are kept in least-recently-used order, so the oldest entry is
+    also the one that has been idle the longest. That lets TTL expiry and
+    LRU eviction share a single scan from the front of the map, which keeps
+    every access O(1) amortised.
+
+    The memory cap is enforced on the approximate byte sizes reported via
+    ``resize``; stores created without ``max_bytes`` only bound the number
+    of sessions.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], T],
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        max_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.RLock()
+        # session_id -> (value, last_seen, approximate_bytes)
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._total_bytes = 0
+        self.counters: Dict[str, int] = {
+            "created": 0,
+            "released": 0,
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "evicted_memory": 0,
+        }
+
+    @classmethod
+    def from_env(cls, factory: Callable[[str], T], prefix: str = "CONVERSIFY_SESSION") -> "SessionStore[T]":
+        """Build a store using limits from ``<prefix>_MAX``, ``_TTL`` and ``_MAX_BYTES``."""
+        ttl = float(os.getenv(f"{prefix}_TTL", DEFAULT_TTL_SECONDS))
+        max_bytes = os.getenv(f"{prefix}_MAX_BYTES")
+        return cls(
+            factory,
+            max_sessions=int(os.getenv(f"{prefix}_MAX", DEFAULT_MAX_SESSIONS)),
+            ttl_seconds=ttl if ttl > 0 else None,
+            max_bytes=int(max_bytes) if max_bytes else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def get(self, session_id: str) -> Optional[T]:
+        """Return the session if it is still live, marking it as recently used."""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = now
+            self._entries.move_to_end(session_id)
+            return entry[0]
+
+    def get_or_create(self, session_id: str) -> T:
+        """Return the live session for ``session_id``, creating it if needed.
+
+        The factory runs without the store lock held, since it may do I/O
+        such as reading a session back from disk. If two threads create the
+        same session at once, the first one stored wins.
+        """
+        value = self.get(session_id)
+        if value is not None:
+            return value
+        value = self._factory(session_id)
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._entries.move_to_end(session_id)
+                return entry[0]
+            self._entries[session_id] = [value, now, 0]
+            self.counters["created"] += 1
+            self._enforce_limits()
+            return value
+
+    def put(self, session_id: str, value: T) -> None:
+        """Insert or replace a session, e.g. one restored from another process."""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._pop(session_id)
+            self._entries[session_id] = [value, now, 0]
+            self._enforce_limits()
+
+    def resize(self, session_id: str, nbytes: int) -> None:
+        """Record that a session changed and its approximate size, enforcing the memory cap."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            self._total_bytes += nbytes - entry[2]
+            entry[2] = nbytes
+            self._enforce_limits()
+
+    def release(self, session_id: str) -> bool:
+        """Drop a session immediately, e.g. when its connection closes."""
+        with self._lock:
+            if self._pop(session_id) is None:
+                return False
+            self.counters["released"] += 1
+            return True
+
+    def sweep(self) -> int:
+        """Evict every session that has outlived its idle TTL."""
+        with self._lock:
+            return self._expire(self._clock())
+
+    def items(self) -> Iterator[Tuple[str, T]]:
+        """Iterate over a snapshot of the live sessions."""
+        with self._lock:
+            snapshot = [(key, entry[0]) for key, entry in self._entries.items()]
+        return iter(snapshot)
+
+    def stats(self) -> Dict[str, int]:
+        """Return current size and eviction counters."""
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "approx_bytes": self._total_bytes,
+                **self.counters,
+            }
+
+    def _pop(self, session_id: str) -> Optional[list]:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+        return entry
+
+    def _expire(self, now: float) -> int:
+        if self.ttl_seconds is None:
+            return 0
+        expired = 0
+        deadline = now - self.ttl_seconds
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if entry[1] > deadline:
+                break
+            self._pop(session_id)
+            expired += 1
+        if expired:
+            self.counters["evicted_ttl"] += expired
+            logger.debug(f"Expired {expired} idle sessions")
+        return expired
+
+    def _enforce_limits(self) -> None:
+        while len(self._entries) > self.max_sessions:
+            self._pop(next(iter(self._entries)))
+            self.counters["evicted_lru"] += 1
+        if self.max_bytes is None:
+            return
+        # Never evict the most recent session to satisfy the byte cap, otherwise
+        # a single oversized conversation would be dropped on every turn.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._pop(next(iter(self._entries)))
+            self.counters["evicted_memory"] += 1
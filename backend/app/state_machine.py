@@ -0,0 +1,232 @@
+"""Declarative conversation flow compiled into a (state, intent, topic) dispatch map.
+
+The flow lives in ``data/conversation_flow.json``. Each transition names the
+state it applies to, the intent and topic it matches and either a response
+handler plus the next state, or a state to ``delegate`` to. ``"*"`` matches
+any state, intent or topic, and a ``null`` topic matches turns before any
+topic has been chosen.
+
+Run ``python -m backend.app.state_machine [path]`` to check a flow offline.
+"""
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Type
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "*"
+DEFAULT_FLOW_PATH = Path(__file__).parent / "data" / "conversation_flow.json"
+
+
+class TransitionTableError(ValueError):
+    """Raised when a conversation flow table is malformed."""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("Invalid conversation flow:\n" + "\n".join(f"- {error}" for error in errors))
+
+
+@dataclass(frozen=True)
+class Route:
+    """Compiled outcome of one (state, intent, topic) key."""
+    handler_name: Optional[str]
+    handler: Optional[Callable]
+    next_state: Optional[Enum]
+    delegate: Optional[Enum] = None
+
+
+def load_flow(path: Path = DEFAULT_FLOW_PATH) -> dict:
+    """Read a conversation flow table from disk."""
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class StateMachine:
+    """Validated, precompiled dispatch map for a conversation flow.
+
+    Lookups try each of the turn's intents in priority order and then the
+    ``"*"`` intent, and for every intent the exact topic before the ``"*"``
+    topic, so a turn costs a handful of dict lookups however many topics
+    the table covers.
+    """
+
+    def __init__(
+        self,
+        table: dict,
+        states: Type[Enum],
+        handlers: Mapping[str, Callable],
+        known_topics: Iterable[str] = (),
+    ):
+        errors, self.warnings = check_flow(table, states, handlers.keys(), known_topics)
+        if errors:
+            raise TransitionTableError(errors)
+        for warning in self.warnings:
+            logger.debug(f"Conversation flow: {warning}")
+
+        self.initial_state = states(table["initial_state"])
+        self.intents: Tuple[str, ...] = tuple(table["intents"])
+        self.routes: Dict[Tuple[Enum, str, Optional[str]], Route] = {}
+        for state, intent, topic, row in _expand(table, states):
+            self.routes[(state, intent, topic)] = Route(
+                handler_name=row.get("handler"),
+                handler=handlers[row["handler"]] if row.get("handler") else None,
+                next_state=states(row["next"]) if row.get("next") else None,
+                delegate=states(row["delegate"]) if row.get("delegate") else None,
+            )
+
+    def resolve(self, state: Enum, intents: Sequence[str], topic: Optional[str]) -> Route:
+        """Return the handler route for a turn, following delegations."""
+        routes = self.routes
+        for _ in range(len(routes) + 1):
+            route = None
+            for intent in (*intents, WILDCARD):
+                route = routes.get((state, intent, topic)) or routes.get((state, intent, WILDCARD))
+                if route is not None:
+                    break
+            if route is None:
+                # check_flow guarantees a (state, "*", "*") fallback for every state
+                raise KeyError((state, tuple(intents), topic))
+            if route.delegate is None:
+                return route
+            state = route.delegate
+        raise RuntimeError("Conversation flow delegation did not terminate")
+
+
+def _expand(table: dict, states: Type[Enum]):
+    """Yield (state, intent, topic, row) with state wildcards expanded.
+
+    Explicit rows take precedence over rows that only match through a
+    wildcard state, so shared transitions can be declared once.
+    """
+    explicit = set()
+    for row in table["transitions"]:
+        if row["state"] != WILDCARD:
+            explicit.add((row["state"], row["intent"], row["topic"]))
+            yield states(row["state"]), row["intent"], row["topic"], row
+    for row in table["transitions"]:
+        if row["state"] != WILDCARD:
+            continue
+        for state in states:
+            if (state.value, row["intent"], row["topic"]) not in explicit:
+                yield state, row["intent"], row["topic"], row
+
+
+def check_flow(
+    table: dict,
+    states: Type[Enum],
+    handler_names: Iterable[str],
+    known_topics: Iterable[str] = (),
+) -> Tuple[List[str], List[str]]:
+    """Validate a flow table, returning ``(errors, warnings)``.
+
+    Errors make the table unusable: unknown states, intents or handlers,
+    duplicate keys, states without a fallback row and delegation cycles.
+    Warnings cover unreachable states and known topics that the table
+    neither declares nor handles.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    state_names = {state.value for state in states}
+    handler_names = set(handler_names)
+    intents = list(table.get("intents", []))
+    topics = set(table.get("topics", []))
+    rows = table.get("transitions", [])
+
+    if table.get("initial_state") not in state_names:
+        errors.append(f"initial_state {table.get('initial_state')!r} is not a known state")
+    if WILDCARD in intents or len(set(intents)) != len(intents):
+        errors.append("intents must be unique and must not contain '*'")
+
+    seen = set()
+    for number, row in enumerate(rows, 1):
+        key = (row.get("state"), row.get("intent"), row.get("topic"))
+        where = f"transition {number} {key}"
+        if key in seen:
+            errors.append(f"{where} is declared more than once")
+        seen.add(key)
+        if row.get("state") != WILDCARD and row.get("state") not in state_names:
+            errors.append(f"{where} uses unknown state {row.get('state')!r}")
+        if row.get("intent") != WILDCARD and row.get("intent") not in intents:
+            errors.append(f"{where} uses undeclared intent {row.get('intent')!r}")
+        if row.get("topic") not in (None, WILDCARD) and row.get("topic") not in topics:
+            errors.append(f"{where} uses undeclared topic {row.get('topic')!r}")
+        if bool(row.get("handler")) == bool(row.get("delegate")):
+            errors.append(f"{where} needs exactly one of 'handler' or 'delegate'")
+        if row.get("handler"):
+            if row["handler"] not in handler_names:
+                errors.append(f"{where} uses unknown handler {row['handler']!r}")
+            if row.get("next") not in state_names:
+                errors.append(f"{where} has invalid next state {row.get('next')!r}")
+        if row.get("delegate") and row["delegate"] not in state_names:
+            errors.append(f"{where} delegates to unknown state {row['delegate']!r}")
+    if errors:
+        return errors, warnings
+
+    fallbacks = {row["state"] for row in rows if row["intent"] == WILDCARD and row["topic"] == WILDCARD}
+    if WILDCARD not in fallbacks:
+        for state in sorted(state_names - fallbacks):
+            errors.append(f"state {state!r} has no ('*', '*') fallback transition")
+
+    # Delegation may only run into a cycle if it can keep delegating forever
+    delegates: Dict[str, set] = {}
+    for row in rows:
+        if row.get("delegate"):
+            sources = state_names if row["state"] == WILDCARD else {row["state"]}
+            for source in sources:
+                delegates.setdefault(source, set()).add(row["delegate"])
+    for start in delegates:
+        stack, visited = list(delegates[start]), set()
+        while stack:
+            state = stack.pop()
+            if state == start:
+                errors.append(f"state {start!r} can delegate back to itself")
+                break
+            if state not in visited:
+                visited.add(state)
+                stack.extend(delegates.get(state, ()))
+
+    reachable = {table["initial_state"]}
+    frontier = [table["initial_state"]]
+    while frontier:
+        state = frontier.pop()
+        for row in rows:
+            if row["state"] not in (state, WILDCARD):
+                continue
+            target = row.get("next") or row.get("delegate")
+            if target not in reachable:
+                reachable.add(target)
+                frontier.append(target)
+    for state in sorted(state_names - reachable):
+        warnings.append(f"state {state!r} is unreachable from {table['initial_state']!r}")
+
+    handled = topics | {row["topic"] for row in rows}
+    for topic in sorted(set(known_topics) - handled):
+        warnings.append(f"topic {topic!r} has no handler in the flow")
+
+    return errors, warnings
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Check a flow table against ChatEngine's handlers and knowledge graph."""
+    from backend.app.chatbot_responses import ChatEngine, ConversationState
+
+    argv = sys.argv[1:] if argv is None else argv
+    path = Path(argv[0]) if argv else DEFAULT_FLOW_PATH
+    engine = ChatEngine()
+    errors, warnings = check_flow(
+        load_flow(path), ConversationState, engine.response_handlers, engine.known_topics()
+    )
+    for error in errors:
+        print(f"ERROR: {error}")
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+    print(f"{path}: {len(errors)} error(s), {len(warnings)} warning(s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Frontend assets held in memory with precompressed variants and ETags."""
+from typing import Dict, Optional, Tuple
+from email.utils import formatdate
+from pathlib import Path
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Only these are worth compressing; images and fonts already are
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+COMPRESS_MIN_BYTES = 256
+MAX_CACHED_FILE_BYTES = 16 * 2 ** 20
+# Only fingerprinted URLs (``?v=<version>``) are cached this long; everything else is revalidated
+STATIC_MAX_AGE = int(os.getenv("CONVERSIFY_STATIC_MAX_AGE", 365 * 24 * 3600))
+VERSION_CHARS = 12
+
+# Root-relative src/href attributes in HTML pages, which get fingerprinted
+_ASSET_REF_RE = re.compile(r'((?:src|href)=")/([^"?#:]+)(")')
+
+
+class StaticAsset:
+    """One file's bytes, its compressed variants and validators."""
+    __slots__ = ("path", "content_type", "variants", "digest", "last_modified")
+
+    def __init__(self, path: str, body: bytes, content_type: str, mtime: float):
+        self.path = path
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.last_modified = formatdate(mtime, usegmt=True)
+        # content-coding -> body; "identity" is always present
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if len(body) >= COMPRESS_MIN_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = compressed
+
+    def etag(self, coding: str) -> str:
+        """Strong ETag; each content-coding is a different representation."""
+        return f'"{self.digest}"' if coding == "identity" else f'"{self.digest}-{coding}"'
+
+    @property
+    def version(self) -> str:
+        """The ``v`` query parameter of this content's fingerprinted URL."""
+        return self.digest[:VERSION_CHARS]
+
+    @property
+    def is_html(self) -> bool:
+        return self.content_type.startswith("text/html")
+
+
+def _accepted_codings(header: str) -> Dict[str, float]:
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            codings[coding.lower()] = quality
+    return codings
+
+
+def choose_coding(asset: StaticAsset, accept_encoding: str) -> str:
+    """Pick the smallest variant the client accepts."""
+    if len(asset.variants) == 1 or not accept_encoding:
+        return "identity"
+    accepted = _accepted_codings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("br", "gzip"):
+        if coding in asset.variants and accepted.get(coding, wildcard) > 0:
+            return coding
+    return "identity"
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Whether ``If-None-Match`` names ``etag``, the tag of the variant about to be sent."""
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+class StaticAssetCache:
+    """Loads a directory tree into memory once and serves it from there.
+
+    Every file is read, hashed and compressed at startup, so a request
+    only does a dictionary lookup. HTML pages have their links to other
+    cached files fingerprinted with ``?v=<version>``, and only a request
+    carrying the current version may be reused, for ``max_age`` seconds.
+    Everything else, pages included, is served with ``no-cache`` and
+    revalidated on every use, which costs a 304 when nothing changed, so
+    a page never runs against a script from an older deploy.
+    """
+
+    def __init__(self, root: Path, max_age: int = STATIC_MAX_AGE, max_file_bytes: int = MAX_CACHED_FILE_BYTES):
+        self.root = Path(root)
+        self.max_age = max_age
+        self.max_file_bytes = max_file_bytes
+        self.assets: Dict[str, StaticAsset] = {}
+        # Files too large to hold in memory, still served from disk
+        self.uncached: Dict[str, Path] = {}
+
+    def load(self) -> "StaticAssetCache":
+        started = time.perf_counter()
+        assets = {}
+        uncached = {}
+        total = 0
+        for path in sorted(self.root.rglob("*")):
+            parts = path.relative_to(self.root).parts
+            if not path.is_file() or any(part.startswith(".") for part in parts):
+                continue
+            relative = "/".join(parts)
+            stat = path.stat()
+            if stat.st_size > self.max_file_bytes:
+                logger.warning(f"Not caching {relative}: {stat.st_size} bytes is over the limit")
+                uncached[relative] = path
+                continue
+            assets[relative] = self._asset(relative, path.read_bytes(), stat.st_mtime)
+            total += stat.st_size
+        # Pages are fingerprinted once every file they may link to has been hashed
+        for relative, asset in list(assets.items()):
+            if asset.is_html:
+                body = self._fingerprint(asset.variants["identity"].decode("utf-8"), assets)
+                assets[relative] = self._asset(relative, body.encode("utf-8"), (self.root / relative).stat().st_mtime)
+        self.assets = assets
+        self.uncached = uncached
+        logger.info(
+            f"Cached {len(assets)} static assets ({total / 2 ** 20:.1f} MiB) "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        return self
+
+    def _asset(self, relative: str, body: bytes, mtime: float) -> StaticAsset:
+        content_type = mimetypes.guess_type(relative)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        return StaticAsset(relative, body, content_type, mtime)
+
+    @staticmethod
+    def _fingerprint(html: str, assets: Dict[str, StaticAsset]) -> str:
+        """Add ``?v=<version>`` to the page's links to cached files other than pages."""
+        def version(match: "re.Match") -> str:
+            target = match.group(2)
+            # The subpages link to /static/..., which is served from the frontend root
+            asset = assets.get(target) or (assets.get(target[len("static/"):]) if target.startswith("static/") else None)
+            if asset is None or asset.is_html:
+                return match.group(0)
+            return f"{match.group(1)}/{target}?v={asset.version}{match.group(3)}"
+
+        return _ASSET_REF_RE.sub(version, html)
+
+    def get(self, relative: str) -> Optional[StaticAsset]:
+        return self.assets.get(relative.lstrip("/"))
+
+    def response(self, request: Request, asset: StaticAsset) -> Response:
+        """200 with the best encoding the client accepts, or 304 if its copy is current."""
+        coding = choose_coding(asset, request.headers.get("accept-encoding", ""))
+        fingerprinted = not asset.is_html and request.query_params.get("v") == asset.version
+        headers = {
+            "ETag": asset.etag(coding),
+            "Cache-Control": f"public, max-age={self.max_age}, immutable" if fingerprinted else "no-cache",
+            "Last-Modified": asset.last_modified,
+        }
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        # Set as a header so Starlette does not append a second charset to text/* types
+        headers["Content-Type"] = asset.content_type
+        return Response(asset.variants[coding], headers=headers)
+
+    def stats(self) -> Tuple[int, int]:
+        """Number of assets and bytes held across all variants."""
+        return len(self.assets), sum(len(body) for a in self.assets.values() for body in a.variants.values())
@@ -0,0 +1,112 @@
+"""Chunked WebSocket delivery of long responses."""
+from typing import Awaitable, Callable, Iterator, Optional
+import asyncio
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_CHARS = int(os.getenv("CONVERSIFY_STREAM_CHUNK_CHARS", 64))
+# A client that cannot take one chunk within this many seconds is too slow to stream to
+STREAM_SEND_TIMEOUT = float(os.getenv("CONVERSIFY_STREAM_SEND_TIMEOUT", 10.0))
+
+_TOKEN_RE = re.compile(r"\s*\S+")
+
+SendJson = Callable[[dict], Awaitable[None]]
+
+
+def iter_chunks(text: str, max_chars: int = STREAM_CHUNK_CHARS) -> Iterator[str]:
+    """Split ``text`` into chunks of whole words, each at most ``max_chars`` long
+    unless a single word is longer. Joining the chunks gives back ``text``."""
+    chunk = ""
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        end = match.end()
+        if chunk and len(chunk) + len(token) > max_chars:
+            yield chunk
+            chunk = ""
+        chunk += token
+    chunk += text[end:]
+    if chunk:
+        yield chunk
+
+
+async def stream_response(
+    send_json: SendJson,
+    stream_id: int,
+    text: str,
+    chunk_chars: int = STREAM_CHUNK_CHARS,
+    send_timeout: float = STREAM_SEND_TIMEOUT,
+) -> None:
+    """Send ``text`` as stream_chunk frames followed by stream_end.
+
+    Every chunk waits for the transport to accept the previous one, so a
+    slow reader throttles the stream instead of growing server buffers.
+    A chunk not accepted within ``send_timeout`` raises asyncio.TimeoutError.
+    """
+    for chunk in iter_chunks(text, chunk_chars):
+        await asyncio.wait_for(
+            send_json({"type": "stream_chunk", "id": stream_id, "content": chunk}),
+            timeout=send_timeout,
+        )
+        # Let the receive loop run between chunks so it can cancel us
+        await asyncio.sleep(0)
+    await send_json({"type": "stream_end", "id": stream_id})
+
+
+class StreamSlot:
+    """Tracks the single in-flight stream of a connection.
+
+    Streams always open with stream_start and close with stream_end; a
+    stream stopped by ``cancel`` (for example because the user sent a new
+    message) is closed with ``"cancelled": true``. When a chunk times out
+    it may have been cut off mid-frame, so the connection is closed with
+    ``close`` instead; without one, the stream is ended as cancelled.
+    """
+
+    def __init__(self, send_json: SendJson, close: Optional[Callable[[], Awaitable[None]]] = None):
+        self.send_json = send_json
+        self.close = close
+        self.task = None
+        self.stream_id = 0
+
+    async def start(self, text: str) -> int:
+        """Announce a new stream and deliver it from a background task."""
+        self.stream_id += 1
+        await self.send_json({"type": "stream_start", "id": self.stream_id})
+        self.task = asyncio.ensure_future(self._deliver(self.stream_id, text))
+        self.task.add_done_callback(_log_stream_failure)
+        return self.stream_id
+
+    async def _deliver(self, stream_id: int, text: str) -> None:
+        try:
+            await stream_response(self.send_json, stream_id, text)
+        except asyncio.TimeoutError:
+            logger.warning(f"Response stream {stream_id} stalled; the client is not reading")
+            if self.close is not None:
+                await self.close()
+            else:
+                await self.send_json({"type": "stream_end", "id": stream_id, "cancelled": True})
+
+    async def cancel(self, notify: bool = True) -> None:
+        """Stop the in-flight stream, if any, and wait for it to finish."""
+        task, self.task = self.task, None
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if notify:
+            await self.send_json({"type": "stream_end", "id": self.stream_id, "cancelled": True})
+
+
+def _log_stream_failure(task: "asyncio.Task") -> None:
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.warning(f"Response stream aborted: {error!r}")
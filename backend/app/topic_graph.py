@@ -0,0 +1,230 @@
+"""Topic graph loaded from data and compiled for constant-time distance and suggestion lookups.
+
+The graph lives in ``data/topic_graph.json``. Each topic has a display name,
+subtopics, related topics and key concepts, and every topic it names must
+itself be a topic. Subtopic and related edges both count as one hop, in
+either direction.
+
+Run ``python -m backend.app.topic_graph [path]`` to check a graph offline.
+"""
+from typing import Container, Dict, List, Optional, Tuple
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOPIC_GRAPH_PATH = Path(__file__).parent / "data" / "topic_graph.json"
+# Hop distances are precomputed up to this horizon; farther topics count as unrelated
+MAX_HOPS = 3
+SUGGESTIONS = 3
+
+
+class TopicGraphError(ValueError):
+    """Raised when a topic graph is malformed."""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("Invalid topic graph:\n" + "\n".join(f"- {error}" for error in errors))
+
+
+@dataclass(frozen=True)
+class TopicNode:
+    """One topic as declared in the graph file."""
+    id: str
+    name: str
+    subtopics: Tuple[str, ...]
+    related_topics: Tuple[str, ...]
+    key_concepts: Tuple[str, ...]
+
+
+def load_topic_graph(path: Path = DEFAULT_TOPIC_GRAPH_PATH) -> dict:
+    """Read a topic graph from disk."""
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def check_topic_graph(table: dict) -> Tuple[List[str], List[str]]:
+    """Validate a topic graph, returning ``(errors, warnings)``.
+
+    Errors make the graph unusable: topics without a name, edge lists that
+    are not lists of topic ids, and references to topics that do not
+    exist or to the topic itself. Warnings cover repeated edges and topics
+    with no edges at all.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    topics = table.get("topics")
+    if not isinstance(topics, dict) or not topics:
+        return ["'topics' must be a non-empty object"], warnings
+
+    referenced = set()
+    for topic_id, topic in topics.items():
+        if not isinstance(topic, dict):
+            errors.append(f"topic {topic_id!r} must be an object")
+            continue
+        if not isinstance(topic.get("name"), str) or not topic["name"]:
+            errors.append(f"topic {topic_id!r} needs a name")
+        for field in ("subtopics", "related_topics", "key_concepts"):
+            values = topic.get(field, [])
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                errors.append(f"topic {topic_id!r} {field} must be a list of strings")
+                continue
+            if len(set(values)) != len(values):
+                warnings.append(f"topic {topic_id!r} lists the same {field} more than once")
+            if field == "key_concepts":
+                continue
+            for value in values:
+                if value == topic_id:
+                    errors.append(f"topic {topic_id!r} lists itself in {field}")
+                elif value not in topics:
+                    errors.append(f"topic {topic_id!r} {field} references unknown topic {value!r}")
+                else:
+                    referenced.add(value)
+        edges = set(topic.get("subtopics", [])) & set(topic.get("related_topics", []))
+        for value in sorted(edges):
+            warnings.append(f"topic {topic_id!r} lists {value!r} as both a subtopic and a related topic")
+    if errors:
+        return errors, warnings
+
+    for topic_id, topic in topics.items():
+        if topic_id not in referenced and not topic.get("subtopics") and not topic.get("related_topics"):
+            warnings.append(f"topic {topic_id!r} is not connected to any other topic")
+    return errors, warnings
+
+
+class TopicGraph:
+    """Validated topic graph with hop distances and suggestions precomputed.
+
+    Adjacency is kept in compressed arrays: the neighbours of topic ``i``
+    are ``targets[offsets[i]:offsets[i + 1]]``. A breadth-first search
+    from every topic, cut off at ``max_hops``, fills a distance map per
+    topic, so ``distance`` is two dict lookups. Every topic's nearby
+    topics are ranked once, at compile time; ``suggestions`` takes the
+    best of them, optionally only those in an ``allowed`` set. Memory grows
+    with the number of topics within ``max_hops`` of each other, not with
+    the square of the graph.
+    """
+
+    def __init__(self, table: dict, max_hops: int = MAX_HOPS, suggestions: int = SUGGESTIONS):
+        errors, self.warnings = check_topic_graph(table)
+        if errors:
+            raise TopicGraphError(errors)
+        for warning in self.warnings:
+            logger.debug(f"Topic graph: {warning}")
+
+        self.max_hops = max_hops
+        self.suggestion_count = suggestions
+        self.topics: Dict[str, TopicNode] = {
+            topic_id: TopicNode(
+                id=topic_id,
+                name=topic["name"],
+                subtopics=tuple(dict.fromkeys(topic.get("subtopics", []))),
+                related_topics=tuple(dict.fromkeys(topic.get("related_topics", []))),
+                key_concepts=tuple(topic.get("key_concepts", [])),
+            )
+            for topic_id, topic in table["topics"].items()
+        }
+        self.ids: Tuple[str, ...] = tuple(self.topics)
+        self.index: Dict[str, int] = {topic_id: number for number, topic_id in enumerate(self.ids)}
+
+        neighbours: List[set] = [set() for _ in self.ids]
+        for topic in self.topics.values():
+            source = self.index[topic.id]
+            for target_id in topic.subtopics + topic.related_topics:
+                target = self.index[target_id]
+                neighbours[source].add(target)
+                neighbours[target].add(source)
+        self.offsets = array("i", [0])
+        self.targets = array("i")
+        for adjacent in neighbours:
+            self.targets.extend(sorted(adjacent))
+            self.offsets.append(len(self.targets))
+
+        self._hops: Dict[str, Dict[str, int]] = {}
+        self._ranked: Dict[str, Tuple[str, ...]] = {}
+        for number, topic_id in enumerate(self.ids):
+            hops = self._search(number)
+            self._hops[topic_id] = {self.ids[other]: depth for other, depth in hops.items()}
+            self._ranked[topic_id] = self._rank(number, hops, neighbours)
+
+    def _search(self, source: int) -> Dict[int, int]:
+        """Hop counts from ``source`` to every topic within ``max_hops``."""
+        offsets, targets = self.offsets, self.targets
+        hops = {source: 0}
+        frontier = [source]
+        for depth in range(1, self.max_hops + 1):
+            reached = []
+            for node in frontier:
+                for neighbour in targets[offsets[node]:offsets[node + 1]]:
+                    if neighbour not in hops:
+                        hops[neighbour] = depth
+                        reached.append(neighbour)
+            if not reached:
+                break
+            frontier = reached
+        return hops
+
+    def _rank(self, source: int, hops: Dict[int, int], neighbours: List[set]) -> Tuple[str, ...]:
+        """Nearest topics first; among equals, the ones sharing most neighbours with ``source``.
+
+        The topic's own subtopics are left out, since they are offered
+        whenever the topic itself is explored.
+        """
+        excluded = {self.index[subtopic] for subtopic in self.topics[self.ids[source]].subtopics}
+        excluded.add(source)
+        candidates = [other for other in hops if other not in excluded]
+        candidates.sort(key=lambda other: (hops[other], -len(neighbours[source] & neighbours[other]), other))
+        return tuple(self.ids[other] for other in candidates)
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self.topics
+
+    def __len__(self) -> int:
+        return len(self.topics)
+
+    def subtopics(self, topic: str) -> Tuple[str, ...]:
+        node = self.topics.get(topic)
+        return node.subtopics if node is not None else ()
+
+    def related(self, topic: str) -> Tuple[str, ...]:
+        node = self.topics.get(topic)
+        return node.related_topics if node is not None else ()
+
+    def distance(self, source: str, target: str) -> Optional[int]:
+        """Hops between two topics, or None if either is unknown or they are over ``max_hops`` apart."""
+        hops = self._hops.get(source)
+        return hops.get(target) if hops is not None else None
+
+    def suggestions(self, topic: str, allowed: Optional[Container[str]] = None) -> Tuple[str, ...]:
+        """The best "you might also like" topics for ``topic``, from ``allowed`` if given."""
+        ranked = self._ranked.get(topic, ())
+        if allowed is not None:
+            ranked = tuple(other for other in ranked if other in allowed)
+        return ranked[:self.suggestion_count]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Check a topic graph and print its size and suggestions."""
+    argv = sys.argv[1:] if argv is None else argv
+    path = Path(argv[0]) if argv else DEFAULT_TOPIC_GRAPH_PATH
+    table = load_topic_graph(path)
+    errors, warnings = check_topic_graph(table)
+    for error in errors:
+        print(f"ERROR: {error}")
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+    if not errors:
+        graph = TopicGraph(table)
+        print(f"{len(graph)} topics, {len(graph.targets) // 2} edges")
+        for topic in graph.ids:
+            print(f"  {topic}: {', '.join(graph.suggestions(topic)) or '-'}")
+    print(f"{path}: {len(errors)} error(s), {len(warnings)} warning(s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
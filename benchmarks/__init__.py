@@ -0,0 +1,4 @@
+"""
+ConversifyAI benchmarks. Run modules from the repository root, e.g.
+``python -m benchmarks.history_memory``.
+"""
@@ -0,0 +1,38 @@
+"""Print the differences between two saved benchmark results.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+from benchmarks.common import flatten
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.0, help="hide changes smaller than this fraction")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as handle:
+        before = flatten(json.load(handle))
+    with open(args.after, encoding="utf-8") as handle:
+        after = flatten(json.load(handle))
+
+    width = max((len(key) for key in before.keys() | after.keys()), default=0)
+    for key in sorted(before.keys() | after.keys()):
+        if key.startswith(("environment.", "config.")):
+            continue
+        old, new = before.get(key), after.get(key)
+        if old is None or new is None:
+            print(f"{key:<{width}}  {'-' if old is None else f'{old:.3f}':>14} -> {'-' if new is None else f'{new:.3f}':>14}")
+            continue
+        change = (new - old) / old if old else 0.0
+        if abs(change) < args.threshold:
+            continue
+        print(f"{key:<{width}}  {old:14.3f} -> {new:14.3f}  {change:+8.1%}")
+
+
+if __name__ == "__main__":
+    main()
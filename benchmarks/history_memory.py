@@ -0,0 +1,84 @@
+"""Compare the memory used by the legacy and ring-buffer history layouts.
+
+The legacy layout is reproduced as it was: ChatBot kept the last 10
+messages per connection and ChatEngine the last 20 per session, each as a
+dict with an ISO timestamp string. The new layout keeps one HistoryBuffer
+of slotted records per session.
+
+    python -m benchmarks.history_memory --sessions 100000
+"""
+from datetime import datetime
+import argparse
+import gc
+import time
+import tracemalloc
+
+from backend.app.history import HistoryBuffer
+
+BOT_REPLY = "Python offers several powerful web frameworks like Django, Flask, and FastAPI."
+
+
+def _messages(session: int, count: int):
+    for turn in range(count // 2):
+        yield f"user {session} asks question {turn}", False
+        # Bot replies come from the response cache, so they are shared strings
+        yield BOT_REPLY, True
+
+
+def build_legacy(sessions: int, messages: int):
+    chatbot_history = {}
+    engine_history = {}
+    for session in range(sessions):
+        bot_list = chatbot_history[f"conn_{session}"] = []
+        engine_list = engine_history[str(session)] = []
+        for content, is_bot in _messages(session, messages):
+            bot_list.append({"timestamp": datetime.now().isoformat(), "content": content, "is_bot": is_bot})
+            if len(bot_list) > 10:
+                chatbot_history[f"conn_{session}"] = bot_list = bot_list[-10:]
+            engine_list.append({"timestamp": datetime.now().isoformat(), "content": content, "is_bot": is_bot})
+            if len(engine_list) > 20:
+                engine_history[str(session)] = engine_list = engine_list[-20:]
+    return chatbot_history, engine_history
+
+
+def build_ring_buffer(sessions: int, messages: int):
+    history = {}
+    for session in range(sessions):
+        buffer = history[f"conn_{session}"] = HistoryBuffer(20)
+        for content, is_bot in _messages(session, messages):
+            buffer.append(content, is_bot)
+    return history
+
+
+def measure(builder, sessions: int, messages: int):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = builder(sessions, messages)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=20, help="messages per session")
+    args = parser.parse_args()
+
+    results = {}
+    for name, builder in (("legacy dicts", build_legacy), ("ring buffer", build_ring_buffer)):
+        current, elapsed = measure(builder, args.sessions, args.messages)
+        results[name] = current
+        print(
+            f"{name:>13}: {current / 2**20:8.1f} MiB total, "
+            f"{current / args.sessions:7.0f} B/session, built in {elapsed:.2f}s"
+        )
+    saved = 1 - results["ring buffer"] / results["legacy dicts"]
+    print(f"ring buffer uses {saved:.0%} less memory at {args.sessions} sessions")
+
+
+if __name__ == "__main__":
+    main()
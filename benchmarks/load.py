@@ -0,0 +1,289 @@
+"""Replay scripted conversations against /ws/chat and /api/chat under load.
+
+By default the app runs in this process on a uvicorn server bound to a free
+local port. ``--spawn`` starts a separate uvicorn process instead (RSS is
+then measured for that process), and ``--url`` targets a server that is
+already running.
+
+    python -m benchmarks.load --ws-users 2000 --http-users 200 --output before.json
+    python -m benchmarks.compare before.json after.json
+"""
+from typing import List, Optional, Tuple
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+from benchmarks.common import environment, percentiles, raise_open_file_limit, rss_bytes, write_results
+
+SCENARIOS_PATH = Path(__file__).parent / "scenarios.json"
+# Simulated users send without pause and all connect from 127.0.0.1, so a
+# server started here runs without client limits; a --url server keeps its own
+LOCAL_SERVER_ENV = {
+    "CONVERSIFY_WS_MESSAGE_RATE": "1000000",
+    "CONVERSIFY_WS_MESSAGE_BURST": "1000000",
+    "CONVERSIFY_WS_MAX_CONNECTIONS": "1000000",
+    "CONVERSIFY_WS_MAX_CONNECTIONS_PER_IP": "1000000",
+    "CONVERSIFY_WS_IP_MESSAGE_RATE": "1000000",
+    "CONVERSIFY_WS_IP_MESSAGE_BURST": "1000000",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 client, enough for GET /api/chat."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.session_id: Optional[str] = None
+        self._reader = None
+        self._writer = None
+
+    async def get(self, path: str) -> Tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        session = f"X-Session-Id: {self.session_id}\r\n" if self.session_id else ""
+        self._writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nAccept: application/json\r\n{session}\r\n".encode()
+        )
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "x-session-id":
+                self.session_id = value.strip()
+        body = await self._reader.readexactly(length) if length else b""
+        return status, body
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+
+
+class LoadRun:
+    def __init__(self, args, conversations: List[List[str]]):
+        self.args = args
+        self.conversations = conversations
+        self.ws_latencies: List[float] = []
+        self.ws_first_byte: List[float] = []
+        self.http_latencies: List[float] = []
+        self.errors = {"ws": 0, "http": 0, "connect": 0}
+        self.connect_gate = asyncio.Semaphore(args.connect_concurrency)
+        self.finished = 0
+        self.all_finished = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def _done(self) -> None:
+        self.finished += 1
+        if self.finished == self.args.ws_users + self.args.http_users:
+            self.all_finished.set()
+
+    async def ws_user(self, number: int, ws_url: str) -> None:
+        conversation = self.conversations[number % len(self.conversations)]
+        try:
+            async with self.connect_gate:
+                connection = await websockets.connect(ws_url, max_size=None, open_timeout=60)
+        except Exception:
+            self.errors["connect"] += 1
+            self._done()
+            return
+        try:
+            for _ in range(self.args.repeat):
+                for message in conversation:
+                    started = time.perf_counter()
+                    await connection.send(json.dumps(
+                        {"type": "message", "content": message, "stream": self.args.stream}
+                    ))
+                    first = None
+                    while True:
+                        frame = json.loads(await connection.recv())
+                        if first is None:
+                            first = time.perf_counter() - started
+                        # Skip control frames such as stream_start or session notices
+                        if frame.get("type") in ("message", "error", "stream_end"):
+                            break
+                    self.ws_latencies.append(time.perf_counter() - started)
+                    self.ws_first_byte.append(first)
+                    if frame.get("type") == "error":
+                        self.errors["ws"] += 1
+                    await asyncio.sleep(self.args.think_time)
+        except Exception:
+            self.errors["ws"] += 1
+        finally:
+            self._done()
+            # Hold the connection open so RSS is sampled with every session live
+            await self.release.wait()
+            await connection.close()
+
+    async def http_user(self, number: int, host: str, port: int) -> None:
+        conversation = self.conversations[number % len(self.conversations)]
+        client = HttpClient(host, port)
+        try:
+            for _ in range(self.args.repeat):
+                for message in conversation:
+                    started = time.perf_counter()
+                    status, _ = await client.get(f"/api/chat?message={quote(message)}")
+                    self.http_latencies.append(time.perf_counter() - started)
+                    if status != 200:
+                        self.errors["http"] += 1
+                    await asyncio.sleep(self.args.think_time)
+        except Exception:
+            self.errors["http"] += 1
+        finally:
+            self._done()
+            await client.close()
+
+
+async def run(args) -> dict:
+    with open(args.scenarios, encoding="utf-8") as handle:
+        conversations = json.load(handle)["conversations"]
+
+    server = server_task = process = None
+    server_pid = args.server_pid
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        for name, value in LOCAL_SERVER_ENV.items():
+            os.environ.setdefault(name, value)
+        if args.spawn:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "backend.app.main:app",
+                 "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                env={**os.environ, "PYTHONPATH": os.getcwd()},
+            )
+            server_pid = process.pid
+        else:
+            import uvicorn
+            from backend.app.main import app
+
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+            server_task = asyncio.ensure_future(server.serve())
+            server_pid = os.getpid()
+        await wait_until_ready(base_url)
+
+    parts = urlsplit(base_url)
+    ws_url = f"{'wss' if parts.scheme == 'https' else 'ws'}://{parts.netloc}/ws/chat"
+    load = LoadRun(args, conversations)
+    rss_before = rss_bytes(server_pid) if server_pid else None
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(load.ws_user(n, ws_url)) for n in range(args.ws_users)]
+    tasks += [
+        asyncio.ensure_future(load.http_user(n, parts.hostname, parts.port or 80))
+        for n in range(args.http_users)
+    ]
+    if tasks:
+        await load.all_finished.wait()
+    elapsed = time.perf_counter() - started
+    rss_peak = rss_bytes(server_pid) if server_pid else None
+    load.release.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    if server is not None:
+        server.should_exit = True
+        await server_task
+    if process is not None:
+        process.terminate()
+        process.wait(timeout=30)
+
+    sessions = args.ws_users + args.http_users
+    turns = len(load.ws_latencies) + len(load.http_latencies)
+    results = {
+        "environment": environment(),
+        "config": {
+            "ws_users": args.ws_users,
+            "http_users": args.http_users,
+            "repeat": args.repeat,
+            "stream": args.stream,
+            "think_time": args.think_time,
+            "target": args.url or ("spawned uvicorn" if args.spawn else "in-process uvicorn"),
+        },
+        "elapsed_seconds": elapsed,
+        "throughput_turns_per_second": turns / elapsed if elapsed else 0.0,
+        "ws_latency_ms": percentiles(load.ws_latencies),
+        "ws_first_frame_ms": percentiles(load.ws_first_byte),
+        "http_latency_ms": percentiles(load.http_latencies),
+        "errors": load.errors,
+    }
+    if rss_before is not None:
+        results["rss"] = {
+            "before_bytes": rss_before,
+            "peak_bytes": rss_peak,
+            "growth_per_session_bytes": (rss_peak - rss_before) / sessions if sessions else 0.0,
+        }
+    return results
+
+
+async def wait_until_ready(base_url: str, timeout: float = 30.0) -> None:
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while True:
+        client = HttpClient(parts.hostname, parts.port or 80)
+        try:
+            status, _ = await client.get("/api/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            await client.close()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{base_url} did not become healthy within {timeout}s")
+        await asyncio.sleep(0.1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test /ws/chat and /api/chat")
+    parser.add_argument("--ws-users", type=int, default=500, help="concurrent WebSocket conversations")
+    parser.add_argument("--http-users", type=int, default=50, help="concurrent HTTP conversations")
+    parser.add_argument("--repeat", type=int, default=1, help="times each user replays its conversation")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds to wait between turns")
+    parser.add_argument("--stream", action="store_true", help="request streamed WebSocket responses")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="simultaneous WebSocket handshakes")
+    parser.add_argument("--scenarios", default=str(SCENARIOS_PATH))
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="benchmark a running server, e.g. http://127.0.0.1:8000")
+    target.add_argument("--spawn", action="store_true", help="start the app in a separate uvicorn process")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for RSS measurements")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    limit = raise_open_file_limit()
+    if args.ws_users + args.http_users > limit - 64:
+        print(f"warning: open file limit is {limit}; large runs may fail to connect", file=sys.stderr)
+    write_results(args.output, asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
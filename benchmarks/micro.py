@@ -0,0 +1,73 @@
+"""Microbenchmarks for the per-message hot path of ChatEngine.
+
+    python -m benchmarks.micro --output micro.json
+"""
+from typing import Callable, Dict
+from pathlib import Path
+import argparse
+import itertools
+import json
+import timeit
+
+from benchmarks.common import environment, write_results
+
+SCENARIOS_PATH = Path(__file__).parent / "scenarios.json"
+
+
+def bench(function: Callable[[], object], number: int, repeat: int) -> Dict[str, float]:
+    """Best and median per-call time in microseconds over ``repeat`` runs."""
+    runs = sorted(timeit.repeat(function, number=number, repeat=repeat))
+    return {
+        "best_us": runs[0] / number * 1e6,
+        "median_us": runs[len(runs) // 2] / number * 1e6,
+        "calls": number,
+    }
+
+
+def legacy_history_append(history: list, content: str) -> list:
+    """History maintenance as ChatEngine did it before HistoryBuffer."""
+    history.append({"content": content, "is_bot": False})
+    if len(history) > 20:
+        history = history[-20:]
+    return history
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark")
+    parser.add_argument("--scenarios", default=str(SCENARIOS_PATH))
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    from backend.app.chatbot_responses import ChatEngine, get_contextual_response
+    from backend.app.history import HistoryBuffer
+
+    with open(args.scenarios, encoding="utf-8") as handle:
+        messages = [message for conversation in json.load(handle)["conversations"] for message in conversation]
+    engine = ChatEngine()
+    next_message = itertools.cycle(messages).__next__
+    sessions = itertools.cycle([f"micro_{n}" for n in range(256)]).__next__
+
+    buffer = HistoryBuffer(20)
+    legacy = [[]]
+
+    def legacy_append():
+        legacy[0] = legacy_history_append(legacy[0], next_message())
+
+    benchmarks = {
+        "detect_topic": lambda: engine._detect_topic(next_message()),
+        "engine_get_response": lambda: engine.get_response(next_message(), sessions()),
+        "get_contextual_response": lambda: get_contextual_response(next_message(), session_id=sessions()),
+        "history_ring_buffer_append": lambda: buffer.append(next_message()),
+        "history_legacy_list_append": legacy_append,
+    }
+    results = {"environment": environment(), "benchmarks": {}}
+    for name, function in benchmarks.items():
+        results["benchmarks"][name] = bench(function, args.number, args.repeat)
+        print(f"{name:>28}: {results['benchmarks'][name]['best_us']:8.2f} us/call")
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
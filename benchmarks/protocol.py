@@ -0,0 +1,104 @@
+"""Bytes per turn and codec CPU cost of the /ws/chat wire formats.
+
+    python -m benchmarks.protocol --output protocol.json
+
+Scripted conversations are answered by a fresh ChatEngine. Their frames are
+then encoded with each codec, with and without permessage-deflate. The
+deflate sizes are simulated the way RFC 7692 does it with context takeover:
+one raw deflate stream per direction, sync-flushed after every message.
+"""
+from typing import Dict, List, Tuple
+from pathlib import Path
+import argparse
+import json
+import zlib
+
+from benchmarks.common import environment, write_results
+from benchmarks.micro import bench
+
+SCENARIOS_PATH = Path(__file__).parent / "scenarios.json"
+
+
+def deflated_sizes(frames: List[bytes]) -> List[int]:
+    """Sizes of ``frames`` sent one after another over one permessage-deflate stream."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    sizes = []
+    for frame in frames:
+        data = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        # The 00 00 ff ff tail of every sync flush is not sent
+        sizes.append(len(data) - 4)
+    return sizes
+
+
+def as_bytes(frame) -> bytes:
+    return frame if isinstance(frame, bytes) else frame.encode("utf-8")
+
+
+def transcripts(path: str) -> List[List[Tuple[dict, dict]]]:
+    """(client message, server reply) pairs for every scripted conversation."""
+    from backend.app.chatbot_responses import ChatEngine
+
+    engine = ChatEngine(journal=None)
+    with open(path, encoding="utf-8") as handle:
+        conversations = json.load(handle)["conversations"]
+    result = []
+    for number, conversation in enumerate(conversations):
+        turns = []
+        for message in conversation:
+            client = {"type": "message", "content": message, "stream": False}
+            reply = {"type": "message", "content": engine.get_response(message, f"protocol_{number}")}
+            turns.append((client, reply))
+        result.append(turns)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark")
+    parser.add_argument("--scenarios", default=str(SCENARIOS_PATH))
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    from backend.app.protocol import CODECS, DEFAULT_CODEC, MSGPACK_SUBPROTOCOL
+
+    conversations = transcripts(args.scenarios)
+    turns = [turn for conversation in conversations for turn in conversation]
+    codecs = {"json": DEFAULT_CODEC}
+    if MSGPACK_SUBPROTOCOL in CODECS:
+        codecs["msgpack"] = CODECS[MSGPACK_SUBPROTOCOL]
+    else:
+        print("msgpack is not installed; measuring JSON only")
+
+    # The longest reply stands in for large answers such as framework comparisons
+    largest = max((reply for _, reply in turns), key=lambda reply: len(reply["content"]))
+    results: Dict[str, dict] = {"environment": environment(), "turns": len(turns), "codecs": {}}
+    for name, codec in codecs.items():
+        client = [as_bytes(codec.encode(message)) for message, _ in turns]
+        server = [as_bytes(codec.encode(reply)) for _, reply in turns]
+        # One frame per conversation instead of one per message
+        batched = [as_bytes(codec.encode([message for message, _ in conversation])) for conversation in conversations]
+        client_frame, largest_frame = client[0], as_bytes(codec.encode(largest))
+        summary = {
+            "bytes_per_turn": (sum(map(len, client)) + sum(map(len, server))) / len(turns),
+            "client_bytes_per_turn": sum(map(len, client)) / len(turns),
+            "server_bytes_per_turn": sum(map(len, server)) / len(turns),
+            "deflate_bytes_per_turn": (sum(deflated_sizes(client)) + sum(deflated_sizes(server))) / len(turns),
+            "batched_client_bytes_per_turn": sum(map(len, batched)) / len(turns),
+            "largest_reply_bytes": len(largest_frame),
+            "largest_reply_deflate_bytes": deflated_sizes([largest_frame])[0],
+            "encode_reply": bench(lambda: codec.encode(largest), args.number, args.repeat),
+            "decode_message": bench(lambda: codec.decode(client_frame), args.number, args.repeat),
+        }
+        results["codecs"][name] = summary
+        print(
+            f"{name:>8}: {summary['bytes_per_turn']:7.1f} B/turn, "
+            f"{summary['deflate_bytes_per_turn']:7.1f} B/turn deflated, "
+            f"encode {summary['encode_reply']['best_us']:.2f} us, "
+            f"decode {summary['decode_message']['best_us']:.2f} us"
+        )
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,13 @@ class ChatApp {
         this.ws = null;
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 3;
+        this.reconnectTimer = null;
+        this.resumeToken = null;      // Lets a new socket pick up the same conversation
+        this.lastSeq = 0;             // Highest numbered server message received
         this.useHttpFallback = false;
+        this.httpSessionId = null;
+        this.streamResponses = true;  // Ask the server to stream long answers in chunks
+        this.streams = new Map();     // stream id -> message content element
 
         // Initialize
         this.setupEventListeners();
@@ -89,39 +95,43 @@ class ChatApp {
         console.log('Connecting to WebSocket:', wsUrl);
         
         try {
-            this.ws = new WebSocket(wsUrl);
+            // protocol.js offers the msgpack and JSON subprotocols; without it we speak plain JSON
+            const subprotocols = window.ChatProtocol ? ChatProtocol.subprotocols() : [];
+            this.ws = new WebSocket(wsUrl, subprotocols);
+            this.ws.binaryType = 'arraybuffer';
+            this.protocol = window.ChatProtocol ? new ChatProtocol(this.ws) : null;
 
             // WebSocket event handlers
             this.ws.onopen = () => {
-                console.log('WebSocket connection established');
+                console.log('WebSocket connection established', this.ws.protocol || 'json');
                 this.showLoading(false);
                 this.updateConnectionStatus('connected');
                 this.reconnectAttempts = 0;
                 this.useHttpFallback = false;
+                // Ask to resume the previous conversation, or to make this one resumable
+                this.sendWs({ type: 'resume', token: this.resumeToken || undefined, ack: this.lastSeq });
                 this.enableInterface();
             };
 
             this.ws.onclose = () => {
                 console.log('WebSocket connection closed');
+                // Streams cut off with the socket will not get their stream_end
+                this.streams.forEach((contentDiv, id) => this.endStream(id, true));
                 this.updateConnectionStatus('disconnected');
                 this.disableInterface();
                 this.handleReconnect();
             };
 
             this.ws.onerror = (error) => {
+                // A close event always follows, and it schedules the reconnect
                 console.error('WebSocket error:', error);
-                this.handleReconnect();
             };
 
             this.ws.onmessage = (event) => {
                 console.log('Received message:', event.data);
                 try {
-                    const data = JSON.parse(event.data);
-                    if (data.type === 'error') {
-                        this.showError(data.content);
-                    } else {
-                        this.addMessage('ai', data.content);
-                    }
+                    const messages = this.protocol ? this.protocol.decode(event.data) : [JSON.parse(event.data)];
+                    messages.forEach((data) => this.handleServerMessage(data));
                 } catch (error) {
                     console.error('Message parsing error:', error);
                     this.showError('Error processing message');
@@ -133,18 +143,76 @@ class ChatApp {
         }
     }
 
+    handleServerMessage(data) {
+        if (data.type === 'session') {
+            // Not numbered itself: its seq says where the outbox stands, and replays follow it
+            this.resumeToken = data.token;
+            if (!data.resumed) {
+                this.lastSeq = data.seq;
+            } else if (data.missed) {
+                this.showError('Some messages were lost while reconnecting');
+            }
+            return;
+        }
+        if (data.seq !== undefined) {
+            // Messages replayed after a resume may already have arrived
+            if (data.seq <= this.lastSeq) return;
+            this.lastSeq = data.seq;
+        }
+        switch (data.type) {
+            case 'ping':
+                // Server heartbeat: answer so the connection is not reaped
+                this.sendWs({ type: 'pong' });
+                break;
+            case 'error':
+                this.showError(data.content);
+                break;
+            case 'stream_start':
+                this.startStream(data.id);
+                break;
+            case 'stream_chunk':
+                this.appendStream(data.id, data.content);
+                break;
+            case 'stream_end':
+                this.endStream(data.id, data.cancelled);
+                break;
+            default:
+                this.addMessage('ai', data.content);
+        }
+    }
+
+    sendWs(message) {
+        if (this.protocol) {
+            this.protocol.send(message);
+        } else {
+            this.ws.send(JSON.stringify(message));
+        }
+    }
+
     async sendHttpRequest(message) {
         try {
             const host = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
                 ? `${window.location.protocol}//${window.location.hostname}:8000`  // Use port 8000 for local development
                 : window.location.origin;  // Use production origin otherwise
                 
+            const headers = {
+                'Accept': 'application/json'
+            };
+            // Reuse the server-issued session so the conversation keeps its context
+            if (this.httpSessionId) {
+                headers['X-Session-Id'] = this.httpSessionId;
+            }
+
             const response = await fetch(`${host}/api/chat?message=${encodeURIComponent(message)}`, {
                 method: 'GET',
-                headers: {
-                    'Accept': 'application/json'
-                }
+                headers: headers,
+                credentials: 'include'
             });
+
+            const sessionId = response.headers.get('X-Session-Id');
+            if (sessionId) {
+                this.httpSessionId = sessionId;
+            }
             
             if (!response.ok) {
                 throw new Error(`HTTP request failed with status ${response.status}`);
@@ -160,12 +228,15 @@ class ChatApp {
     }
 
     handleReconnect() {
+        if (this.reconnectTimer) return;  // One reconnect at a time
         if (this.reconnectAttempts < this.maxReconnectAttempts) {
             this.reconnectAttempts++;
-            const delay = Math.min(1000 * Math.pow(2, this.reconnectAttempts), 10000);
-            console.log(`Attempting to reconnect in ${delay}ms...`);
+            // Jitter keeps clients dropped together from reconnecting together
+            const delay = Math.min(1000 * Math.pow(2, this.reconnectAttempts), 10000) * (0.5 + Math.random() / 2);
+            console.log(`Attempting to reconnect in ${Math.round(delay)}ms...`);
             
-            setTimeout(() => {
+            this.reconnectTimer = setTimeout(() => {
+                this.reconnectTimer = null;
                 this.connectWebSocket();
             }, delay);
         } else {
@@ -206,12 +277,16 @@ class ChatApp {
         } else {
             // Send message through WebSocket
             try {
-                const data = JSON.stringify({
+                const data = {
                     type: 'message',
-                    content: message
-                });
+                    content: message,
+                    stream: this.streamResponses
+                };
+                if (this.resumeToken) {
+                    data.ack = this.lastSeq;
+                }
                 console.log('Sending message:', data);
-                this.ws.send(data);
+                this.sendWs(data);
             } catch (error) {
                 console.error('Send error:', error);
                 this.showError('Failed to send message');
@@ -220,8 +295,7 @@ class ChatApp {
         }
     }
 
-    addMessage(type, content) {
-        // Create message element
+    createMessageElement(type, content) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}-message`;
         
@@ -234,6 +308,11 @@ class ChatApp {
 
         // Scroll to bottom
         this.chatContainer.scrollTop = this.chatContainer.scrollHeight;
+        return contentDiv;
+    }
+
+    addMessage(type, content) {
+        this.createMessageElement(type, content);
 
         // Enable interface after AI response
         if (type === 'ai') {
@@ -241,6 +320,26 @@ class ChatApp {
         }
     }
 
+    startStream(id) {
+        this.streams.set(id, this.createMessageElement('ai', ''));
+    }
+
+    appendStream(id, chunk) {
+        const contentDiv = this.streams.get(id);
+        if (!contentDiv) return;
+        contentDiv.textContent += chunk;
+        this.chatContainer.scrollTop = this.chatContainer.scrollHeight;
+    }
+
+    endStream(id, cancelled) {
+        const contentDiv = this.streams.get(id);
+        this.streams.delete(id);
+        if (contentDiv && cancelled) {
+            contentDiv.parentElement.classList.add('cancelled');
+        }
+        this.enableInterface();
+    }
+
     showError(message) {
         console.error('Error:', message);
         const errorDiv = document.createElement('div');
@@ -0,0 +1,193 @@
+// Wire formats for /ws/chat. The client offers both subprotocols and the
+// server picks one; without a subprotocol the connection speaks plain JSON.
+(function (global) {
+    const MSGPACK_SUBPROTOCOL = 'conversify.v1.msgpack';
+    const JSON_SUBPROTOCOL = 'conversify.v1.json';
+
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    // Minimal msgpack: nil, booleans, numbers, strings, binary, arrays and maps,
+    // which covers every message the chat protocol sends.
+    function msgpackEncode(value) {
+        const bytes = [];
+        const pushUint = (n, size) => {
+            for (let shift = (size - 1) * 8; shift >= 0; shift -= 8) {
+                bytes.push(Math.floor(n / Math.pow(2, shift)) & 0xff);
+            }
+        };
+        const write = (v) => {
+            if (v === null || v === undefined) {
+                bytes.push(0xc0);
+            } else if (v === false || v === true) {
+                bytes.push(v ? 0xc3 : 0xc2);
+            } else if (typeof v === 'number') {
+                if (Number.isInteger(v) && v >= 0 && v < 0x100000000) {
+                    if (v < 0x80) bytes.push(v);
+                    else if (v < 0x100) { bytes.push(0xcc); pushUint(v, 1); }
+                    else if (v < 0x10000) { bytes.push(0xcd); pushUint(v, 2); }
+                    else { bytes.push(0xce); pushUint(v, 4); }
+                } else if (Number.isInteger(v) && v < 0 && v >= -0x80000000) {
+                    if (v >= -32) bytes.push(v & 0xff);
+                    else { bytes.push(0xd2); pushUint(v >>> 0, 4); }
+                } else {
+                    const view = new DataView(new ArrayBuffer(8));
+                    view.setFloat64(0, v);
+                    bytes.push(0xcb, ...new Uint8Array(view.buffer));
+                }
+            } else if (typeof v === 'string') {
+                const encoded = textEncoder.encode(v);
+                const n = encoded.length;
+                if (n < 32) bytes.push(0xa0 | n);
+                else if (n < 0x100) { bytes.push(0xd9); pushUint(n, 1); }
+                else if (n < 0x10000) { bytes.push(0xda); pushUint(n, 2); }
+                else { bytes.push(0xdb); pushUint(n, 4); }
+                for (let i = 0; i < n; i++) bytes.push(encoded[i]);
+            } else if (v instanceof Uint8Array) {
+                const n = v.length;
+                if (n < 0x100) { bytes.push(0xc4); pushUint(n, 1); }
+                else if (n < 0x10000) { bytes.push(0xc5); pushUint(n, 2); }
+                else { bytes.push(0xc6); pushUint(n, 4); }
+                for (let i = 0; i < n; i++) bytes.push(v[i]);
+            } else if (Array.isArray(v)) {
+                const n = v.length;
+                if (n < 16) bytes.push(0x90 | n);
+                else if (n < 0x10000) { bytes.push(0xdc); pushUint(n, 2); }
+                else { bytes.push(0xdd); pushUint(n, 4); }
+                v.forEach(write);
+            } else if (typeof v === 'object') {
+                const keys = Object.keys(v).filter((key) => v[key] !== undefined);
+                const n = keys.length;
+                if (n < 16) bytes.push(0x80 | n);
+                else if (n < 0x10000) { bytes.push(0xde); pushUint(n, 2); }
+                else { bytes.push(0xdf); pushUint(n, 4); }
+                keys.forEach((key) => { write(key); write(v[key]); });
+            } else {
+                throw new Error(`Cannot encode ${typeof v} as msgpack`);
+            }
+        };
+        write(value);
+        return new Uint8Array(bytes);
+    }
+
+    function msgpackDecode(buffer) {
+        const data = new Uint8Array(buffer);
+        const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+        let offset = 0;
+        const str = (n) => {
+            const value = textDecoder.decode(data.subarray(offset, offset + n));
+            offset += n;
+            return value;
+        };
+        const bin = (n) => {
+            const value = data.slice(offset, offset + n);
+            offset += n;
+            return value;
+        };
+        const array = (n) => {
+            const value = new Array(n);
+            for (let i = 0; i < n; i++) value[i] = read();
+            return value;
+        };
+        const map = (n) => {
+            const value = {};
+            for (let i = 0; i < n; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        };
+        const uint = (size) => {
+            let value = 0;
+            for (let i = 0; i < size; i++) value = value * 256 + data[offset + i];
+            offset += size;
+            return value;
+        };
+        const read = () => {
+            const type = data[offset++];
+            if (type < 0x80) return type;
+            if (type < 0x90) return map(type & 0x0f);
+            if (type < 0xa0) return array(type & 0x0f);
+            if (type < 0xc0) return str(type & 0x1f);
+            if (type >= 0xe0) return type - 0x100;
+            let value;
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(uint(1));
+                case 0xc5: return bin(uint(2));
+                case 0xc6: return bin(uint(4));
+                case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+                case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+                case 0xcc: return uint(1);
+                case 0xcd: return uint(2);
+                case 0xce: return uint(4);
+                case 0xcf: return uint(8);
+                case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+                case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+                case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+                case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+                case 0xd9: return str(uint(1));
+                case 0xda: return str(uint(2));
+                case 0xdb: return str(uint(4));
+                case 0xdc: return array(uint(2));
+                case 0xdd: return array(uint(4));
+                case 0xde: return map(uint(2));
+                case 0xdf: return map(uint(4));
+                default: throw new Error(`Unsupported msgpack type 0x${type.toString(16)}`);
+            }
+        };
+        return read();
+    }
+
+    class ChatProtocol {
+        // Both are offered; the server answers with the first one it supports
+        static subprotocols() {
+            return [MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL];
+        }
+
+        constructor(ws) {
+            this.ws = ws;
+            this.outbox = [];
+            this.flushScheduled = false;
+        }
+
+        get binary() {
+            return this.ws.protocol === MSGPACK_SUBPROTOCOL;
+        }
+
+        encode(payload) {
+            return this.binary ? msgpackEncode(payload) : JSON.stringify(payload);
+        }
+
+        // The messages in one server frame; a frame may hold a list of them
+        decode(data) {
+            const payload = typeof data === 'string' ? JSON.parse(data) : msgpackDecode(data);
+            return Array.isArray(payload) ? payload : [payload];
+        }
+
+        // Messages sent in the same task go out together in one frame
+        send(message) {
+            this.outbox.push(message);
+            if (!this.flushScheduled) {
+                this.flushScheduled = true;
+                queueMicrotask(() => this.flush());
+            }
+        }
+
+        flush() {
+            this.flushScheduled = false;
+            const messages = this.outbox.splice(0, 16);
+            if (messages.length) {
+                this.ws.send(this.encode(messages.length === 1 ? messages[0] : messages));
+            }
+            if (this.outbox.length) {
+                this.flush();
+            }
+        }
+    }
+
+    global.ChatProtocol = ChatProtocol;
+    ChatProtocol.msgpack = { encode: msgpackEncode, decode: msgpackDecode };
+})(window);
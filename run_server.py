@@ -18,6 +18,9 @@ def main():
     # Ensure we're in the correct directory
     project_root = Path(__file__).parent
     os.chdir(project_root)
+
+    # Keep conversations across the restarts triggered by reload=True
+    os.environ.setdefault("CONVERSIFY_CONVERSATION_LOG_DIR", str(project_root / ".conversify" / "log"))
     
     # Open the web interface after a short delay
     def open_browser():
@@ -33,7 +36,9 @@ def main():
         host="0.0.0.0",
         port=8000,
         reload=True,
-        reload_dirs=["backend", "frontend"]
+        reload_dirs=["backend", "frontend"],
+        # Frontend files are cached in memory at startup, so edits to them need a reload too
+        reload_includes=["*.py", "*.html", "*.css", "*.js"]
     )
 
 if __name__ == "__main__":
@@ -3,7 +3,8 @@ from setuptools import setup, find_packages
 setup(
     name="conversify-ai",
     version="0.1.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
+    package_data={"backend.app": ["data/*.json", "data/knowledge/*"]},
     install_requires=[
         "fastapi==0.104.1",
         "uvicorn[standard]==0.24.0",
@@ -12,4 +13,12 @@ setup(
         "jinja2==3.1.2",
         "python-dotenv==1.0.0",
     ],
+    entry_points={
+        "console_scripts": ["conversify-server=backend.app.server:main"],
+    },
+    extras_require={
+        "classifier": ["numpy>=1.21"],
+        "brotli": ["brotli>=1.0"],
+        "msgpack": ["msgpack>=1.0"],
+    },
 )